@@ -1,6 +1,8 @@
 from rest_framework import serializers
+from tsosi.data.currencies.conversion import transfer_amounts
 from tsosi.models import (
     Analytic,
+    AnalyticRollup,
     Currency,
     DataLoadSource,
     Entity,
@@ -117,18 +119,45 @@ class BaseTransferSerializer(serializers.ModelSerializer):
     """
     Base serializer for transfers. It overloads amount-related
     properties to return null if the amount should be hidden.
+
+    The amount converted in the currency given by the `currency` query
+    parameter is returned as `amount_converted`.
+    The amounts in every currency (`amounts_clc`) are returned when they
+    are stored and no `currency` is requested, or when the `amounts_clc`
+    query parameter is true.
     """
 
     amount = serializers.SerializerMethodField()
     amounts_clc = serializers.SerializerMethodField()
+    amount_converted = serializers.SerializerMethodField()
     currency = serializers.SerializerMethodField()
     raw_data = serializers.SerializerMethodField()
 
+    def query_param(self, name: str) -> str | None:
+        request = self.context.get("request")
+        return request.query_params.get(name) if request else None
+
     def get_amount(self, obj: Transfer):
         return None if obj.hide_amount else obj.amount
 
     def get_amounts_clc(self, obj: Transfer):
-        return None if obj.hide_amount else obj.amounts_clc
+        if obj.hide_amount:
+            return None
+        if (
+            self.query_param("amounts_clc")
+            in serializers.BooleanField.TRUE_VALUES
+        ):
+            return transfer_amounts(obj)
+        if self.query_param("currency") is not None:
+            return None
+        return obj.amounts_clc
+
+    def get_amount_converted(self, obj: Transfer):
+        currency = self.query_param("currency")
+        if obj.hide_amount or currency is None:
+            return None
+        amounts = transfer_amounts(obj)
+        return amounts.get(currency) if amounts else None
 
     def get_currency(self, obj: Transfer):
         return None if obj.hide_amount else obj.currency_id  # type:ignore
@@ -161,6 +190,7 @@ class TransferSerializer(BaseTransferSerializer):
             "date_clc",
             "description",
             "amounts_clc",
+            "amount_converted",
         ]
 
 
@@ -192,6 +222,7 @@ class TransferDetailsSerializer(BaseTransferSerializer):
             "date_start",
             "date_end",
             "amounts_clc",
+            "amount_converted",
             "raw_data",
             "source_ids",
         ]
@@ -207,3 +238,9 @@ class AnalyticSerializer(serializers.ModelSerializer):
     class Meta:
         model = Analytic
         fields = "__all__"
+
+
+class AnalyticRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AnalyticRollup
+        fields = "__all__"
@@ -8,9 +8,11 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import BasePermission
+from rest_framework.permissions import BasePermission, IsAdminUser
 from rest_framework.request import Request
+from rest_framework.response import Response
 from tsosi.api.serializers import (
+    AnalyticRollupSerializer,
     AnalyticSerializer,
     CurrencySerializer,
     EntityDetailsSerializer,
@@ -19,8 +21,16 @@ from tsosi.api.serializers import (
     TransferSerializer,
 )
 from tsosi.app_settings import app_settings
+from tsosi.data.api_metrics import METRICS_RETENTION_SECONDS, metrics_summary
+from tsosi.data.currencies.conversion import shared_rate_table
 from tsosi.data.pid_registry.tsosi import REGISTRY_TSOSI
-from tsosi.models import Analytic, Currency, Entity, Transfer
+from tsosi.models import (
+    Analytic,
+    AnalyticRollup,
+    Currency,
+    Entity,
+    Transfer,
+)
 from tsosi.models.static_data import PID_REGEX_OPTIONS
 from tsosi.models.utils import UUID4_REGEX
 
@@ -170,6 +180,17 @@ class TransferViewSet(AllActionViewSet, ReadOnlyViewSet):
     ordering = ["date_clc"]
     ordering_fields = ["date_clc"]
 
+    def initial(self, request: Request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        currency = request.query_params.get("currency")
+        if (
+            currency is not None
+            and currency not in shared_rate_table().currencies
+        ):
+            raise ValidationError(
+                detail=f"Query parameter value for `currency` is not accepted: {currency}"
+            )
+
     def retrieve(self, request, *args, **kwargs):
         self.serializer_class = TransferDetailsSerializer
         return super().retrieve(request, *args, **kwargs)
@@ -187,3 +208,38 @@ class AnalyticViewSet(ReadOnlyViewSet):
     serializer_class = AnalyticSerializer
     filter_backends = [filters.DjangoFilterBackend, OrderingFilter]
     filterset_fields = ["recipient_id", "country", "year"]
+
+    @action(
+        detail=False,
+        methods=["get"],
+        queryset=AnalyticRollup.objects.all(),
+        serializer_class=AnalyticRollupSerializer,
+        filterset_fields=["recipient_id", "year", "dimension", "key"],
+    )
+    def rollups(self, request, *args, **kwargs):
+        """
+        Pre-computed aggregates per recipient, year and additional
+        dimension: emitter, agent, month or emitter type.
+        """
+        return self.list(request, *args, **kwargs)
+
+
+class ApiMetricsViewSet(viewsets.ViewSet):
+    """
+    Summary of the usage of the rate limiters and of the external APIs over
+    the last hours, 24 by default. Restricted to admin users.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def list(self, request: Request, *args, **kwargs):
+        max_hours = METRICS_RETENTION_SECONDS // 3600
+        try:
+            hours = int(request.query_params.get("hours", 24))
+        except ValueError:
+            raise ValidationError("The hours parameter must be an integer.")
+        if not 1 <= hours <= max_hours:
+            raise ValidationError(
+                f"The hours parameter must be between 1 and {max_hours}."
+            )
+        return Response(metrics_summary(hours))
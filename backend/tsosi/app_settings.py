@@ -113,6 +113,24 @@ class AppSettings:
         """The number of days before refreshing existing identifier records."""
         return self._setting("IDENTIFIER_REFRESH_DAYS", 1)
 
+    @property
+    def IDENTIFIER_VERSION_STORAGE(self) -> str:
+        """
+        The storage mode of identifier records. `full` stores the raw
+        records, `compact` only stores the fields of the records that we use.
+        The existing versions are compacted with the
+        `compact_identifier_versions` command.
+        """
+        return self._setting("IDENTIFIER_VERSION_STORAGE", "full")
+
+    @property
+    def AFFILIATION_MATCH_CACHE_DAYS(self) -> int:
+        """
+        The number of days an affiliation matching result is cached before
+        being matched again.
+        """
+        return self._setting("AFFILIATION_MATCH_CACHE_DAYS", 30)
+
     @property
     def WIKI_FETCH_RETRY(self) -> int:
         """
@@ -131,6 +149,49 @@ class AppSettings:
         """The number of days before refreshing existing wiki-related data."""
         return self._setting("WIKI_REFRESH_DAYS", 7)
 
+    @property
+    def WIKIDATA_FETCH_BACKEND(self) -> str:
+        """
+        The API used to fetch the Wikidata records. `sparql` queries the
+        SPARQL query service, `wbgetentities` the Wikidata action API.
+        """
+        return self._setting("WIKIDATA_FETCH_BACKEND", "sparql")
+
+    @property
+    def WIKIPEDIA_EXTRACT_BACKEND(self) -> str:
+        """
+        The API used to fetch the Wikipedia extracts. `summary` fetches
+        the page summaries one by one with the REST API, with conditional
+        requests. `query` fetches the intro extracts by batches with the
+        MediaWiki action API and reduces them to their first paragraph,
+        which can differ slightly from the REST API summary.
+        """
+        return self._setting("WIKIPEDIA_EXTRACT_BACKEND", "summary")
+
+    @property
+    def CURRENCY_FETCH_CONCURRENCY(self) -> int:
+        """The maximum number of simultaneous requests to the currency API."""
+        return self._setting("CURRENCY_FETCH_CONCURRENCY", 4)
+
+    @property
+    def CURRENCY_RATES_CACHE_DIR(self) -> str | None:
+        """
+        The directory of the on-disk cache of the currency API responses.
+        The cache is disabled when set to `None`.
+        """
+        return self._setting(
+            "CURRENCY_RATES_CACHE_DIR", "/tmp/tsosi/currency_rates"
+        )
+
+    @property
+    def TRANSFER_AMOUNTS_CLC(self) -> bool:
+        """
+        Whether to store the transfer amounts converted in every currency
+        (`amounts_clc`). Otherwise only the USD amount is stored and the
+        other amounts are converted on read.
+        """
+        return self._setting("TRANSFER_AMOUNTS_CLC", True)
+
     @property
     def API_WHITELIST_IPS(self) -> list[str]:
         """
@@ -0,0 +1,211 @@
+"""
+Usage metrics of the rate limiters and of the external APIs.
+
+The metrics are accumulated in memory by the recording functions and
+flushed to Redis, in hourly time buckets, at the end of every Celery task,
+see `TsosiTask`. Every time bucket is a Redis hash of counters:
+    - `tokens_consumed|<bucket>` and `tokens_denied|<bucket>`
+    - `requests|<host>` and `bytes|<host>`
+    - `status|<host>|<status>` the number of responses per HTTP status,
+      `error` for the connection errors and timeouts
+    - `latency|<host>|...` the histogram of the request latencies
+
+The histograms are stored as a count, a sum and cumulative counters per
+upper bound (`le_<bound>`), in milliseconds.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlparse
+
+import redis
+import redis.exceptions
+from tsosi.app_settings import app_settings
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY_PREFIX = "api_metrics"
+# Duration of a time bucket, in seconds
+METRICS_BUCKET_SECONDS = 3600
+# Number of seconds a time bucket is kept in Redis
+METRICS_RETENTION_SECONDS = 48 * 3600
+# Upper bounds, in milliseconds, of the histograms buckets
+HISTOGRAM_BOUNDS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+redis_client = redis.StrictRedis(
+    host=app_settings.REDIS_HOST,
+    port=app_settings.REDIS_PORT,
+    db=app_settings.REDIS_DB,
+)
+
+# Counters waiting to be flushed, by time bucket
+_pending: defaultdict[int, Counter] = defaultdict(Counter)
+_pending_lock = threading.Lock()
+
+
+def time_bucket(timestamp: float | None = None) -> int:
+    """
+    Return the start of the time bucket of the given timestamp.
+    """
+    timestamp = time.time() if timestamp is None else timestamp
+    return int(timestamp // METRICS_BUCKET_SECONDS * METRICS_BUCKET_SECONDS)
+
+
+def metrics_key(bucket: int) -> str:
+    return f"{METRICS_KEY_PREFIX}:{bucket}"
+
+
+def _increment(counters: dict[str, int]):
+    bucket = time_bucket()
+    with _pending_lock:
+        _pending[bucket].update(counters)
+
+
+def _histogram(name: str, value_ms: int) -> dict[str, int]:
+    """
+    Return the histogram counters of the given observation.
+    """
+    counters = {f"{name}|count": 1, f"{name}|sum": value_ms}
+    for bound in HISTOGRAM_BOUNDS_MS:
+        if value_ms <= bound:
+            counters[f"{name}|le_{bound}"] = 1
+    return counters
+
+
+def record_tokens(bucket_name: str, consumed: int, denied: int):
+    """
+    Record the tokens consumed from and denied by the given token bucket.
+    """
+    _increment(
+        {
+            f"tokens_consumed|{bucket_name}": consumed,
+            f"tokens_denied|{bucket_name}": denied,
+        }
+    )
+
+
+def record_request(
+    url: str, status: int | None, seconds: float, size: int | None = None
+):
+    """
+    Record an HTTP request.
+
+    :param url:     The request URL.
+    :param status:  The HTTP status of the response, `None` for a connection
+                    error or a timeout.
+    :param seconds: The latency of the request, until the response headers.
+    :param size:    The size of the response body, in bytes.
+    """
+    host = urlparse(url).netloc
+    counters = {
+        f"requests|{host}": 1,
+        f"status|{host}|{'error' if status is None else status}": 1,
+        f"bytes|{host}": size or 0,
+        **_histogram(f"latency|{host}", round(seconds * 1000)),
+    }
+    _increment(counters)
+
+
+def flush():
+    """
+    Write the pending metrics to their Redis time buckets.
+    The metrics are lost if Redis is not reachable.
+    """
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for bucket, counters in pending.items():
+            key = metrics_key(bucket)
+            for field, value in counters.items():
+                if value:
+                    pipe.hincrby(key, field, value)
+            pipe.expire(key, METRICS_RETENTION_SECONDS)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Could not flush the API metrics: {e}")
+
+
+def load_counters(hours: int = 24) -> Counter:
+    """
+    Return the sum of the counters of the time buckets of the last hours.
+    """
+    current = time_bucket()
+    keys = [
+        metrics_key(current - i * METRICS_BUCKET_SECONDS) for i in range(hours)
+    ]
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+    counters = Counter()
+    for values in pipe.execute():
+        counters.update({k.decode("utf-8"): int(v) for k, v in values.items()})
+    return counters
+
+
+def histogram_summary(counters: Counter, name: str) -> dict | None:
+    """
+    Summarize the histogram of the given name: its count, mean and
+    estimated percentiles, in milliseconds.
+    The percentiles are the upper bounds of the histogram bucket they fall
+    in, `None` beyond the last bound.
+    """
+    count = counters.get(f"{name}|count", 0)
+    if count == 0:
+        return None
+    summary = {
+        "count": count,
+        "mean_ms": round(counters.get(f"{name}|sum", 0) / count),
+        "buckets": {
+            f"le_{b}": counters.get(f"{name}|le_{b}", 0)
+            for b in HISTOGRAM_BOUNDS_MS
+        },
+    }
+    for percentile in [50, 95, 99]:
+        summary[f"p{percentile}_ms"] = next(
+            (
+                b
+                for b in HISTOGRAM_BOUNDS_MS
+                if counters.get(f"{name}|le_{b}", 0) >= count * percentile / 100
+            ),
+            None,
+        )
+    return summary
+
+
+def summarize(counters: Counter) -> dict:
+    """
+    Summarize the given counters, see `load_counters`, by token bucket and
+    by host.
+    """
+    token_buckets = defaultdict(dict)
+    hosts = defaultdict(lambda: {"statuses": {}})
+    for field, value in counters.items():
+        kind, name, *rest = field.split("|")
+        if kind in ["tokens_consumed", "tokens_denied"]:
+            token_buckets[name][kind.removeprefix("tokens_")] = value
+        elif kind in ["requests", "bytes"]:
+            hosts[name][kind] = value
+        elif kind == "status":
+            hosts[name]["statuses"][rest[0]] = value
+        elif kind == "latency":
+            hosts[name]["latency"] = histogram_summary(
+                counters, f"{kind}|{name}"
+            )
+    return {
+        "token_buckets": {k: token_buckets[k] for k in sorted(token_buckets)},
+        "hosts": {k: hosts[k] for k in sorted(hosts)},
+    }
+
+
+def metrics_summary(hours: int = 24) -> dict:
+    """
+    Return the summary of the metrics of the last hours.
+    """
+    flush()
+    return {"hours": hours, **summarize(load_counters(hours))}
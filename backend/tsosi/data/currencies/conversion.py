@@ -0,0 +1,375 @@
+"""
+Vectorized conversion of amounts between currencies, based on the rates
+against USD stored in `CurrencyRate`.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from tsosi.models import CurrencyRate, Transfer, Watermark
+from tsosi.models.date import (
+    DATE_PRECISION_DAY,
+    DATE_PRECISION_MONTH,
+    DATE_PRECISION_YEAR,
+)
+
+logger = logging.getLogger(__name__)
+
+# Version of the currency rates, bumped whenever the rates change.
+RATES_VERSION_WATERMARK = "currency_rates_version"
+# Minimum delay between 2 checks of the rates version by a process.
+RATE_TABLE_CHECK_SECONDS = 60
+
+PRECISION_CODES = {
+    DATE_PRECISION_DAY: 0,
+    DATE_PRECISION_MONTH: 1,
+    DATE_PRECISION_YEAR: 2,
+}
+# Offset used to encode a (precision, date) pair in a single int64 key.
+KEY_PRECISION_OFFSET = np.int64(1 << 32)
+KEY_DATE_OFFSET = np.int64(1 << 31)
+
+
+def rate_keys(codes: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """
+    Encode the (precision code, date) pairs as sortable int64 keys.
+
+    :param codes:   The precision codes, see `PRECISION_CODES`.
+    :param days:    The dates as `datetime64[D]` values.
+    """
+    return codes.astype(np.int64) * KEY_PRECISION_OFFSET + (
+        days.astype(np.int64) + KEY_DATE_OFFSET
+    )
+
+
+@dataclass
+class RateTable:
+    """
+    In-memory table of currency rates against USD.
+
+    The rates are stored as a single matrix with 1 row per (precision, date)
+    key and 1 column per currency, missing rates being NaN.
+    The rows are sorted by key so that the rate of any date is found with
+    a binary search (`np.searchsorted`).
+    """
+
+    currencies: list[str]
+    keys: np.ndarray
+    values: np.ndarray
+    # Date of the last daily rate, later dates are "future" dates.
+    last_date: np.datetime64 | None
+    # Key of the last monthly average, used for "future" dates.
+    last_month_key: np.int64 | None
+
+    @classmethod
+    def from_df(
+        cls,
+        rates: pd.DataFrame,
+        currencies: Iterable[str] | None = None,
+        last_date=None,
+    ) -> "RateTable":
+        """
+        Build the rate table from the given rates.
+
+        :param rates:       The DataFrame of rates with the columns
+                            `currency_id`, `precision`, `date` and `value`.
+        :param currencies:  The currencies of the table, defaults to the
+                            currencies of the given rates.
+        :param last_date:   The date of the last daily rate, defaults to the
+                            last daily rate of the given rates.
+        """
+        if currencies is None:
+            currencies = rates["currency_id"].drop_duplicates().sort_values()
+        currencies = list(currencies)
+        codes = rates["precision"].map(PRECISION_CODES).to_numpy()
+        days = pd.to_datetime(rates["date"]).to_numpy().astype("datetime64[D]")
+        keys = rate_keys(codes, days)
+
+        unique_keys, rows = np.unique(keys, return_inverse=True)
+        columns = pd.Index(currencies).get_indexer(rates["currency_id"])
+        values = np.full((len(unique_keys), len(currencies)), np.nan)
+        known = columns >= 0
+        values[rows[known], columns[known]] = rates["value"].to_numpy()[known]
+
+        if last_date is None:
+            day_rates = days[codes == PRECISION_CODES[DATE_PRECISION_DAY]]
+            last_date = day_rates.max() if len(day_rates) > 0 else None
+        elif not isinstance(last_date, np.datetime64):
+            last_date = np.datetime64(last_date, "D")
+        month_keys = unique_keys[
+            unique_keys // KEY_PRECISION_OFFSET
+            == PRECISION_CODES[DATE_PRECISION_MONTH]
+        ]
+        last_month_key = month_keys[-1] if len(month_keys) > 0 else None
+
+        return cls(
+            currencies=currencies,
+            keys=unique_keys,
+            values=values,
+            last_date=last_date,
+            last_month_key=last_month_key,
+        )
+
+    def row_indices(
+        self, dates: pd.Series, precisions: pd.Series
+    ) -> np.ndarray:
+        """
+        Return the index of the rate row to use for each of the given dates,
+        -1 when there's no applicable rate.
+
+        The rate of a date is the daily rate or the monthly or yearly average
+        according to its precision. Dates after the last daily rate use the
+        last monthly average.
+
+        :param dates:       The datetime values.
+        :param precisions:  The date precisions.
+        """
+        dates = pd.to_datetime(dates).to_numpy()
+        days = dates.astype("datetime64[D]")
+        precisions = precisions.to_numpy()
+        rate_days = np.where(
+            precisions == DATE_PRECISION_YEAR,
+            dates.astype("datetime64[Y]").astype("datetime64[D]"),
+            np.where(
+                precisions == DATE_PRECISION_MONTH,
+                dates.astype("datetime64[M]").astype("datetime64[D]"),
+                days,
+            ),
+        )
+        codes = pd.Series(precisions).map(PRECISION_CODES).to_numpy()
+        valid = ~np.isnan(codes) & ~np.isnat(days)
+        keys = rate_keys(np.nan_to_num(codes, nan=-1), rate_days)
+
+        if self.last_date is not None:
+            is_future = valid & (days > self.last_date)
+            if self.last_month_key is None:
+                valid &= ~is_future
+            else:
+                keys[is_future] = self.last_month_key
+
+        indices = np.searchsorted(self.keys, keys)
+        indices[indices >= len(self.keys)] = 0
+        found = valid & (len(self.keys) > 0)
+        if len(self.keys) > 0:
+            found &= self.keys[indices] == keys
+        return np.where(found, indices, -1)
+
+    def row_index(self, date_value: date, precision: str) -> int:
+        """
+        Scalar version of `row_indices`, for a single date.
+
+        :param date_value:  The date.
+        :param precision:   The date precision.
+        """
+        code = PRECISION_CODES.get(precision)
+        if code is None or len(self.keys) == 0:
+            return -1
+        rate_date = date_value
+        if precision == DATE_PRECISION_YEAR:
+            rate_date = date(date_value.year, 1, 1)
+        elif precision == DATE_PRECISION_MONTH:
+            rate_date = date(date_value.year, date_value.month, 1)
+        key = rate_keys(
+            np.array([code]), np.array([rate_date], dtype="datetime64[D]")
+        )[0]
+        if self.last_date is not None and (
+            np.datetime64(date_value, "D") > self.last_date
+        ):
+            if self.last_month_key is None:
+                return -1
+            key = self.last_month_key
+        index = int(np.searchsorted(self.keys, key))
+        if index >= len(self.keys) or self.keys[index] != key:
+            return -1
+        return index
+
+    def usd_amounts(
+        self,
+        amounts: pd.Series,
+        currency_ids: pd.Series,
+        dates: pd.Series,
+        precisions: pd.Series,
+    ) -> pd.Series:
+        """
+        Convert the given amounts to USD with the rate of their currency.
+        The amounts without applicable rate at their date are dropped.
+
+        :param amounts:         The amounts to convert.
+        :param currency_ids:    The currency of every amount.
+        :param dates:           The date of every amount.
+        :param precisions:      The precision of every date.
+        :returns:               The unrounded USD amounts, indexed like
+                                the input.
+        """
+        rows = self.row_indices(dates, precisions)
+        found = rows >= 0
+        rates = self.values[rows[found]]
+
+        columns = pd.Index(self.currencies).get_indexer(currency_ids[found])
+        source_rates = np.where(
+            columns >= 0,
+            rates[np.arange(len(rates)), columns],
+            np.nan,
+        )
+        return pd.Series(
+            amounts.to_numpy(dtype=np.float64)[found] / source_rates,
+            index=amounts.index[found],
+        )
+
+    def convert_usd(
+        self, amounts_usd: pd.Series, dates: pd.Series, precisions: pd.Series
+    ) -> pd.DataFrame:
+        """
+        Convert the given USD amounts into every currency of the table,
+        the results are rounded to the unit.
+        The amounts without applicable rate at their date are dropped.
+
+        :param amounts_usd:     The USD amounts to convert.
+        :param dates:           The date of every amount.
+        :param precisions:      The precision of every date.
+        :returns:               The converted amounts with 1 `Int64` column
+                                per currency, indexed like the input.
+        """
+        rows = self.row_indices(dates, precisions)
+        found = rows >= 0
+        converted = np.round(
+            amounts_usd.to_numpy(dtype=np.float64)[found][:, np.newaxis]
+            * self.values[rows[found]]
+        )
+        return pd.DataFrame(
+            converted, index=amounts_usd.index[found], columns=self.currencies
+        ).astype("Int64")
+
+    def convert(
+        self,
+        amounts: pd.Series,
+        currency_ids: pd.Series,
+        dates: pd.Series,
+        precisions: pd.Series,
+    ) -> pd.DataFrame:
+        """
+        Convert the given amounts into every currency of the table.
+
+        The amount is first converted to USD with the rate of its currency
+        then to every currency, the result is rounded to the unit.
+        The amounts without applicable rate at their date are dropped.
+
+        :param amounts:         The amounts to convert.
+        :param currency_ids:    The currency of every amount.
+        :param dates:           The date of every amount.
+        :param precisions:      The precision of every date.
+        :returns:               The converted amounts with 1 `Int64` column
+                                per currency, indexed like the input.
+        """
+        amounts_usd = self.usd_amounts(amounts, currency_ids, dates, precisions)
+        return self.convert_usd(
+            amounts_usd,
+            dates.loc[amounts_usd.index],
+            precisions.loc[amounts_usd.index],
+        )
+
+    def amounts(self, amount_usd: float, date_clc: dict) -> dict | None:
+        """
+        Convert a single USD amount into every currency of the table, with
+        the same results as `convert_usd`.
+
+        :param amount_usd:  The USD amount.
+        :param date_clc:    The JSON date of the amount, see `models.date.Date`.
+        :returns:           The amounts per currency, `None` when there's no
+                            applicable rate.
+        """
+        index = self.row_index(
+            date.fromisoformat(date_clc["value"]), date_clc["precision"]
+        )
+        if index < 0:
+            return None
+        converted = np.round(np.float64(amount_usd) * self.values[index])
+        return {
+            c: None if np.isnan(v) else int(v)
+            for c, v in zip(self.currencies, converted)
+        }
+
+
+def load_rate_table() -> RateTable:
+    """
+    Build the rate table from all the rates in the database.
+    """
+    columns = ["currency_id", "precision", "date", "value"]
+    rates = pd.DataFrame.from_records(
+        CurrencyRate.objects.values(*columns), columns=columns
+    )
+    return RateTable.from_df(rates)
+
+
+_shared_rate_table: RateTable | None = None
+_shared_rate_table_version: int | None = None
+_shared_rate_table_checked: float = 0
+_shared_rate_table_lock = threading.Lock()
+
+
+def shared_rate_table(max_age: float | None = None) -> RateTable:
+    """
+    Return the rate table shared by the current process.
+
+    The table is loaded once and reloaded when the rates version is bumped,
+    see `bump_rates_version`. The version is checked at most every
+    `max_age` seconds, hence the table can be stale for that long.
+
+    :param max_age: The maximum number of seconds since the last version
+                    check, `RATE_TABLE_CHECK_SECONDS` by default.
+                    Use 0 to always check the version, ex: when the
+                    converted amounts are stored.
+    """
+    if max_age is None:
+        max_age = RATE_TABLE_CHECK_SECONDS
+    global _shared_rate_table, _shared_rate_table_version
+    global _shared_rate_table_checked
+    with _shared_rate_table_lock:
+        now = time.monotonic()
+        if (
+            _shared_rate_table is not None
+            and now - _shared_rate_table_checked < max_age
+        ):
+            return _shared_rate_table
+        version = rates_version()
+        if _shared_rate_table is None or version != _shared_rate_table_version:
+            logger.info(f"Loading the currency rate table, version {version}.")
+            _shared_rate_table = load_rate_table()
+            _shared_rate_table_version = version
+        _shared_rate_table_checked = now
+        return _shared_rate_table
+
+
+def rates_version() -> int | None:
+    """
+    Return the current version of the currency rates, see
+    `bump_rates_version`.
+    """
+    return Watermark.get_value(RATES_VERSION_WATERMARK)
+
+
+def bump_rates_version():
+    """
+    Signal that the currency rates changed, so that the processes reload
+    their shared rate table.
+    """
+    version = rates_version() or 0
+    Watermark.set_value(RATES_VERSION_WATERMARK, version + 1)
+
+
+def transfer_amounts(transfer: Transfer) -> dict | None:
+    """
+    Return the amounts of the given transfer in every currency: the stored
+    `amounts_clc` or the amounts converted on read from its USD amount.
+    """
+    if transfer.amounts_clc is not None:
+        return transfer.amounts_clc
+    if transfer.amount_usd is None or transfer.date_clc is None:
+        return None
+    return shared_rate_table().amounts(transfer.amount_usd, transfer.date_clc)
@@ -3,30 +3,41 @@ Contains methods to fetch the currency rate data and related work.
 The data is taken from https://data.bis.org
 """
 
+import hashlib
 import json
 import logging
+import operator
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
+from functools import reduce
+from io import StringIO
 from pathlib import Path
 from typing import Iterable
-from urllib.error import HTTPError
 from urllib.parse import urlencode
 
 import pandas as pd
+import requests
 from django.db import transaction
+from django.db.models import DateField, F, Max, Min, Q
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast
+from django.utils import timezone
 from requests.exceptions import RequestException
+from tsosi.app_settings import app_settings
+from tsosi.data.currencies.conversion import RateTable, bump_rates_version
 from tsosi.data.db_utils import (
+    LOOKUP_CHUNK_SIZE,
     DateExtremas,
     bulk_create_from_df,
     bulk_update_from_df,
     date_extremas_from_queryset,
 )
 from tsosi.data.task_result import TaskResult
-from tsosi.models import Currency, CurrencyRate, Transfer
+from tsosi.models import Currency, CurrencyRate, Transfer, Watermark
 from tsosi.models.date import (
     DATE_PRECISION_DAY,
     DATE_PRECISION_MONTH,
     DATE_PRECISION_YEAR,
-    Date,
 )
 
 logger = logging.getLogger(__name__)
@@ -34,6 +45,9 @@ logger = logging.getLogger(__name__)
 CURRENCY_API_URL = (
     "https://stats.bis.org/api/v2/data/dataflow/BIS/WS_XRU/1.0/D.."
 )
+CURRENCY_API_TIMEOUT = 60
+# Number of days after which the API response of a period can be cached.
+CURRENCY_RATES_CACHE_MIN_AGE = 7
 # Available currencies through bis data portal API
 SUPPORTED_CURRENCIES = frozenset(
     [
@@ -148,6 +162,25 @@ def insert_currencies(currencies: Iterable[str], date_update: datetime):
     Currency.objects.bulk_create(instances)
 
 
+def currency_rates_cache_path(
+    currencies: Iterable[str], date_start: date, date_end: date
+) -> Path | None:
+    """
+    Return the path of the cached API response for the given currencies and
+    period, or `None` if the response must not be cached.
+
+    Only the periods ending a while ago are cached, the remote data of the
+    last days may not be complete yet.
+    """
+    cache_dir = app_settings.CURRENCY_RATES_CACHE_DIR
+    if cache_dir is None or date_end > date.today() - timedelta(
+        days=CURRENCY_RATES_CACHE_MIN_AGE
+    ):
+        return None
+    key = hashlib.sha256("+".join(sorted(currencies)).encode()).hexdigest()
+    return Path(cache_dir) / f"{date_start}_{date_end}_{key[:16]}.csv"
+
+
 def fetch_currency_rates(
     currencies: Iterable[str], date_start: date, date_end: date
 ):
@@ -157,15 +190,24 @@ def fetch_currency_rates(
     The obtained `rate` must be used as:
     ``{amount} * USD = {rate} * {amount} XYZ``
 
+    The raw CSV responses are cached on disk, see
+    `currency_rates_cache_path`.
+
     :param currencies:  The currency ISO codes.
     :param start_date:  The start date of the period.
     :param end_date:    The end date of the period.
     :return:            The dataframe result of the API request. The columns
                         of interest are TIME_PERIOD, OBS_VALUE, CURRENCY.
     """
+    currencies = list(currencies)
     for c in currencies:
         check_currency(c, error=True)
 
+    cache_path = currency_rates_cache_path(currencies, date_start, date_end)
+    if cache_path is not None and cache_path.exists():
+        logger.debug(f"Using cached currency rates {cache_path}.")
+        return pd.read_csv(cache_path)
+
     url = f"{CURRENCY_API_URL}{"+".join(currencies)}"
     query_params = {
         "startPeriod": date_start.strftime("%Y-%m-%d"),
@@ -174,12 +216,18 @@ def fetch_currency_rates(
     }
     url = f"{url}?{urlencode(query_params)}"
     try:
-        data = pd.read_csv(url)
-    except (RequestException, HTTPError) as e:
-        data = pd.DataFrame()
+        response = requests.get(url, timeout=CURRENCY_API_TIMEOUT)
+        response.raise_for_status()
+        data = pd.read_csv(StringIO(response.text))
+    except (RequestException, ValueError) as e:
         logger.error(
             f"Error while fetching currency rates for URL {url}.", exc_info=e
         )
+        return pd.DataFrame()
+
+    if cache_path is not None and not data.empty:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(response.text)
     return data
 
 
@@ -196,7 +244,7 @@ def process_raw_rates(
     :param date_start:  The start date of the queried interval.
     :param date_end:    The end date of the queried interval.
     :return:            The processed rates DataFrame, with columns
-                        `currency`, `date`, `rate`
+                        `currency_id`, `date`, `precision`, `value`
     """
     date_range = pd.date_range(
         start=date_start,
@@ -230,31 +278,26 @@ def process_raw_rates(
         "OBS_VALUE": "value",
     }
     df_res = df_res[cols_of_interest.keys()].rename(columns=cols_of_interest)
-    df_res["date"] = df_res["date"].apply(
-        lambda x: Date(value=x, precision=DATE_PRECISION_DAY).serialize()
-    )
+    df_res["date"] = df_res["date"].dt.date
+    df_res["precision"] = DATE_PRECISION_DAY
     return df_res
 
 
-def update_currency_rate(
-    currency: str,
-    target_interval: DateExtremas,
-    currency_interval: DateExtremas,
-):
+def missing_rate_intervals(
+    target_interval: DateExtremas, currency_interval: DateExtremas
+) -> list[DateExtremas]:
     """
-    Update the rates of a single currency to match the given target interval.
+    Return the intervals for which the rate data of a currency is missing
+    (ie. "target_interval \\ currency_interval" in set theory).
+    We assume the rate-time intervals present in DB are continuous.
+
+    The trailing interval is skipped when it's less than 8 days and recent.
+    The remote data doesn't update everyday and the API returns 404 when
+    there's no data for the queried interval.
 
-    :param currency:            The currency ISO code.
     :param target_interval:     The target interval to match.
     :param currency_interval:   The current interval of already fetched data.
     """
-    if target_interval.min is None or target_interval.max is None:
-        logger.error("Null `target_interval` passed, aborting update.")
-        return
-
-    # Get the intervals for which the rate data is missing (ie.
-    # "target_interval \ currency_interval" in set theory).
-    # We assume the rate-time intervals present in DB are continuous.
     intervals: list[DateExtremas] = []
     min_date: date | None = currency_interval.min
     max_date: date | None = (
@@ -272,81 +315,201 @@ def update_currency_rate(
     elif max_date < target_interval.max:
         intervals.append(DateExtremas(min=max_date, max=target_interval.max))
 
-    # Fetch data for each interval
+    result = []
     for interval in intervals:
-        # Prevent fetching if the interval is less than 8 days
-        # The remote data doesn't update everyday and the API returns 404 when
-        # there's no data for the queried interval.
         if ((interval.max - interval.min).days < 8) and interval.max > (
             date.today() - timedelta(days=3)
         ):
             logger.info(
-                f"Aborting subsequent currency fetching for `{currency}` "
-                f"with too small interval {interval.min} - {interval.max}"
+                f"Skipping too small currency interval "
+                f"{interval.min} - {interval.max}"
             )
-            # Return instead of continuing here, if the condition is true
-            # it should be the last interval so it's the same.
-            # If not, there's an issue and we should abort.
+            # It should be the last interval. If not, there's an issue and
+            # we should abort.
             break
+        result.append(interval)
+    return result
 
-        logger.info(
-            f"Updating currency rates for `{currency}` from "
-            f"{interval.min} to {interval.max}"
-        )
-        current_start = interval.min
-        while current_start < interval.max:
-            current_end = min(current_start + timedelta(days=365), interval.max)
-            raw_rates = fetch_currency_rates(
-                [currency], current_start, current_end
-            )
-            # Enforce having a continuous interval of rates.
-            # If one interval query fails, don't query the subsequent ones.
-            if raw_rates.empty:
-                return
-            processed_rates = process_raw_rates(
-                raw_rates, current_start, current_end
+
+def update_currencies_rates(
+    currency_intervals: dict[str, list[DateExtremas]],
+):
+    """
+    Fetch and store the missing rates of the given currencies.
+
+    The currencies sharing the same missing intervals are fetched together
+    and every interval is fetched by windows of 1 year. The windows are
+    fetched concurrently, with at most `CURRENCY_FETCH_CONCURRENCY`
+    simultaneous requests.
+
+    :param currency_intervals:  The missing intervals per currency.
+    """
+    groups: dict[tuple, list[str]] = {}
+    for currency, intervals in currency_intervals.items():
+        if not intervals:
+            continue
+        key = tuple((i.min, i.max) for i in intervals)
+        groups.setdefault(key, []).append(currency)
+
+    # List the fetching windows of every group
+    windows: list[tuple[tuple, date, date]] = []
+    for key, currencies in groups.items():
+        for interval_min, interval_max in key:
+            logger.info(
+                f"Updating currency rates for `{"+".join(currencies)}` from "
+                f"{interval_min} to {interval_max}"
             )
-            bulk_create_from_df(
-                CurrencyRate, processed_rates, ["currency_id", "date", "value"]
+            current_start = interval_min
+            while current_start < interval_max:
+                current_end = min(
+                    current_start + timedelta(days=365), interval_max
+                )
+                windows.append((key, current_start, current_end))
+                current_start = current_end
+    if not windows:
+        return
+
+    with ThreadPoolExecutor(
+        max_workers=app_settings.CURRENCY_FETCH_CONCURRENCY
+    ) as executor:
+        results = list(
+            executor.map(
+                lambda w: fetch_currency_rates(groups[w[0]], w[1], w[2]),
+                windows,
             )
-            current_start = current_end
+        )
+
+    # Enforce having a continuous interval of rates for every currency.
+    # If one window lacks the data of a currency, its subsequent windows are
+    # discarded.
+    failed: dict[tuple, set[str]] = {key: set() for key in groups}
+    inserted = False
+    for (key, window_start, window_end), raw_rates in zip(windows, results):
+        if raw_rates.empty:
+            failed[key] |= set(groups[key])
+            continue
+        fetched = set(raw_rates.dropna(subset="OBS_VALUE")["CURRENCY"])
+        failed[key] |= set(groups[key]) - fetched
+        raw_rates = raw_rates[~raw_rates["CURRENCY"].isin(failed[key])]
+        if raw_rates.empty:
+            continue
+        processed_rates = process_raw_rates(raw_rates, window_start, window_end)
+        bulk_create_from_df(
+            CurrencyRate,
+            processed_rates,
+            ["currency_id", "date", "precision", "value"],
+        )
+        inserted = True
+    if inserted:
+        bump_rates_version()
+
+
+AVERAGE_RATES_WATERMARK = "currency_average_rates"
+
+
+def upsert_average_rates(averages: pd.DataFrame, existing: pd.DataFrame) -> int:
+    """
+    Write the given average rates in place of the existing ones: changed
+    rates are updated, new ones created and the existing rates absent from
+    the given ones are deleted.
+
+    :param averages:    The average rates with the columns `currency_id`,
+                        `precision`, `date` and `value`.
+    :param existing:    The existing average rates to replace, with the
+                        additional `id` column.
+    :returns:           The number of written or deleted rates.
+    """
+    keys = ["currency_id", "precision", "date"]
+    merged = averages.merge(
+        existing, on=keys, how="outer", suffixes=("", "_old")
+    )
+    to_delete = merged[merged["value"].isna()]
+    to_create = merged[merged["id"].isna()]
+    to_update = merged[
+        merged["id"].notna()
+        & merged["value"].notna()
+        & (merged["value"] != merged["value_old"])
+    ].copy()
+
+    if not to_delete.empty:
+        ids = to_delete["id"].astype(int).to_list()
+        CurrencyRate.objects.filter(id__in=ids).delete()
+    if not to_update.empty:
+        to_update["id"] = to_update["id"].astype(int)
+        bulk_update_from_df(CurrencyRate, to_update, ["id", "value"])
+    if not to_create.empty:
+        bulk_create_from_df(CurrencyRate, to_create, [*keys, "value"])
+    logger.info(
+        f"Average rates: {len(to_create)} created, {len(to_update)} updated "
+        f"and {len(to_delete)} deleted."
+    )
+    return len(to_create) + len(to_update) + len(to_delete)
 
 
 @transaction.atomic
-def compute_average_rates():
+def compute_average_rates(full: bool = False):
     """
     Compute average rates per month and year based on existing data.
+
+    Only the averages of the (currency, year) buckets that received new
+    daily rates since the last computation are computed, unless `full`
+    is passed or it's the first computation.
+
+    :param full:    Whether to recompute all the average rates.
     """
     logger.info("Computing average currency rates.")
-    columns = [
-        "currency_id",
-        "date",
-        "value",
-    ]
+    daily_rates = CurrencyRate.objects.filter(precision=DATE_PRECISION_DAY)
+    existing = CurrencyRate.objects.filter(
+        precision__in=[DATE_PRECISION_MONTH, DATE_PRECISION_YEAR]
+    )
+    max_rate_id = daily_rates.aggregate(max_id=Max("id"))["max_id"]
+    since_rate_id = (
+        None if full else Watermark.get_value(AVERAGE_RATES_WATERMARK)
+    )
+
+    if since_rate_id is not None:
+        buckets = (
+            daily_rates.filter(id__gt=since_rate_id)
+            .values_list("currency_id", "date__year")
+            .distinct()
+        )
+        if not buckets:
+            logger.info("No new currency rates to compute average for.")
+            return
+        condition = reduce(
+            operator.or_,
+            [
+                Q(
+                    currency_id=c,
+                    date__gte=date(year, 1, 1),
+                    date__lt=date(year + 1, 1, 1),
+                )
+                for c, year in buckets
+            ],
+        )
+        daily_rates = daily_rates.filter(condition)
+        existing = existing.filter(condition)
+
     data = pd.DataFrame.from_records(
-        CurrencyRate.objects.filter(date__precision=DATE_PRECISION_DAY).values(
-            *columns
+        daily_rates.order_by("currency_id", "date").values(
+            "currency_id", "date", "value"
         )
     )
     if data.empty:
         logger.info("No currency rates to compute average for.")
         return
 
-    date_extract = pd.json_normalize(data["date"]).add_prefix("date_")
-    data = pd.concat([data, date_extract], axis=1)
-    data["date"] = pd.to_datetime(data["date_value"])
+    data["date"] = pd.to_datetime(data["date"])
 
     # Year average
     data["year"] = data["date"].dt.year
     year_avg = (
         data.groupby(["currency_id", "year"])["value"].mean().reset_index()
     )
-    year_avg["date"] = pd.to_datetime(year_avg[["year"]].assign(month=1, day=1))
-    year_avg["date"] = year_avg["date"].apply(
-        lambda x: Date(value=x, precision=DATE_PRECISION_YEAR).serialize()
-    )
-    CurrencyRate.objects.filter(date__precision=DATE_PRECISION_YEAR).delete()
-    bulk_create_from_df(CurrencyRate, year_avg, columns)
+    year_avg["date"] = pd.to_datetime(
+        year_avg[["year"]].assign(month=1, day=1)
+    ).dt.date
+    year_avg["precision"] = DATE_PRECISION_YEAR
 
     # Month average
     data["month"] = data["date"].dt.month
@@ -357,12 +520,19 @@ def compute_average_rates():
     )
     month_avg["date"] = pd.to_datetime(
         month_avg[["year", "month"]].assign(day=1)
+    ).dt.date
+    month_avg["precision"] = DATE_PRECISION_MONTH
+
+    columns = ["currency_id", "precision", "date", "value"]
+    averages = pd.concat(
+        [year_avg[columns], month_avg[columns]], ignore_index=True
     )
-    month_avg["date"] = month_avg["date"].apply(
-        lambda x: Date(value=x, precision=DATE_PRECISION_MONTH).serialize()
+    existing = pd.DataFrame.from_records(
+        existing.values("id", *columns), columns=["id", *columns]
     )
-    CurrencyRate.objects.filter(date__precision=DATE_PRECISION_MONTH).delete()
-    bulk_create_from_df(CurrencyRate, month_avg, columns)
+    if upsert_average_rates(averages, existing):
+        bump_rates_version()
+    Watermark.set_value(AVERAGE_RATES_WATERMARK, max_rate_id)
     logger.info("Successfully computed average currency rates.")
 
 
@@ -406,9 +576,11 @@ def update_currency_rates():
     t_extremas.max += timedelta(days=1)
     t_extremas.min = date(t_extremas.min.year, 1, 1)
 
-    # Fetch data for each currency individually
+    # Get the missing intervals of every currency
     c_extremas = date_extremas_from_queryset(
-        CurrencyRate.objects.all(), ["date"], groupby=["currency_id"]
+        CurrencyRate.objects.filter(precision=DATE_PRECISION_DAY),
+        ["date"],
+        groupby=["currency_id"],
     )
     c_extremas = {c["currency_id"]: c["_extremas"] for c in c_extremas}
     for c in currencies:
@@ -416,127 +588,232 @@ def update_currency_rates():
             continue
         c_extremas[c] = DateExtremas()
 
-    for c_id, c_data in c_extremas.items():
-        update_currency_rate(
-            c_id,
-            t_extremas,
-            c_data,
+    update_currencies_rates(
+        {
+            c_id: missing_rate_intervals(t_extremas, c_data)
+            for c_id, c_data in c_extremas.items()
+        }
+    )
+
+
+def rate_dates(dates: pd.Series, precisions: pd.Series) -> pd.Series:
+    """
+    Return the date of the rate to use for each of the given dates according
+    to its precision: the date itself for the `day` precision, the first day
+    of the month or of the year otherwise.
+
+    :param dates:       The datetime values.
+    :param precisions:  The date precisions.
+    """
+    result = dates.dt.normalize()
+    for precision, period in [
+        (DATE_PRECISION_MONTH, "M"),
+        (DATE_PRECISION_YEAR, "Y"),
+    ]:
+        result = result.where(
+            precisions != precision, dates.dt.to_period(period).dt.start_time
         )
+    return result.dt.date
 
 
-def compute_transfer_amounts():
+def currency_rates_for_dates(keys: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return the currency rates matching the given keys.
+    The rates are queried by chunk of dates per precision, which are
+    lookups on the (precision, date, currency) unique index.
+
+    :param keys:    The DataFrame of keys with the `precision` and `date`
+                    columns, and an optional `currency_id` column.
+                    Rates of all currencies are returned when it's missing.
+    :returns:       The keys joined with their rates, with the additional
+                    columns `currency_id` and `value`.
+    """
+    columns = ["currency_id", "precision", "date", "value"]
+    keys = keys.dropna(subset=["precision", "date"]).drop_duplicates()
+    on = ["precision", "date"]
+    conditions = []
+    for precision, group in keys.groupby("precision"):
+        dates = group["date"].drop_duplicates().to_list()
+        for i in range(0, len(dates), LOOKUP_CHUNK_SIZE):
+            conditions.append(
+                Q(
+                    precision=precision,
+                    date__in=dates[i : i + LOOKUP_CHUNK_SIZE],
+                )
+            )
+    if not conditions:
+        return pd.DataFrame(columns=columns)
+
+    queryset = CurrencyRate.objects.filter(reduce(operator.or_, conditions))
+    if "currency_id" in keys.columns:
+        on.append("currency_id")
+        queryset = queryset.filter(
+            currency_id__in=keys["currency_id"].dropna().unique().tolist()
+        )
+    rates = pd.DataFrame.from_records(
+        queryset.values(*columns), columns=columns
+    )
+    return keys.merge(rates, on=on)
+
+
+TRANSFER_AMOUNTS_WATERMARK = "transfer_amounts_rates"
+
+
+def transfers_for_amounts(full: bool = False) -> pd.DataFrame:
+    """
+    Return the transfers whose converted amounts must be computed:
+
+    - the transfers never converted or updated since their last conversion
+      (new or changed amount, currency or date),
+    - the transfers dated from the year of the earliest daily rate
+      fetched since the last conversion. This includes the "future"
+      transfers converted with the last known rates.
+
+    :param full:    Whether to return every transfer with an amount.
+    """
+    queryset = Transfer.objects.filter(amount__isnull=False)
+    since_rate_id = Watermark.get_value(TRANSFER_AMOUNTS_WATERMARK)
+    if not full and since_rate_id is not None:
+        condition = Q(date_amounts_clc__isnull=True) | Q(
+            date_last_updated__gt=F("date_amounts_clc")
+        )
+        min_new_rate_date: date | None = CurrencyRate.objects.filter(
+            id__gt=since_rate_id, precision=DATE_PRECISION_DAY
+        ).aggregate(min_date=Min("date"))["min_date"]
+        if min_new_rate_date is not None:
+            condition |= Q(_date_clc__gte=date(min_new_rate_date.year, 1, 1))
+        queryset = queryset.annotate(
+            _date_clc=Cast(KT("date_clc__value"), DateField())
+        ).filter(condition)
+
+    return pd.DataFrame.from_records(
+        queryset.values(
+            "id",
+            "amount",
+            "date_clc",
+            "currency_id",
+            "amounts_clc",
+            "amount_usd",
+        )
+    )
+
+
+def compute_transfer_amounts(full: bool = False):
     """
     Compute transfer amounts for all available currencies.
 
     The correct rate to use is derived according to the transfer's date
     precision.
+    Only the transfers affected by a change since the last computation are
+    converted, see `transfers_for_amounts`.
+
+    :param full:    Whether to convert every transfer with an amount.
     """
     logger.info("Computing transfer amounts in available currencies.")
-    transfers = pd.DataFrame.from_records(
-        Transfer.objects.filter(amount__isnull=False).values(
-            "id", "amount", "date_clc", "currency_id"
-        )
-    )
+    max_rate_id = CurrencyRate.objects.filter(
+        precision=DATE_PRECISION_DAY
+    ).aggregate(max_id=Max("id"))["max_id"]
+    transfers = transfers_for_amounts(full)
     if transfers.empty:
         logger.info("No transfers to compute amounts for.")
+        if max_rate_id is not None:
+            Watermark.set_value(TRANSFER_AMOUNTS_WATERMARK, max_rate_id)
         return
-    rates = pd.DataFrame.from_records(
-        CurrencyRate.objects.all().values("currency_id", "date", "value")
+    last_rate_dates = CurrencyRate.objects.aggregate(
+        max_date=Max("date", filter=Q(precision=DATE_PRECISION_DAY)),
+        max_month=Max("date", filter=Q(precision=DATE_PRECISION_MONTH)),
     )
-    if rates.empty:
+    if last_rate_dates["max_date"] is None:
         logger.info("No currency rates to compute amounts.")
         return
+    currencies = list(
+        CurrencyRate.objects.order_by("currency_id")
+        .values_list("currency_id", flat=True)
+        .distinct()
+    )
 
     # This adds the columns date_value and date_precision
-    date_extract = pd.json_normalize(rates["date"]).add_prefix("date_")
-    rates = pd.concat([rates, date_extract], axis=1)
-
-    rates["date_value"] = pd.to_datetime(rates["date_value"])
-    rates["year"] = rates["date_value"].dt.year
-    rates["month"] = rates["date_value"].dt.month
-    rates["day"] = rates["date_value"].dt.day
-
     date_extract = pd.json_normalize(transfers["date_clc"]).add_prefix("date_")
     transfers = pd.concat([transfers, date_extract], axis=1)
     transfers["date_value"] = pd.to_datetime(transfers["date_value"])
 
-    # Handle the transfers made after the last known rate differently
-    max_date: datetime = rates["date_value"].max()
-    t_future = transfers[transfers["date_value"] > max_date]
-
-    transfers = transfers[~transfers.index.isin(t_future.index)]
-    transfers["year"] = transfers["date_value"].dt.year
-    transfers["month"] = transfers["date_value"].dt.month
-    transfers["day"] = transfers["date_value"].dt.day
-    t_year = transfers[
-        transfers["date_precision"] == DATE_PRECISION_YEAR
-    ].copy()
-    t_month = transfers[
-        transfers["date_precision"] == DATE_PRECISION_MONTH
-    ].copy()
-    t_day = transfers[transfers["date_precision"] == DATE_PRECISION_DAY].copy()
-
-    currencies = rates["currency_id"].drop_duplicates().to_list()
-
-    # 1 - Pivot the rate data to obtain currency rate columns per date
-    r_pivot = (
-        rates[
-            ["date_precision", "year", "month", "day", "currency_id", "value"]
-        ]
-        .pivot_table(
-            index=["date_precision", "year", "month", "day"],
-            columns="currency_id",
-            values="value",
-            aggfunc="first",
-        )
-        .reset_index()
-    )
-    # 2 - Handle "future" transfers with the average rate over the last month
-    last_known_rate = (
-        r_pivot[r_pivot["date_precision"] == DATE_PRECISION_MONTH]
-        .sort_values(["year", "month", "day"], ascending=False)
-        .drop(columns=["year", "month", "day", "date_precision"])
-        .head(1)
-    )
-    t_future = t_future.merge(last_known_rate, how="cross")
-
-    # 3 - Add rate data to the transfer frame
-    t_year = t_year.merge(
-        r_pivot.drop(columns=["month", "day"]), on=["date_precision", "year"]
+    # Fetch the rates applicable to the transfers, along with the average
+    # rates over the last month used for the transfers made after the last
+    # known rate.
+    keys = pd.DataFrame(
+        {
+            "precision": transfers["date_precision"],
+            "date": rate_dates(
+                transfers["date_value"], transfers["date_precision"]
+            ),
+        }
     )
-    t_month = t_month.merge(
-        r_pivot.drop(columns=["day"]),
-        on=["date_precision", "year", "month"],
+    if last_rate_dates["max_month"] is not None:
+        keys.loc[len(keys)] = [
+            DATE_PRECISION_MONTH,
+            last_rate_dates["max_month"],
+        ]
+    rates = currency_rates_for_dates(keys)
+    rate_table = RateTable.from_df(
+        rates, currencies=currencies, last_date=last_rate_dates["max_date"]
     )
-    t_day = t_day.merge(
-        r_pivot,
-        on=["date_precision", "year", "month", "day"],
+    amounts_usd = rate_table.usd_amounts(
+        transfers["amount"],
+        transfers["currency_id"],
+        transfers["date_value"],
+        transfers["date_precision"],
     )
-    transfers = pd.concat([t_future, t_year, t_month, t_day], ignore_index=True)
-
-    # 4 - Compute USD amount with appropriate rate
-    for c in currencies:
-        t_sub = transfers[transfers["currency_id"] == c]
-        transfers.loc[t_sub.index, "amount_USD"] = t_sub["amount"] / t_sub[c]
+    transfers = transfers.loc[amounts_usd.index]
+    transfers["new_amount_usd"] = amounts_usd
+    transfers["new_amounts_clc"] = None
+    if app_settings.TRANSFER_AMOUNTS_CLC:
+        amounts = rate_table.convert_usd(
+            amounts_usd, transfers["date_value"], transfers["date_precision"]
+        )
+        transfers["new_amounts_clc"] = pd.Series(
+            amounts.to_dict(orient="index")
+        )
 
-    # 5 - Compute all other amounts based on USD one
-    currency_cols = []
-    for c in currencies:
-        col_name = f"amount_{c}"
-        currency_cols.append(col_name)
-        transfers[col_name] = (
-            (transfers["amount_USD"] * transfers[c]).round().astype("Int64")
+    # Only update the transfers whose amounts changed
+    changed = [
+        new_clc != old_clc or not (new_usd == old_usd)
+        for new_clc, old_clc, new_usd, old_usd in zip(
+            transfers["new_amounts_clc"],
+            transfers["amounts_clc"],
+            transfers["new_amount_usd"],
+            transfers["amount_usd"],
         )
+    ]
+    changed = pd.Series(changed, index=transfers.index, dtype=bool)
 
     # Dump results to the database
-    transfers = transfers[["id", *currency_cols]].set_index("id")
-    cols_rename = {c: c[-3:] for c in currency_cols}
-    transfers.rename(columns=cols_rename, inplace=True)
-    transfers["amounts_clc"] = transfers.to_dict(orient="index").values()
-    transfers.reset_index(inplace=True)
-    bulk_update_from_df(Transfer, transfers, ["id", "amounts_clc"])
+    transfers = transfers[["id", "new_amounts_clc", "new_amount_usd"]].rename(
+        columns={
+            "new_amounts_clc": "amounts_clc",
+            "new_amount_usd": "amount_usd",
+        }
+    )
+    transfers["date_amounts_clc"] = timezone.now()
+    transfers["date_last_updated"] = transfers["date_amounts_clc"]
+    bulk_update_from_df(
+        Transfer,
+        transfers[changed].copy(),
+        [
+            "id",
+            "amounts_clc",
+            "amount_usd",
+            "date_amounts_clc",
+            "date_last_updated",
+        ],
+    )
+    bulk_update_from_df(
+        Transfer, transfers[~changed].copy(), ["id", "date_amounts_clc"]
+    )
+    if max_rate_id is not None:
+        Watermark.set_value(TRANSFER_AMOUNTS_WATERMARK, max_rate_id)
     logger.info(
-        "Successfully computed transfer amounts in available currencies."
+        f"Successfully computed amounts of {len(transfers)} transfers "
+        f"in available currencies, {changed.sum()} changed."
     )
 
 
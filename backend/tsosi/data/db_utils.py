@@ -3,7 +3,7 @@ from datetime import date
 from typing import Iterable, Type
 
 import pandas as pd
-from django.db import models
+from django.db import connection, models
 from django.db.models.fields.json import KT
 from django.db.models.functions import Cast
 
@@ -11,6 +11,7 @@ from .utils import chunk_df, clean_null_values, drop_keys
 
 INSERT_CHUNK_SIZE = 100
 UPDATE_CHUNK_SIZE = 150
+LOOKUP_CHUNK_SIZE = 1000
 
 IDENTIFIER_CREATE_FIELDS = [
     "registry_id",
@@ -42,8 +43,8 @@ def date_extremas_from_queryset(
     """
     Return the min. and max. values of the given date fields over
     all instances of the given model.
-    The date fields are expected to have the models.date.Date dataclass
-    structure.
+    The date fields are expected to be either regular date fields or to have
+    the models.date.Date dataclass structure.
 
     :param queryset:    The base queryset used to compute extremas from.
     :type queryset:     QuerySet
@@ -57,11 +58,13 @@ def date_extremas_from_queryset(
     """
     aggregations = {}
     for f in fields:
-        field_str = f"temp_str_{f}"
-        queryset = queryset.annotate(**{field_str: KT(f"{f}__value")})
-        field_date = f"temp_date_{f}"
-        function = Cast(field_str, output_field=models.DateField())
-        queryset = queryset.annotate(**{field_date: function})
+        field_date = f
+        if not isinstance(queryset.model._meta.get_field(f), models.DateField):
+            field_str = f"temp_str_{f}"
+            queryset = queryset.annotate(**{field_str: KT(f"{f}__value")})
+            field_date = f"temp_date_{f}"
+            function = Cast(field_str, output_field=models.DateField())
+            queryset = queryset.annotate(**{field_date: function})
         aggregations[f"min__{f}"] = models.Min(field_date)
         aggregations[f"max__{f}"] = models.Max(field_date)
 
@@ -172,3 +175,54 @@ def bulk_update_from_df(
         model_class.objects.bulk_update(
             instances.to_list(), fields=fields_for_update
         )
+
+
+def bulk_update_fk_from_mapping(
+    model_class: Type[models.Model],
+    field_name: str,
+    mapping: dict,
+    extra_values: dict | None = None,
+) -> int:
+    """
+    Re-point the given foreign key from the old to the new referenced
+    instances with a single `UPDATE ... FROM (VALUES ...)` statement.
+
+    :param model_class:     The model holding the foreign key.
+    :param field_name:      The name of the foreign key field.
+    :param mapping:         The mapping {old referenced PK: new referenced PK}.
+    :param extra_values:    Optional {field name: value} to set on every
+                            updated row, ex: `date_last_updated`.
+    :returns:               The number of updated rows.
+    """
+    if not mapping:
+        return 0
+    qn = connection.ops.quote_name
+    meta = model_class._meta
+    fk_field = meta.get_field(field_name)
+    table = qn(meta.db_table)
+    column = qn(fk_field.column)
+
+    set_parts = [f"{column} = m.column2"]
+    set_params = []
+    for name, value in (extra_values or {}).items():
+        field = meta.get_field(name)
+        set_parts.append(f"{qn(field.column)} = %s")
+        set_params.append(field.get_db_prep_value(value, connection))
+
+    # Explicit casts so that the VALUES columns get the type of the key
+    # column, ex: `uuid` for PostgreSQL.
+    placeholder = f"CAST(%s AS {fk_field.db_type(connection)})"
+    values_sql = ", ".join([f"({placeholder}, {placeholder})"] * len(mapping))
+    values_params = []
+    for old, new in mapping.items():
+        values_params.append(fk_field.get_db_prep_value(old, connection))
+        values_params.append(fk_field.get_db_prep_value(new, connection))
+
+    sql = (
+        f"UPDATE {table} SET {", ".join(set_parts)} "
+        f"FROM (VALUES {values_sql}) AS m "
+        f"WHERE {table}.{column} = m.column1"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*set_params, *values_params])
+        return cursor.rowcount
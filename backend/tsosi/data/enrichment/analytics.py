@@ -1,68 +1,342 @@
 import logging
+from datetime import datetime, timedelta
+from typing import Type
 
 import pandas as pd
-from django.db import transaction
-from django.db.models import F
-from tsosi.data.db_utils import bulk_create_from_df
-from tsosi.models import Analytic, Transfer
+from django.db import models, transaction
+from django.db.models import Count, F, Q, QuerySet, Sum
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast
+from django.utils import timezone
+from tsosi.data.currencies.conversion import rates_version, shared_rate_table
+from tsosi.data.db_utils import bulk_create_from_df, bulk_update_from_df
+from tsosi.models import Analytic, AnalyticRollup, Transfer, Watermark
+from tsosi.models.analytics import (
+    ANALYTIC_DIMENSION_AGENT,
+    ANALYTIC_DIMENSION_EMITTER,
+    ANALYTIC_DIMENSION_EMITTER_TYPE,
+    ANALYTIC_DIMENSION_MONTH,
+)
+from tsosi.models.date import DATE_PRECISION_YEAR
 
 logger = logging.getLogger(__name__)
 
+ANALYTICS_WATERMARK = "analytics"
+# Margin subtracted from the start of a run to get its watermark, so that
+# the updates of transactions committed during the run are not missed.
+ANALYTICS_WATERMARK_MARGIN = timedelta(hours=1)
+# Version of the currency rates used by the last analytics computation
+ANALYTICS_RATES_VERSION_WATERMARK = "analytics_rates_version"
+ANALYTIC_KEYS = ["country", "recipient_id", "year"]
+ANALYTIC_ROLLUP_KEYS = ["recipient_id", "year", "dimension", "key"]
 
-@transaction.atomic
-def compute_analytics() -> None:
+
+def analytics_transfers() -> QuerySet[Transfer]:
     """
-    Generate analytics table of pre-computed data.
+    Return the transfers counted in the analytics.
     """
-    logger.info("Computing analytics.")
-    transfers = (
-        Transfer.objects.select_related("emitter", "recipient")
-        .prefetch_related("agents")
-        .filter(
-            merged_into__isnull=True,
-            amounts_clc__isnull=False,
-            date_clc__isnull=False,
-            is_future=False,
-        )
-        .values(
-            "amounts_clc",
-            "date_clc",
-            "recipient_id",
-            country=F("emitter__country"),
-        )
+    return Transfer.objects.filter(
+        Q(amounts_clc__isnull=False) | Q(amount_usd__isnull=False),
+        merged_into__isnull=True,
+        date_clc__isnull=False,
+        is_future=False,
+    )
+
+
+def recipients_with_stale_counts() -> set:
+    """
+    Return the recipients whose analytics don't count as many transfers as
+    they have, ex: the recipients of deleted transfers.
+    """
+    transfer_counts = dict(
+        analytics_transfers()
+        .order_by()
+        .values("recipient_id")
+        .annotate(count=Count("id"))
+        .values_list("recipient_id", "count")
+    )
+    analytic_counts = dict(
+        Analytic.objects.order_by()
+        .values("recipient_id")
+        .annotate(count=Sum(Cast(KT("data__count"), models.IntegerField())))
+        .values_list("recipient_id", "count")
+    )
+    return {
+        r
+        for r in transfer_counts.keys() | analytic_counts.keys()
+        if transfer_counts.get(r, 0) != analytic_counts.get(r, 0)
+    }
+
+
+def analytics_affected_recipients(since: datetime) -> set:
+    """
+    Return the recipients whose analytics may have changed since the given
+    date: recipients of transfers updated (inserted, merged, re-dated,
+    re-converted) or whose emitter was updated, recipients with
+    existing analytics that were updated themselves (ex: merged) and
+    recipients of deleted transfers.
+
+    The previous cell of a modified transfer is not known, hence all the
+    cells of an affected recipient are recomputed.
+    """
+    transfer_recipients = Transfer.objects.filter(
+        Q(date_last_updated__gt=since) | Q(emitter__date_last_updated__gt=since)
+    ).values_list("recipient_id", flat=True)
+    analytic_recipients = Analytic.objects.filter(
+        recipient__date_last_updated__gt=since
+    ).values_list("recipient_id", flat=True)
+    rollup_recipients = AnalyticRollup.objects.filter(
+        recipient__date_last_updated__gt=since
+    ).values_list("recipient_id", flat=True)
+    return (
+        set(transfer_recipients)
+        | set(analytic_recipients)
+        | set(rollup_recipients)
+        | recipients_with_stale_counts()
     )
-    df = pd.DataFrame.from_records(transfers)
+
+
+def transfers_for_analytics(
+    recipient_ids: set | None = None,
+) -> tuple[pd.DataFrame, list[str]]:
+    """
+    Return the flattened transfer data used to compute analytics, along with
+    the list of available currencies.
+
+    :param recipient_ids:   Optional recipients to restrict the data to.
+    """
+    transfers = analytics_transfers()
+    if recipient_ids is not None:
+        transfers = transfers.filter(recipient_id__in=recipient_ids)
+    values = transfers.values(
+        "id",
+        "amounts_clc",
+        "amount_usd",
+        "date_clc",
+        "recipient_id",
+        "emitter_id",
+        country=F("emitter__country"),
+        emitter_types=F("emitter__types"),
+    )
+    df = pd.DataFrame.from_records(values)
     if df.empty:
-        logger.info("No transfer to compute analytics for.")
-        return
+        return df, []
 
     # Flatten data
     date_extract = pd.json_normalize(df["date_clc"]).add_prefix("date_")
     df = pd.concat([df, date_extract], axis=1)
     df["date_value"] = pd.to_datetime(df["date_value"], errors="raise")
     df["year"] = df["date_value"].dt.year
-    amounts = pd.json_normalize(df["amounts_clc"])
+    df["month"] = df["date_value"].dt.month
+    amounts = transfers_amounts(df)
     df = pd.concat([df, amounts], axis=1)
     df.drop(
-        columns=["date_clc", "date_precision", "amounts_clc", "date_value"],
+        columns=["date_clc", "amounts_clc", "amount_usd", "date_value"],
         inplace=True,
     )
 
-    # Compute buckets
+    # Add the list of agents of every transfer
+    agents = pd.DataFrame.from_records(
+        Transfer.agents.through.objects.filter(transfer__in=transfers).values(
+            "transfer_id", "entity_id"
+        ),
+        columns=["transfer_id", "entity_id"],
+    )
+    agents = agents.groupby("transfer_id")["entity_id"].agg(list)
+    df["agent_ids"] = df["id"].map(agents)
+
+    return df, amounts.columns.to_list()
+
+
+def transfers_amounts(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return the amounts in every currency of the given transfers: the stored
+    `amounts_clc` or the amounts converted from the USD amount when they're
+    not stored.
+
+    :param df:  The transfers with the columns `amounts_clc`, `amount_usd`,
+                `date_value` and `date_precision`.
+    """
+    stored = df["amounts_clc"].notna()
+    amounts = pd.json_normalize(df.loc[stored, "amounts_clc"].to_list())
+    amounts.index = df.index[stored]
+    if not stored.all():
+        missing = df[~stored]
+        # The converted amounts are stored, don't use a stale table
+        converted = shared_rate_table(max_age=0).convert_usd(
+            missing["amount_usd"],
+            missing["date_value"],
+            missing["date_precision"],
+        )
+        amounts = pd.concat([amounts, converted])
+    return amounts.reindex(df.index)
+
+
+def aggregate_buckets(
+    df: pd.DataFrame, keys: list[str], currencies: list[str]
+) -> pd.DataFrame:
+    """
+    Sum the amounts in every currency and count the transfers per bucket.
+    The aggregated values are stored as a dict in the `data` column.
+    """
     aggregations = {}
-    currencies = amounts.columns
     for c in currencies:
         aggregations[c] = pd.NamedAgg(column=c, aggfunc="sum")
-    aggregations["count"] = pd.NamedAgg(column=c, aggfunc="count")
-    data: pd.DataFrame = df.groupby(
-        ["country", "recipient_id", "year"], dropna=False
-    ).agg(**aggregations)
+    aggregations["count"] = pd.NamedAgg(column="id", aggfunc="count")
+    data: pd.DataFrame = df.groupby(keys, dropna=False).agg(**aggregations)
     data["data"] = data.to_dict(orient="index").values()
-    data = data["data"].reset_index()
+    return data["data"].reset_index()
+
+
+def compute_analytic_cells(
+    df: pd.DataFrame, currencies: list[str]
+) -> pd.DataFrame:
+    """
+    Compute the aggregated amounts & counts per (country, recipient, year).
+    """
+    if df.empty:
+        return pd.DataFrame(columns=[*ANALYTIC_KEYS, "data"])
+    return aggregate_buckets(df, ANALYTIC_KEYS, currencies)
+
+
+def compute_rollup_cells(
+    df: pd.DataFrame, currencies: list[str]
+) -> pd.DataFrame:
+    """
+    Compute the aggregated amounts & counts per recipient, year and
+    every additional dimension:
+
+    - emitter
+    - agent, a transfer counts for each of its agents
+    - month, only for transfers with a date precise to the month
+    - emitter type, a transfer counts for each of its emitter types
+    """
+    if df.empty:
+        return pd.DataFrame(columns=[*ANALYTIC_ROLLUP_KEYS, "data"])
+
+    dimensions = {
+        ANALYTIC_DIMENSION_EMITTER: df.assign(key=df["emitter_id"]),
+        ANALYTIC_DIMENSION_AGENT: df.explode("agent_ids").rename(
+            columns={"agent_ids": "key"}
+        ),
+        ANALYTIC_DIMENSION_MONTH: df[
+            df["date_precision"] != DATE_PRECISION_YEAR
+        ].assign(key=df["month"]),
+        ANALYTIC_DIMENSION_EMITTER_TYPE: df.explode("emitter_types").rename(
+            columns={"emitter_types": "key"}
+        ),
+    }
+    results = []
+    for dimension, data in dimensions.items():
+        data = data[data["key"].notna()]
+        if data.empty:
+            continue
+        data = data.assign(key=data["key"].astype(str), dimension=dimension)
+        results.append(
+            aggregate_buckets(data, ANALYTIC_ROLLUP_KEYS, currencies)
+        )
+    if not results:
+        return pd.DataFrame(columns=[*ANALYTIC_ROLLUP_KEYS, "data"])
+    return pd.concat(results, ignore_index=True)
+
+
+def upsert_analytics(
+    model_class: Type[models.Model],
+    data: pd.DataFrame,
+    keys: list[str],
+    recipient_ids: set | None = None,
+):
+    """
+    Write the given analytic cells in place of the existing ones.
+    Cells are updated, created or deleted individually so that the table
+    is never emptied.
 
-    # Write in DB
-    Analytic.objects.all().delete()
-    fields = ["recipient_id", "country", "year", "data"]
-    bulk_create_from_df(Analytic, data, fields)
+    :param model_class:     The analytic model, `Analytic` or `AnalyticRollup`
+    :param data:            The computed analytic cells.
+    :param keys:            The fields identifying a cell.
+    :param recipient_ids:   The recipients whose cells are replaced.
+                            All cells are replaced if `None`.
+    """
+    existing = model_class.objects.all()
+    if recipient_ids is not None:
+        existing = existing.filter(recipient_id__in=recipient_ids)
+    columns = ["id", *keys, "data"]
+    existing = pd.DataFrame.from_records(
+        existing.values(*columns), columns=columns
+    )
+    for df in [data, existing]:
+        for k in keys:
+            df[k] = df[k].astype(object).where(df[k].notna(), None)
+        df["recipient_id"] = df["recipient_id"].astype(str)
+        df["year"] = df["year"].astype(int)
+
+    merged = data.merge(existing, on=keys, how="outer", suffixes=("", "_old"))
+    to_delete = merged[merged["data"].isna()]
+    to_create = merged[merged["id"].isna()].copy()
+    to_update = merged[merged["id"].notna() & merged["data"].notna()].copy()
+    changed = [
+        new != old for new, old in zip(to_update["data"], to_update["data_old"])
+    ]
+    to_update = to_update.loc[
+        pd.Series(changed, index=to_update.index, dtype=bool)
+    ]
+
+    if not to_delete.empty:
+        ids = to_delete["id"].astype(int).to_list()
+        model_class.objects.filter(id__in=ids).delete()
+    if not to_update.empty:
+        to_update["id"] = to_update["id"].astype(int)
+        bulk_update_from_df(model_class, to_update, ["id", "data"])
+    if not to_create.empty:
+        bulk_create_from_df(model_class, to_create, [*keys, "data"])
+
+    logger.info(
+        f"{model_class.__name__}: {len(to_create)} created, "
+        f"{len(to_update)} updated and {len(to_delete)} deleted."
+    )
+
+
+@transaction.atomic
+def compute_analytics(full: bool = False) -> None:
+    """
+    Generate analytics tables of pre-computed data: the `Analytic` cells
+    per (country, recipient, year) and the `AnalyticRollup` buckets per
+    recipient, year and additional dimension.
+
+    The tables are maintained incrementally: only the analytics of the
+    recipients affected by transfer or entity updates since the start of
+    the last run, minus `ANALYTICS_WATERMARK_MARGIN`, or by transfer
+    deletions are recomputed. The first run, a run with `full=True` or the first run
+    after a change of the currency rates, see `bump_rates_version`,
+    recomputes every analytic.
+
+    :param full:    Whether to recompute all analytics.
+    """
+    logger.info("Computing analytics.")
+    watermark = timezone.now() - ANALYTICS_WATERMARK_MARGIN
+    version = rates_version()
+    if version != Watermark.get_value(ANALYTICS_RATES_VERSION_WATERMARK):
+        logger.info(f"Currency rates changed to version {version}.")
+        full = True
+    since = None if full else Watermark.get_date_value(ANALYTICS_WATERMARK)
+
+    recipient_ids = None
+    if since is not None:
+        recipient_ids = analytics_affected_recipients(since)
+        if not recipient_ids:
+            logger.info("No transfer to compute analytics for.")
+            Watermark.set_date_value(ANALYTICS_WATERMARK, watermark)
+            return
+
+    df, currencies = transfers_for_analytics(recipient_ids)
+    data = compute_analytic_cells(df, currencies)
+    upsert_analytics(Analytic, data, ANALYTIC_KEYS, recipient_ids)
+    rollups = compute_rollup_cells(df, currencies)
+    upsert_analytics(
+        AnalyticRollup, rollups, ANALYTIC_ROLLUP_KEYS, recipient_ids
+    )
+    Watermark.set_date_value(ANALYTICS_WATERMARK, watermark)
+    if version is not None:
+        Watermark.set_value(ANALYTICS_RATES_VERSION_WATERMARK, version)
 
-    logger.info(f"Computed {len(data)} analyics.")
+    logger.info(f"Computed {len(data)} analyics and {len(rollups)} rollups.")
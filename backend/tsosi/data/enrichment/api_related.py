@@ -3,9 +3,11 @@ Tasks involving external API requests.
 """
 
 import asyncio
-import io
 import logging
+from contextlib import closing
 from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
 from urllib.parse import unquote
 
 import pandas as pd
@@ -15,27 +17,42 @@ from django.db.models import Count, F, Q, QuerySet
 from django.utils import timezone
 from tsosi.app_settings import app_settings
 from tsosi.data.db_utils import bulk_create_from_df, bulk_update_from_df
-from tsosi.data.pid_registry.ror import fetch_ror_records
+from tsosi.data.pid_registry.common import AdaptiveBatcher
+from tsosi.data.pid_registry.http_cache import (
+    load_http_validators,
+    save_http_validators,
+)
+from tsosi.data.pid_registry.ror import iter_ror_records, ror_record_url
+from tsosi.data.pid_registry.ror_dump import ror_dump_results
+from tsosi.data.pid_registry.versions import (
+    version_content_hash,
+    version_stored_value,
+)
 from tsosi.data.pid_registry.wikidata import (
-    fetch_wikidata_records_data,
-    fetch_wikimedia_files,
+    WIKIPEDIA_EXTRACTS_BATCH_SIZE,
+    fetch_wikipedia_extracts,
     fetch_wikipedia_page_extracts,
+    iter_wikidata_records,
+    iter_wikimedia_files,
+    wikipedia_summary_url,
 )
 from tsosi.data.signals import identifiers_fetched
 from tsosi.data.task_result import TaskResult
 from tsosi.data.token_bucket import (
     ROR_TOKEN_BUCKET,
+    TokenBucket,
     WIKIDATA_TOKEN_BUCKET,
     WIKIMEDIA_TOKEN_BUCKET,
     WIKIPEDIA_TOKEN_BUCKET,
 )
-from tsosi.data.utils import chunk_df, clean_null_values
+from tsosi.data.utils import clean_null_values
 from tsosi.models import (
     Entity,
     EntityRequest,
     Identifier,
     IdentifierRequest,
     IdentifierVersion,
+    Registry,
 )
 from tsosi.models.entity import (
     ENTITY_REQUEST_WIKIMEDIA_LOGO,
@@ -46,17 +63,38 @@ from tsosi.models.static_data import REGISTRY_ROR, REGISTRY_WIKIDATA
 logger = logging.getLogger(__name__)
 
 
+def performed_requests(results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Filter out the results of the requests that were not performed
+    because the circuit breaker of the host was open, see `http_request`.
+    """
+    if "skipped" not in results.columns:
+        return results
+    return results[results["skipped"] != True].copy()
+
+
+def not_modified_results(results: pd.DataFrame) -> pd.Series:
+    """
+    Return the mask of the results of the conditional requests whose
+    resource is unchanged, see `record_validators`.
+    """
+    if "not_modified" not in results.columns:
+        return pd.Series(False, index=results.index)
+    return (results["error"] == False) & (results["not_modified"] == True)
+
+
 #### Identifier records fetching
 def log_identifier_requests(results: pd.DataFrame):
     """
     Log the identifier request results in the `IdentifierRequest` table.
+    The requests that were not performed are not logged.
 
     :param results:     The DataFrame of identifier request results with
                         appropriate columns.
     """
     bulk_create_from_df(
         IdentifierRequest,
-        results,
+        performed_requests(results),
         [
             "identifier_id",
             "info",
@@ -68,6 +106,58 @@ def log_identifier_requests(results: pd.DataFrame):
     )
 
 
+def fetch_registry_records(
+    registry_id: str,
+    identifiers: pd.DataFrame,
+    func: Callable[[pd.Series], Iterator[pd.DataFrame]],
+    token_bucket: TokenBucket | None = None,
+) -> tuple[pd.DataFrame, Iterator[pd.DataFrame], bool]:
+    """
+    Fetch the registry's record of the given identifiers.
+
+    ROR records are served from the local ROR dump, see `ror_dump`, only
+    the identifiers missing from the dump are fetched from the API and
+    consume tokens.
+
+    :param registry_id:     The registry of the identifiers.
+    :param identifiers:     The identifiers with the column `value`.
+    :param func:            The function fetching the records of the given
+                            values from the registry's API, yielding the
+                            results by micro-batches.
+    :param token_bucket:    The optional token bucket throttling the API
+                            requests.
+    :returns:               The identifiers whose record is fetched, the
+                            iterator of the fetching results by
+                            micro-batches and whether the bucket was
+                            exhausted.
+    """
+    partial = False
+    if identifiers.empty:
+        return identifiers, iter([]), partial
+
+    dump_results = pd.DataFrame()
+    from_dump = identifiers.iloc[0:0]
+    if registry_id == REGISTRY_ROR:
+        dump_results = ror_dump_results(identifiers["value"])
+        in_dump = identifiers["value"].isin(dump_results["id"])
+        from_dump = identifiers[in_dump]
+        identifiers = identifiers[~in_dump]
+        if not dump_results.empty:
+            logger.info(f"Read {len(dump_results)} records from the ROR dump.")
+
+    if token_bucket is not None:
+        identifiers, partial = token_bucket.consume_for_df(identifiers)
+
+    def batches() -> Iterator[pd.DataFrame]:
+        if not dump_results.empty:
+            yield dump_results
+        if not identifiers.empty:
+            yield from func(identifiers["value"])
+
+    fetched = pd.concat([from_dump, identifiers], ignore_index=True)
+    return fetched, batches(), partial
+
+
 ## Empty identifiers
 def empty_identifiers(
     registry_id: str | None = None,
@@ -103,40 +193,21 @@ def empty_identifiers(
 
 
 @transaction.atomic
-def fetch_empty_identifier_records(
-    registry_id: str, use_tokens: bool = True
-) -> TaskResult:
+def create_identifier_versions(
+    registry_id: str, identifiers: pd.DataFrame, records: pd.DataFrame
+) -> tuple[int, int]:
     """
-    Fetch the registry's record of every Identifier without a version.
+    Log the given fetching results and create the first version of the
+    identifiers whose record was fetched.
+
+    :param registry_id: The registry of the identifiers.
+    :param identifiers: The fetched identifiers, with columns `id` and
+                        `value`.
+    :param records:     The fetching results, see `fetch_ror_records`.
+    :returns:           The number of records correctly fetched and the
+                        number of created versions.
     """
-    logger.info(
-        f"Fetching emtpy identifier records for registry {registry_id}."
-    )
-    if registry_id == REGISTRY_ROR:
-        func = fetch_ror_records
-        token_bucket = ROR_TOKEN_BUCKET
-    elif registry_id == REGISTRY_WIKIDATA:
-        func = fetch_wikidata_records_data
-        token_bucket = WIKIDATA_TOKEN_BUCKET
-    else:
-        logger.error(f"Unkwown identifier registry {registry_id}")
-        raise ValueError(f"Unknown identifier registry {registry_id}")
-
-    result = TaskResult(partial=False, countdown=token_bucket.refill_period)
-    identifiers = empty_identifiers(registry_id)
-    if use_tokens:
-        identifiers, result.partial = token_bucket.consume_for_df(identifiers)
-    if identifiers.empty:
-        if result.partial:
-            logger.info(
-                f"Bucket exhausted for registry {registry_id}. Retry later."
-            )
-        logger.info(
-            f"There are no empty identifiers for registry {registry_id}."
-        )
-        return result
-
-    records = asyncio.run(func(identifiers["value"]))
+    identifiers = identifiers[identifiers["value"].isin(records["id"])].copy()
 
     # Log API requests
     id_requests = records.copy()
@@ -144,13 +215,12 @@ def fetch_empty_identifier_records(
         identifiers.set_index("value")["id"]
     )
     log_identifier_requests(id_requests)
+    save_http_validators(records)
 
     # Process results
-    records = records if records.empty else records[records["error"] == False]
-    result.partial = result.partial or len(records) != len(identifiers)
+    records = records[records["error"] == False]
     if records.empty:
-        logger.info(f"No identifier fetched for registry {registry_id}.")
-        return result
+        return 0, 0
 
     identifiers["record"] = identifiers["value"].map(
         records.set_index("id")["record"]
@@ -159,10 +229,7 @@ def fetch_empty_identifier_records(
     # Create IdentifierVersion
     identifier_versions = identifiers[~identifiers["record"].isna()].copy()
     if identifier_versions.empty:
-        logger.info(
-            f"No records found for the queried {len(identifiers)} identifiers."
-        )
-        return result
+        return len(records), 0
 
     identifier_versions.rename(
         columns={
@@ -177,10 +244,17 @@ def fetch_empty_identifier_records(
     identifier_versions["date_created"] = date_update
     identifier_versions["date_last_updated"] = date_update
     identifier_versions["date_last_fetched"] = date_update
+    identifier_versions["content_hash"] = identifier_versions["value"].apply(
+        lambda v: version_content_hash(registry_id, v)
+    )
+    identifier_versions["value"] = identifier_versions["value"].apply(
+        lambda v: version_stored_value(registry_id, v)
+    )
 
     fields = [
         "identifier_id",
         "value",
+        "content_hash",
         "date_start",
         "date_last_fetched",
         "date_created",
@@ -198,24 +272,109 @@ def fetch_empty_identifier_records(
     }
     identifiers_for_udpate = identifier_versions.rename(columns=cols_map)
     bulk_update_from_df(Identifier, identifiers_for_udpate, cols_map.values())
+    return len(records), len(identifier_versions)
+
+
+def fetch_empty_identifier_records(
+    registry_id: str, use_tokens: bool = True
+) -> TaskResult:
+    """
+    Fetch the registry's record of every Identifier without a version.
 
+    The records are persisted by micro-batches, each in its own
+    transaction, while the next ones are being fetched.
+    """
     logger.info(
-        f"Fetched {len(identifier_versions)} empty records "
-        f"from registry {registry_id}"
+        f"Fetching emtpy identifier records for registry {registry_id}."
     )
-    identifiers_fetched.send(
-        None, registry_id=registry_id, count=len(identifier_versions)
+    if registry_id == REGISTRY_ROR:
+        func = iter_ror_records
+        token_bucket = ROR_TOKEN_BUCKET
+    elif registry_id == REGISTRY_WIKIDATA:
+        func = iter_adaptive_wikidata_records
+        token_bucket = WIKIDATA_TOKEN_BUCKET
+    else:
+        logger.error(f"Unkwown identifier registry {registry_id}")
+        raise ValueError(f"Unknown identifier registry {registry_id}")
+
+    result = TaskResult(partial=False, countdown=token_bucket.refill_period)
+    identifiers = empty_identifiers(registry_id)
+    identifiers, record_batches, result.partial = fetch_registry_records(
+        registry_id, identifiers, func, token_bucket if use_tokens else None
     )
+    if identifiers.empty:
+        if result.partial:
+            logger.info(
+                f"Bucket exhausted for registry {registry_id}. Retry later."
+            )
+        logger.info(
+            f"There are no empty identifiers for registry {registry_id}."
+        )
+        return result
+
+    fetched, created = 0, 0
+    for records in record_batches:
+        batch_fetched, batch_created = create_identifier_versions(
+            registry_id, identifiers, records
+        )
+        fetched += batch_fetched
+        created += batch_created
+
+    result.partial = result.partial or fetched != len(identifiers)
+    if fetched == 0:
+        logger.info(f"No identifier fetched for registry {registry_id}.")
+        return result
+    if created == 0:
+        logger.info(
+            f"No records found for the queried {len(identifiers)} identifiers."
+        )
+        return result
+
+    logger.info(f"Fetched {created} empty records from registry {registry_id}")
+    identifiers_fetched.send(None, registry_id=registry_id, count=created)
     result.data_modified = True
     return result
 
 
 ## Identifier refresh
+def iter_conditional_ror_records(
+    identifiers: Iterable[str],
+) -> Iterator[pd.DataFrame]:
+    """
+    `iter_ror_records` with conditional requests for the records whose
+    HTTP validators are stored.
+    """
+    identifiers = list(identifiers)
+    validators = load_http_validators(ror_record_url(i) for i in identifiers)
+    return iter_ror_records(identifiers, validators=validators)
+
+
+def iter_adaptive_wikidata_records(
+    identifiers: Iterable[str],
+) -> Iterator[pd.DataFrame]:
+    """
+    `iter_wikidata_records` starting with the chunk size and concurrency
+    reached by the previous run, which are persisted once the fetching
+    ends.
+    """
+    batcher = AdaptiveBatcher.from_params(
+        Registry.get_fetch_params(REGISTRY_WIKIDATA),
+        chunk_size=40,
+        concurrency=5,
+    )
+    try:
+        yield from iter_wikidata_records(list(identifiers), batcher=batcher)
+    finally:
+        Registry.set_fetch_params(REGISTRY_WIKIDATA, batcher.params())
+        logger.info(f"Wikidata fetch parameters: {batcher.params()}")
+
+
 def identifiers_for_refresh(
     registry_id: str | None = None, query_threshold: int | None = None
 ) -> pd.DataFrame:
     """
     Retrieve the Identifier records that need to be updated.
+    Only the content hash of the current version is returned, not its value.
 
     :param registry_id:     Optional registry ID used to filter the identifiers.
     :param query_threshold: If not-null, filter out the identifiers with more
@@ -249,54 +408,30 @@ def identifiers_for_refresh(
         "registry_id",
         "value",
         "current_version_id",
-        record=F("current_version__value"),
+        content_hash=F("current_version__content_hash"),
     )
     return pd.DataFrame.from_records(instances)
 
 
 @transaction.atomic
-def refresh_identifier_records(
-    registry_id: str, use_tokens: bool = True
-) -> TaskResult:
+def update_identifier_versions(
+    registry_id: str, identifiers: pd.DataFrame, records: pd.DataFrame
+) -> tuple[int, int]:
     """
-    Routine to refresh the identifier records.
-
-    TODO: Harmonize with `fetch_empty_identifier_records`. Most of the
-    code is the same.
-
-    1 - For every active identifiers, fetch the current record and compare with
-        existing version.
-
-    2 - Create a new version if the existing and new record differ.
-
-    3 - Send the identifiers_fetched signal to trigger further processing.
+    Log the given fetching results and create a new version of the
+    identifiers whose record changed.
+    The current version of the unchanged ones is marked as fetched.
+
+    :param registry_id: The registry of the identifiers.
+    :param identifiers: The refreshed identifiers, see
+                        `identifiers_for_refresh`.
+    :param records:     The fetching results, see `fetch_ror_records`.
+    :returns:           The number of records correctly fetched and the
+                        number of created versions.
     """
-    logger.info(f"Refreshing identifier records for registry {registry_id}")
-    if registry_id == REGISTRY_ROR:
-        func = fetch_ror_records
-        token_bucket = ROR_TOKEN_BUCKET
-    elif registry_id == REGISTRY_WIKIDATA:
-        func = fetch_wikidata_records_data
-        token_bucket = WIKIDATA_TOKEN_BUCKET
-    else:
-        logger.error(f"Unknown identifier registry")
-        raise ValueError(f"Unknown identifier registry {registry_id}")
-
-    result = TaskResult(partial=False, countdown=token_bucket.refill_period)
-    identifiers = identifiers_for_refresh(registry_id)
-    if use_tokens:
-        identifiers, result.partial = token_bucket.consume_for_df(identifiers)
-    if identifiers.empty:
-        if result.partial:
-            logger.info(
-                f"Bucket exhausted for registry {registry_id}. Retry later."
-            )
-        logger.info(
-            f"There are no empty identifiers for registry {registry_id}."
-        )
-        return result
-
-    records = asyncio.run(func(identifiers["value"]))
+    if records.empty:
+        return 0, 0
+    identifiers = identifiers[identifiers["value"].isin(records["id"])].copy()
 
     # Log API requests
     id_requests = records.copy()
@@ -304,21 +439,31 @@ def refresh_identifier_records(
         identifiers.set_index("value")["id"]
     )
     log_identifier_requests(id_requests)
+    save_http_validators(records)
 
     # Process results
-    records = records if records.empty else records[records["error"] == False]
-    result.partial = result.partial or len(records) != len(identifiers)
+    records = records[records["error"] == False]
     if records.empty:
-        logger.info(f"No records correctly fetched for registry {registry_id}.")
-        return result
+        return 0, 0
 
     identifiers["new_record"] = identifiers["value"].map(
         records.set_index("id")["record"]
     )
+    # The records not modified since the last fetch keep their content hash
+    not_modified = identifiers["value"].isin(
+        records.loc[not_modified_results(records), "id"]
+    )
     # Discard the ones with empty record
-    identifiers = identifiers[~identifiers["new_record"].isna()]
+    identifiers = identifiers[~identifiers["new_record"].isna() | not_modified]
+    not_modified = not_modified[identifiers.index]
 
-    identifiers["_diff"] = ~identifiers["record"].eq(identifiers["new_record"])
+    identifiers["new_content_hash"] = identifiers["content_hash"]
+    identifiers.loc[~not_modified, "new_content_hash"] = identifiers.loc[
+        ~not_modified, "new_record"
+    ].apply(lambda v: version_content_hash(registry_id, v))
+    identifiers["_diff"] = ~identifiers["content_hash"].eq(
+        identifiers["new_content_hash"]
+    )
 
     no_change = identifiers[~identifiers["_diff"]][
         ["current_version_id"]
@@ -342,7 +487,7 @@ def refresh_identifier_records(
 
     ## Handle modified records
     if new_records.empty:
-        return result
+        return len(records), 0
     # Update old versions
     new_records["date_last_updated"] = date_update
     old_versions = new_records[
@@ -356,19 +501,24 @@ def refresh_identifier_records(
 
     # Create new versions
     new_versions = new_records[
-        ["id", "new_record", "date_last_updated"]
+        ["id", "new_record", "new_content_hash", "date_last_updated"]
     ].rename(
         columns={
             "id": "identifier_id",
             "new_record": "value",
+            "new_content_hash": "content_hash",
         }
     )
     new_versions["date_created"] = date_update
     new_versions["date_start"] = date_update
     new_versions["date_last_fetched"] = date_update
+    new_versions["value"] = new_versions["value"].apply(
+        lambda v: version_stored_value(registry_id, v)
+    )
     fields = [
         "identifier_id",
         "value",
+        "content_hash",
         "date_start",
         "date_last_fetched",
         "date_created",
@@ -386,14 +536,73 @@ def refresh_identifier_records(
     }
     id_update = new_versions[cols_map.keys()].rename(columns=cols_map)
     bulk_update_from_df(Identifier, id_update, cols_map.values())
+    return len(records), len(new_versions)
+
+
+def refresh_identifier_records(
+    registry_id: str, use_tokens: bool = True
+) -> TaskResult:
+    """
+    Routine to refresh the identifier records.
+
+    1 - For every active identifiers, fetch the current record and compare its
+        content hash with the existing version's one.
+
+    2 - Create a new version if the existing and new record differ.
+
+    3 - Send the identifiers_fetched signal to trigger further processing.
+
+    The ROR records are fetched with conditional requests, the unchanged
+    ones (HTTP 304) are handled as un-changed records without processing.
+    The records are persisted by micro-batches, each in its own
+    transaction, while the next ones are being fetched.
+    """
+    logger.info(f"Refreshing identifier records for registry {registry_id}")
+    if registry_id == REGISTRY_ROR:
+        func = iter_conditional_ror_records
+        token_bucket = ROR_TOKEN_BUCKET
+    elif registry_id == REGISTRY_WIKIDATA:
+        func = iter_adaptive_wikidata_records
+        token_bucket = WIKIDATA_TOKEN_BUCKET
+    else:
+        logger.error(f"Unknown identifier registry")
+        raise ValueError(f"Unknown identifier registry {registry_id}")
+
+    result = TaskResult(partial=False, countdown=token_bucket.refill_period)
+    identifiers = identifiers_for_refresh(registry_id)
+    identifiers, record_batches, result.partial = fetch_registry_records(
+        registry_id, identifiers, func, token_bucket if use_tokens else None
+    )
+    if identifiers.empty:
+        if result.partial:
+            logger.info(
+                f"Bucket exhausted for registry {registry_id}. Retry later."
+            )
+        logger.info(
+            f"There are no empty identifiers for registry {registry_id}."
+        )
+        return result
+
+    fetched, created = 0, 0
+    for records in record_batches:
+        batch_fetched, batch_created = update_identifier_versions(
+            registry_id, identifiers, records
+        )
+        fetched += batch_fetched
+        created += batch_created
+
+    result.partial = result.partial or fetched != len(identifiers)
+    if fetched == 0:
+        logger.info(f"No records correctly fetched for registry {registry_id}.")
+        return result
+    if created == 0:
+        return result
 
     logger.info(
-        f"Updated {len(new_versions)} new identifier versions "
+        f"Updated {created} new identifier versions "
         f"for registry {registry_id}"
     )
-    identifiers_fetched.send(
-        None, registry_id=registry_id, count=len(new_versions)
-    )
+    identifiers_fetched.send(None, registry_id=registry_id, count=created)
     result.data_modified = True
     return result
 
@@ -402,13 +611,14 @@ def refresh_identifier_records(
 def log_entity_requests(results: pd.DataFrame):
     """
     Log the request results in the `EntityRequest` table.
+    The requests that were not performed are not logged.
 
     :param results:     The DataFrame of API request results with appropriate
                         columns?
     """
     bulk_create_from_df(
         EntityRequest,
-        results,
+        performed_requests(results),
         [
             "entity_id",
             "type",
@@ -488,6 +698,10 @@ def entities_for_wikipedia_extract_update(
 def update_wikipedia_extract(use_tokens: bool = True) -> TaskResult:
     """
     Update the wikipedia extract of entities having a `wikipedia_url`.
+
+    The extracts are fetched according to the `WIKIPEDIA_EXTRACT_BACKEND`
+    setting: page by page with the REST API or by batches of titles with
+    the action API.
     """
     logger.info("Updating wikipedia extracts.")
     result = TaskResult(
@@ -495,7 +709,20 @@ def update_wikipedia_extract(use_tokens: bool = True) -> TaskResult:
     )
 
     entities = entities_for_wikipedia_extract_update()
-    if use_tokens:
+    if not entities.empty:
+        entities["wiki_page_title"] = entities["wikipedia_url"].apply(
+            lambda x: x.split("/")[-1]
+        )
+    batched = app_settings.WIKIPEDIA_EXTRACT_BACKEND == "query"
+    if use_tokens and batched:
+        # A token is consumed per batch of titles
+        titles = entities.drop_duplicates("wiki_page_title", ignore_index=True)
+        titles, result.partial = WIKIPEDIA_TOKEN_BUCKET.consume_for_df(
+            titles, rows_per_token=WIKIPEDIA_EXTRACTS_BATCH_SIZE
+        )
+        kept = [] if titles.empty else titles["wiki_page_title"]
+        entities = entities[entities["wiki_page_title"].isin(kept)].copy()
+    elif use_tokens:
         entities, result.partial = WIKIPEDIA_TOKEN_BUCKET.consume_for_df(
             entities
         )
@@ -503,14 +730,19 @@ def update_wikipedia_extract(use_tokens: bool = True) -> TaskResult:
         logger.info("No wikipedia extract to fetch.")
         return result
 
-    entities["wiki_page_title"] = entities["wikipedia_url"].apply(
-        lambda x: x.split("/")[-1]
-    )
-    results = asyncio.run(
-        fetch_wikipedia_page_extracts(
-            entities["wiki_page_title"].drop_duplicates()
+    titles = entities["wiki_page_title"].drop_duplicates()
+    if batched:
+        results = asyncio.run(fetch_wikipedia_extracts(titles))
+    else:
+        # The requests are conditional for the pages whose extract is
+        # stored by every entity referencing them.
+        no_extract = entities.loc[
+            entities["wikipedia_extract"].isna(), "wiki_page_title"
+        ]
+        validators = load_http_validators(
+            wikipedia_summary_url(t) for t in titles[~titles.isin(no_extract)]
         )
-    )
+        results = asyncio.run(fetch_wikipedia_page_extracts(titles, validators))
 
     # Log the request results
     e_requests = results.copy()
@@ -525,6 +757,7 @@ def update_wikipedia_extract(use_tokens: bool = True) -> TaskResult:
     e_requests["type"] = ENTITY_REQUEST_WIKIPEDIA_EXTRACT
     e_requests.rename(columns={"id": "entity_id"}, inplace=True)
     log_entity_requests(e_requests)
+    save_http_validators(results)
 
     extracts = results[~results["error"]]
     result.partial = result.partial or len(extracts) != len(results)
@@ -545,6 +778,17 @@ def update_wikipedia_extract(use_tokens: bool = True) -> TaskResult:
     )
     to_update = entities[mask].copy()
     now = timezone.now()
+
+    # The pages not modified since the last fetch are only marked as fetched
+    not_modified = entities["wiki_page_title"].isin(
+        results.loc[not_modified_results(results), "title"]
+    )
+    if not_modified.any():
+        fetched = entities.loc[not_modified, ["id"]].copy()
+        fetched["date_wikipedia_fetched"] = now
+        bulk_update_from_df(Entity, fetched, ["id", "date_wikipedia_fetched"])
+        logger.info(f"{len(fetched)} wikipedia descriptions not modified.")
+
     if not to_update.empty:
         to_update["date_last_updated"] = now
         to_update["date_wikipedia_fetched"] = now
@@ -622,18 +866,30 @@ def update_null_logo_url(date_update: datetime | None):
 
 
 def update_entity_logo_file(row: pd.Series):
-    """"""
+    """
+    Store the downloaded logo file of the entity, from its temporary file.
+    """
     e: Entity = row["entity"]
     url = row.get("info", row["url"])
     date_update = row["date_last_updated"]
     file_name = unquote(url.split("/")[-1])
-    file_content: bytes = row["file_bytes"]
     # Delete existing file, if any
     if e.logo:
         e.logo.delete(save=True)
-    e.logo = ImageFile(io.BytesIO(file_content), name=file_name)
-    e.date_logo_fetched = date_update
-    e.save()
+    with open(row["file_path"], "rb") as f:
+        e.logo = ImageFile(f, name=file_name)
+        e.date_logo_fetched = date_update
+        e.save()
+
+
+def delete_downloaded_files(results: pd.DataFrame):
+    """
+    Delete the temporary files of the given file download results.
+    """
+    if "file_path" not in results.columns:
+        return
+    for path in results["file_path"].dropna():
+        Path(path).unlink(missing_ok=True)
 
 
 def update_logos(
@@ -663,36 +919,83 @@ def update_logos(
         df, result.partial = WIKIMEDIA_TOKEN_BUCKET.consume_for_df(df)
 
     date_update = date_update if date_update is not None else timezone.now()
-    updates = 0
-    for chunk in chunk_df(df, 20):
-        # The discard of duplicates should occur before chunking...
-        # There is usually no duplicates in this task.
-        logo_results = asyncio.run(
-            fetch_wikimedia_files(chunk["logo_url"].drop_duplicates())
-        )
-        chunk = chunk.merge(
-            logo_results, left_on="logo_url", right_on="url", how="left"
-        )
-
-        # Log the requests
-        logs = chunk.copy()
-        no_res = logs["error"].isna()
-        logs["type"] = ENTITY_REQUEST_WIKIMEDIA_LOGO
-        logs.loc[no_res, "error"] = True
-        logs.loc[no_res, "error_msg"] = "No query was performed."
-        logs.rename(columns={"id": "entity_id"}, inplace=True)
-        log_entity_requests(logs)
-
-        # Process results
-        chunk = chunk[~chunk["error"]]
-        if chunk.empty:
-            continue
-        chunk["entity"] = chunk["id"].map(entity_mapping)
-        chunk["date_last_updated"] = date_update
-        chunk.apply(update_entity_logo_file, axis=1)
-        updates += len(chunk)
-
-    result.partial = result.partial or updates != len(df)
+    updates, unchanged = 0, 0
+    urls = [] if df.empty else df["logo_url"].drop_duplicates()
+    # The requests are conditional for the URLs whose file is stored by
+    # every entity referencing them.
+    no_logo = {e.logo_url for e in instances if not e.logo}
+    validators = load_http_validators(u for u in urls if u not in no_logo)
+    # The files are streamed to temporary files and stored by micro-batches
+    # while the next ones are being downloaded, only the file paths and
+    # metadata go through the dataframes.
+    # The files of the batches not processed yet are deleted when the
+    # iteration is interrupted.
+    with closing(
+        iter_wikimedia_files(urls, batch_size=20, validators=validators)
+    ) as logo_batches:
+        for logo_results in logo_batches:
+            try:
+                u, n = store_logo_results(
+                    df, logo_results, entity_mapping, date_update
+                )
+            finally:
+                delete_downloaded_files(logo_results)
+            updates += u
+            unchanged += n
+
+    result.partial = result.partial or updates + unchanged != len(df)
     result.data_modified = updates > 0
-    logger.info(f"Downloaded {updates} entity logo files.")
+    logger.info(
+        f"Downloaded {updates} entity logo files, {unchanged} not modified."
+    )
     return result
+
+
+def store_logo_results(
+    df: pd.DataFrame,
+    logo_results: pd.DataFrame,
+    entity_mapping: dict[str, Entity],
+    date_update: datetime,
+) -> tuple[int, int]:
+    """
+    Log the requests of a micro-batch of logo downloads and store the
+    downloaded files.
+    Return the number of updated logos and of unchanged ones.
+
+    :param df:              The entities' logo URLs, `id` and `logo_url`.
+    :param logo_results:    The download results, see `iter_wikimedia_files`.
+    :param entity_mapping:  The Entity instances by ID.
+    :param date_update:     The date of the update.
+    """
+    chunk = df[df["logo_url"].isin(logo_results["url"])]
+    chunk = chunk.merge(
+        logo_results, left_on="logo_url", right_on="url", how="left"
+    )
+
+    # Log the requests
+    logs = chunk.copy()
+    no_res = logs["error"].isna()
+    logs["type"] = ENTITY_REQUEST_WIKIMEDIA_LOGO
+    logs.loc[no_res, "error"] = True
+    logs.loc[no_res, "error_msg"] = "No query was performed."
+    logs.rename(columns={"id": "entity_id"}, inplace=True)
+    log_entity_requests(logs)
+    save_http_validators(logo_results)
+
+    # Process results
+    chunk = chunk[~chunk["error"]]
+    # The files not modified since the last fetch are kept as is
+    not_modified = not_modified_results(chunk)
+    unchanged = 0
+    if not_modified.any():
+        fetched = chunk.loc[not_modified, ["id"]].copy()
+        fetched["date_logo_fetched"] = date_update
+        bulk_update_from_df(Entity, fetched, ["id", "date_logo_fetched"])
+        unchanged = len(fetched)
+    chunk = chunk[~not_modified]
+    if chunk.empty:
+        return 0, unchanged
+    chunk["entity"] = chunk["id"].map(entity_mapping)
+    chunk["date_last_updated"] = date_update
+    chunk.apply(update_entity_logo_file, axis=1)
+    return len(chunk), unchanged
@@ -7,12 +7,15 @@ from datetime import UTC, date, datetime
 
 import pandas as pd
 from django.db import transaction
-from django.db.models import Count, F
+from django.db.models import Count, F, Max, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 from tsosi.app_settings import app_settings
 from tsosi.data.db_utils import (
     IDENTIFIER_CREATE_FIELDS,
     IDENTIFIER_MATCHING_CREATE_FIELDS,
+    INSERT_CHUNK_SIZE,
+    LOOKUP_CHUNK_SIZE,
     bulk_create_from_df,
     bulk_update_from_df,
 )
@@ -26,7 +29,7 @@ from tsosi.data.pid_registry.wikidata import WIKIDATA_EXTRACT_MAPPING
 from tsosi.data.preparation.cleaning_utils import clean_cell_value, clean_url
 from tsosi.data.signals import identifiers_created
 from tsosi.data.task_result import TaskResult
-from tsosi.data.utils import clean_null_values
+from tsosi.data.utils import chunk_sequence, clean_null_values
 from tsosi.models import (
     DataLoadSource,
     Entity,
@@ -35,6 +38,7 @@ from tsosi.models import (
     IdentifierEntityMatching,
     IdentifierVersion,
     Transfer,
+    Watermark,
 )
 from tsosi.models.date import DATE_PRECISION_YEAR, Date
 from tsosi.models.identifier import (
@@ -55,6 +59,38 @@ from .merging import merge_entities
 logger = logging.getLogger(__name__)
 
 
+def existing_identifier_relations(
+    registry_id: str, identifier_values: list[str], entity_ids: list[str]
+) -> pd.DataFrame:
+    """
+    Return the existing (PID value, Entity) relations of the given registry
+    involving any of the given identifier values or entities.
+    The result is indexed by `identifier_id`.
+
+    :param registry_id:         The ID of the considered PID registry.
+    :param identifier_values:   The PID values to look for.
+    :param entity_ids:          The entity IDs to look for.
+    """
+    columns = ["id", "value", "entity_id"]
+    queryset = Identifier.objects.filter(registry_id=registry_id)
+    records = []
+    for chunk in chunk_sequence(identifier_values, LOOKUP_CHUNK_SIZE):
+        records.extend(queryset.filter(value__in=chunk).values(*columns))
+    for chunk in chunk_sequence(entity_ids, LOOKUP_CHUNK_SIZE):
+        records.extend(queryset.filter(entity_id__in=chunk).values(*columns))
+
+    existing_relations = (
+        pd.DataFrame.from_records(records, columns=columns)
+        .drop_duplicates(subset="id")
+        .rename(columns={"value": "identifier_value", "id": "identifier_id"})
+        .set_index("identifier_id")
+    )
+    existing_relations["entity_id"] = existing_relations["entity_id"].astype(
+        "string"
+    )
+    return existing_relations
+
+
 @transaction.atomic
 def ingest_entity_identifier_relations(
     data: pd.DataFrame, registry_id: str, date_update: datetime
@@ -65,8 +101,9 @@ def ingest_entity_identifier_relations(
     0 - Drop duplicates tuples (PID, entity) in input.
         Check coherency for duplicated entities.
 
-    1 - Get the existing (PID value, Entity) relations & drop duplicated
-        tuples (PID, entity) between input & existing
+    1 - Get the existing (PID value, Entity) relations involving the input
+        PIDs or entities & drop duplicated tuples (PID, entity) between
+        input & existing
 
     2 - Get duplicated entities between input & mapping. Detach the existing
         relations for those entities (a new one will be created).
@@ -128,19 +165,12 @@ def ingest_entity_identifier_relations(
         f"Ingesting {len(new_relations)} Identifier <-> Entity relations."
     )
 
-    # 1 -   Retrieve the existing (PID -> Entity) relations. Drop the input
-    #       relations that already exist.
-    columns = ["id", "value", "entity_id"]
-    ex_identifiers = Identifier.objects.filter(registry__id=registry_id).values(
-        *columns
-    )
-    existing_relations = (
-        pd.DataFrame.from_records(ex_identifiers, columns=columns)
-        .rename(columns={"value": "identifier_value", "id": "identifier_id"})
-        .set_index("identifier_id")
-    )
-    existing_relations["entity_id"] = existing_relations["entity_id"].astype(
-        "string"
+    # 1 -   Retrieve the existing (PID -> Entity) relations of the input PIDs
+    #       and entities. Drop the input relations that already exist.
+    existing_relations = existing_identifier_relations(
+        registry_id,
+        new_relations["identifier_value"].unique().tolist(),
+        new_relations["entity_id"].dropna().unique().tolist(),
     )
     existing_relations["relation"] = list(
         zip(
@@ -544,36 +574,70 @@ def update_entities_relationships(
     Update the parent relationships of entities based on ROR parents IDs.
     Add or remove parents to match the given ROR parents IDs.
     If parent ror id is not in our db, skip it.
+
+    The desired (child, parent) edges are diffed against the existing rows
+    of the `Entity.parents` through table, then the missing edges are
+    inserted and the obsolete ones deleted in bulk.
     """
-    ror_ids = [
+    if not entity_id_to_parents_ror_ids:
+        return
+    ror_ids = {
         ror_id
         for row in entity_id_to_parents_ror_ids.values()
         if row
         for ror_id in row
-    ]
-    identifiers = Identifier.objects.filter(
-        registry_id=REGISTRY_ROR, value__in=ror_ids
+    }
+    ror_id_to_entity_id = dict(
+        Identifier.objects.filter(
+            registry_id=REGISTRY_ROR, value__in=ror_ids, entity__isnull=False
+        ).values_list("value", "entity_id")
     )
-    ror_id_to_entity = {
-        identifier.value: identifier.entity for identifier in identifiers
+
+    new_edges = {
+        (str(entity_id), str(ror_id_to_entity_id[ror_id]))
+        for entity_id, parents_ror_ids in entity_id_to_parents_ror_ids.items()
+        if parents_ror_ids
+        for ror_id in parents_ror_ids
+        if ror_id in ror_id_to_entity_id
     }
-    entities = Entity.objects.filter(id__in=entity_id_to_parents_ror_ids.keys())
-    id_to_entity = {entity.id: entity for entity in entities}
-    for entity_id, parents_ror_id in entity_id_to_parents_ror_ids.items():
-        if parents_ror_id is None:
-            parents_ror_id = []
-        entity = id_to_entity[entity_id]
-        entity_new_parents_ids = {
-            ror_id_to_entity[ror_id].id
-            for ror_id in parents_ror_id
-            if ror_id in ror_id_to_entity
+
+    through = Entity.parents.through
+    existing_edges = {
+        (str(child_id), str(parent_id)): edge_id
+        for edge_id, child_id, parent_id in through.objects.filter(
+            from_entity_id__in=entity_id_to_parents_ror_ids.keys()
+        ).values_list("id", "from_entity_id", "to_entity_id")
+    }
+
+    deleted_edges = {
+        edge: edge_id
+        for edge, edge_id in existing_edges.items()
+        if edge not in new_edges
+    }
+    to_delete = list(deleted_edges.values())
+    if to_delete:
+        through.objects.filter(id__in=to_delete).delete()
+
+    created_edges = [e for e in new_edges if e not in existing_edges]
+    to_create = [
+        through(from_entity_id=child_id, to_entity_id=parent_id)
+        for child_id, parent_id in created_edges
+    ]
+    if to_create:
+        through.objects.bulk_create(to_create, batch_size=INSERT_CHUNK_SIZE)
+
+    if to_delete or to_create:
+        # The children whose parents changed are flagged as updated.
+        children = {
+            child_id for child_id, _ in [*deleted_edges, *created_edges]
         }
-        entity_old_parents_ids = set(p.id for p in entity.parents.all())
-        for entity_id in entity_new_parents_ids - entity_old_parents_ids:
-            entity.parents.add(entity_id)
-        for entity_id in entity_old_parents_ids - entity_new_parents_ids:
-            entity.parents.remove(entity_id)
-        entity.save()
+        Entity.objects.filter(id__in=children).update(
+            date_last_updated=timezone.now()
+        )
+        logger.info(
+            f"Updated entity relationships: {len(to_create)} parent links "
+            f"created, {len(to_delete)} removed."
+        )
 
 
 def new_identifiers_from_records(registry_id: str) -> TaskResult:
@@ -677,6 +741,7 @@ def update_transfer_date_clc():
         "date_payment_recipient",
         "date_payment_emitter",
         "date_start",
+        "date_clc",
     )
     if len(instances) == 0:
         logger.info("No transfer to update CLC date for.")
@@ -694,7 +759,7 @@ def update_transfer_date_clc():
         return new_date.serialize()
 
     data["date_start"] = data["date_start"].apply(update_date_start)
-    data["date_clc"] = (
+    data["new_date_clc"] = (
         data[
             [
                 "date_payment_recipient",
@@ -706,6 +771,16 @@ def update_transfer_date_clc():
         .bfill(axis=1)
         .iloc[:, 0]
     )
+    # Only update the transfers whose CLC date changed
+    changed = [
+        new != old for new, old in zip(data["new_date_clc"], data["date_clc"])
+    ]
+    data = data.loc[pd.Series(changed, index=data.index, dtype=bool)].copy()
+    if data.empty:
+        logger.info("No transfer CLC date to update.")
+        return
+
+    data["date_clc"] = data["new_date_clc"]
     data["date_last_updated"] = timezone.now()
     columns = ["id", "date_clc", "date_last_updated"]
     bulk_update_from_df(Transfer, data, columns)
@@ -846,15 +921,39 @@ def update_transfer_status_clc():
     logger.info(f"Updated {len(data_to_update)} Transfer's is_future status.")
 
 
-def identifier_versions_for_cleaning() -> pd.DataFrame:
-    """ """
-    queryset = IdentifierVersion.objects.select_related("identifier").values(
-        "id",
-        "identifier_id",
-        "value",
-        "date_start",
-        "date_end",
-        registry_id=F("identifier__registry_id"),
+CLEANING_WATERMARK = "identifier_versions_cleaning"
+
+
+def identifier_versions_for_cleaning(
+    since_version_id: int | None = None,
+) -> pd.DataFrame:
+    """
+    Return the identifier versions to analyze for cleaning, without their
+    JSON value, only their content hash.
+
+    :param since_version_id:    When given, only the identifiers with a
+                                version more recent than this one are
+                                selected, and only their last two versions
+                                are returned.
+    """
+    queryset = IdentifierVersion.objects.all()
+    if since_version_id is not None:
+        identifier_ids = IdentifierVersion.objects.filter(
+            id__gt=since_version_id
+        ).values("identifier_id")
+        queryset = (
+            queryset.filter(identifier_id__in=identifier_ids)
+            .annotate(
+                _rank=Window(
+                    RowNumber(),
+                    partition_by=F("identifier_id"),
+                    order_by=F("date_start").desc(),
+                )
+            )
+            .filter(_rank__lte=2)
+        )
+    queryset = queryset.values(
+        "id", "identifier_id", "content_hash", "date_start", "date_end"
     )
 
     data = pd.DataFrame.from_records(queryset)
@@ -870,34 +969,44 @@ def identifier_versions_for_cleaning() -> pd.DataFrame:
     return data
 
 
-def clean_identifier_versions():
+@transaction.atomic
+def clean_identifier_versions(full: bool = False):
     """
     Analyze and clean multiple versions of the same identifier.
     Versions without significant change w/ the previous one should be discarded.
+
+    The cleaning is incremental: only the identifiers with a version created
+    since the last run are analyzed, by comparing their last two versions.
+    The first run, or a run with `full=True`, analyzes every version.
+
+    :param full:    Whether to analyze all versions of every identifier.
     """
-    data = identifier_versions_for_cleaning()
+    max_version_id = IdentifierVersion.objects.aggregate(max_id=Max("id"))[
+        "max_id"
+    ]
+    since_version_id = None
+    if not full:
+        since_version_id = Watermark.get_value(CLEANING_WATERMARK)
+    data = identifier_versions_for_cleaning(since_version_id)
+    if max_version_id is not None:
+        Watermark.set_value(CLEANING_WATERMARK, max_version_id)
     if data.empty:
         logger.info("No identifier versions to process.")
         return
 
-    # Extract useful data from ROR records.
-    # Wikidata records are already processed when queried.
-    ror_mask = data["registry_id"] == REGISTRY_ROR
-    data.loc[ror_mask.index, "value"] = data[ror_mask]["value"].apply(
-        ror_record_extractor
-    )
-
     # Sort versions by date to compute diff between successive versions
     data = data.sort_values(["identifier_id", "date_start"])
     data: pd.DataFrame = pd.concat(
         [
             data,
-            data[["identifier_id", "value"]].add_prefix("_next_").shift(-1),
+            data[["identifier_id", "content_hash"]]
+            .add_prefix("_next_")
+            .shift(-1),
         ],
         axis=1,
     )
 
-    data["_value_same"] = data["value"].eq(data["_next_value"])
+    data["_value_same"] = data["content_hash"].eq(data["_next_content_hash"])
     # Whether the next row should be merged with the current one
     data["_merge_next"] = (
         data["identifier_id"] == data["_next_identifier_id"]
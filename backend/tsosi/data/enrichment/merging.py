@@ -3,7 +3,11 @@ from datetime import datetime
 
 import pandas as pd
 from django.db import transaction
-from tsosi.data.db_utils import bulk_create_from_df, bulk_update_from_df
+from tsosi.data.db_utils import (
+    bulk_create_from_df,
+    bulk_update_fk_from_mapping,
+    bulk_update_from_df,
+)
 from tsosi.data.exceptions import DataException
 from tsosi.models import Entity, Identifier, IdentifierEntityMatching, Transfer
 from tsosi.models.transfer import MATCH_CRITERIA_MERGED, TRANSFER_ENTITY_TYPES
@@ -187,30 +191,19 @@ def merge_entities(
     m_entities["date_last_updated"] = date_update
     bulk_update_from_df(Entity, m_entities, m_entities.columns.to_list())
 
-    # 4 - Update all transfers referencing these entities
+    # 4 - Update all transfers referencing these entities, with one
+    #     UPDATE ... FROM statement per entity type.
+    entity_mapping = dict(zip(e_to_update["id"], e_to_update["merged_with_id"]))
     for e_type in TRANSFER_ENTITY_TYPES:
-        count = 0
         if e_type != "agent":
-            for entity in e_to_update.itertuples():
-                count += Transfer.objects.filter(
-                    **{f"{e_type}_id": entity.id}
-                ).update(
-                    **{
-                        f"{e_type}_id": entity.merged_with_id,
-                        "date_last_updated": date_update,
-                    }
-                )
+            count = bulk_update_fk_from_mapping(
+                Transfer,
+                e_type,
+                entity_mapping,
+                extra_values={"date_last_updated": date_update},
+            )
         else:
-            through = Transfer.agents.through
-            for entity in e_to_update.itertuples():
-                through.objects.filter(entity_id=entity.id).update(
-                    entity_id=entity.merged_with_id,
-                )
-                count += Transfer.objects.filter(
-                    agents__id=entity.merged_with_id
-                ).update(
-                    date_last_updated=date_update,
-                )
+            count = repoint_transfer_agents(entity_mapping, date_update)
 
         if count:
             logger.info(
@@ -218,3 +211,49 @@ def merge_entities(
             )
 
     logger.info(f"Successfully merged {len(to_merge)} entities.")
+
+
+def repoint_transfer_agents(
+    entity_mapping: dict[str, str], date_update: datetime
+) -> int:
+    """
+    Re-point the transfer agents according to the given entity mapping.
+    The through rows that would end up duplicated, ie. the transfer already
+    references the target entity as an agent, are deleted beforehand.
+
+    :param entity_mapping:  The mapping {merged entity ID: target entity ID}
+    :param date_update:     The datetime object to use as the update date.
+    :returns:               The number of updated Transfer records.
+    """
+    through = Transfer.agents.through
+    rows = through.objects.filter(
+        entity_id__in=[*entity_mapping.keys(), *entity_mapping.values()]
+    ).values_list("id", "transfer_id", "entity_id")
+    # Process the rows already referencing a target entity first so that
+    # they are the ones kept.
+    rows = sorted(
+        [(id, t_id, str(e_id)) for id, t_id, e_id in rows],
+        key=lambda r: r[2] in entity_mapping,
+    )
+    kept_relations = set()
+    to_delete = []
+    transfer_ids = set()
+    for id, transfer_id, entity_id in rows:
+        if entity_id not in entity_mapping:
+            kept_relations.add((transfer_id, entity_id))
+            continue
+        transfer_ids.add(transfer_id)
+        relation = (transfer_id, entity_mapping[entity_id])
+        if relation in kept_relations:
+            to_delete.append(id)
+        else:
+            kept_relations.add(relation)
+
+    if not transfer_ids:
+        return 0
+    if to_delete:
+        through.objects.filter(id__in=to_delete).delete()
+    bulk_update_fk_from_mapping(through, "entity", entity_mapping)
+    return Transfer.objects.filter(id__in=transfer_ids).update(
+        date_last_updated=date_update
+    )
@@ -8,6 +8,7 @@ from openpyxl import Workbook
 from openpyxl.styles import Border, Side
 from openpyxl.utils.dataframe import dataframe_to_rows
 from tsosi.app_settings import app_settings
+from tsosi.data.currencies.conversion import transfer_amounts
 from tsosi.data.exceptions import DataException
 from tsosi.models import Currency, DataLoadSource, Transfer
 from tsosi.models.date import (
@@ -166,18 +167,13 @@ def transfer_is_matching(
     elif transfer_left.currency.id == transfer_right.currency.id:
         if not np.isclose(transfer_left.amount, transfer_right.amount):
             return False, CRITERIA_AMOUNT
-    elif (
-        transfer_right.amounts_clc
-        and transfer_left.currency.id in transfer_right.amounts_clc
-    ):
-        if not np.isclose(
-            transfer_left.amount,
-            transfer_right.amounts_clc[transfer_left.currency.id],
-            atol=0.1,
+    else:
+        amounts_right = transfer_amounts(transfer_right) or {}
+        amount_right = amounts_right.get(transfer_left.currency.id)
+        if amount_right is None or not np.isclose(
+            transfer_left.amount, amount_right, atol=0.1
         ):
             return False, CRITERIA_AMOUNT
-    else:
-        return False, CRITERIA_AMOUNT
 
     return True, None
 
@@ -1,8 +1,7 @@
-import asyncio
 import logging
 
 import pandas as pd
-from tsosi.data.pid_registry.ror import match_ror_records
+from tsosi.data.pid_registry.ror_affiliation import match_affiliations
 from tsosi.models import Entity
 from tsosi.models.static_data import REGISTRY_ROR
 from tsosi.models.transfer import (
@@ -46,7 +45,9 @@ def prepare_manual_matching(
     limit: int | None = None,
 ) -> pd.DataFrame:
     """
-    Enrich the given data with the results of the ROR affiliation API.
+    Enrich the given data with the results of the ROR affiliation matching,
+    performed against the local ROR dump and the ROR affiliation API
+    (see `match_affiliations`).
     The following columns holding the affiliation matching result are added
     after the given `name_column`:
         - `_ror_matched_id`
@@ -87,13 +88,14 @@ def prepare_manual_matching(
     )
     if len(df) != len(df_match):
         print(
-            f"Performing {len(df_match)} affiliation requests "
+            f"Performing {len(df_match)} affiliation matchings "
             f"out of {len(df)} inputs."
         )
 
     # Get ror affiliation matching
-    ror_results = asyncio.run(
-        match_ror_records(df_match["__name_clean"], df_match["__country_clean"])
+    ror_results = match_affiliations(
+        df_match["__name_clean"].to_list(),
+        df_match["__country_clean"].to_list(),
     )
     result = pd.concat(
         [df_match.reset_index(drop=True), ror_results.reset_index(drop=True)],
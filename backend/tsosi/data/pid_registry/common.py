@@ -1,18 +1,60 @@
 import asyncio
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Callable, Sequence
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Callable, Iterable, Iterator, Sequence
+from urllib.parse import urlparse
 
 import aiohttp
 import pandas as pd
+from tsosi.data import api_metrics
+
+logger = logging.getLogger(__name__)
 
 TSOSI_USER_AGENT = "TSOSI-python-bot/0.1 (contact@tsosi.org)"
+# Default number of results per micro-batch of `iter_http_func_batch`
+STREAM_BATCH_SIZE = 100
+# Maximum number of micro-batches waiting to be processed by the caller
+STREAM_QUEUE_SIZE = 2
+
+
+# HTTP statuses of transient errors, the requests are retried
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Maximum number of retries of a request
+RETRY_MAX = 3
+# Base and maximum delays, in seconds, of the exponential backoff
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 60
+# Number of consecutive failures of a host before opening its circuit
+CIRCUIT_FAILURE_THRESHOLD = 10
+# Number of seconds before trying a request to a host with an open circuit
+CIRCUIT_RESET_SECONDS = 120
 
 
 class HTTPStatusError(Exception):
     pass
 
 
+class InvalidFileError(Exception):
+    """
+    The downloaded file is rejected, ex: too large or of an unexpected
+    content type.
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    The request was not performed because the circuit of the host is open.
+    """
+
+
 @dataclass(kw_only=True)
 class ApiResult:
     info: str | None = None
@@ -20,6 +62,285 @@ class ApiResult:
     timestamp: datetime | None = None
     error: bool = False
     error_msg: str | None = None
+    # The request was not performed, ex: the circuit of the host is open.
+    # Such results are not logged as requests.
+    skipped: bool = False
+    # Validators of the fetched resource, see `HttpValidators`
+    etag: str | None = None
+    last_modified: str | None = None
+    content_length: int | None = None
+    # The resource is unchanged since the last fetch, its content was not
+    # transferred nor processed.
+    not_modified: bool = False
+
+
+@dataclass
+class HttpValidators:
+    """
+    Validators of an HTTP resource, used to perform conditional requests.
+    """
+
+    etag: str | None = None
+    last_modified: str | None = None
+    content_length: int | None = None
+
+    @classmethod
+    def from_response(
+        cls, response: aiohttp.ClientResponse
+    ) -> "HttpValidators":
+        length = response.headers.get("Content-Length")
+        return cls(
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            content_length=int(length) if length and length.isdigit() else None,
+        )
+
+    def request_headers(self) -> dict[str, str]:
+        """
+        Return the headers of a conditional request for the resource.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def match(self, other: "HttpValidators") -> bool:
+        """
+        Whether the given validators denote the same version of the
+        resource. Used for the servers ignoring conditional requests: the
+        ETags are compared when available, the last modification date and
+        the content length otherwise.
+        """
+        if self.etag and other.etag:
+            return self.etag == other.etag
+        return (
+            self.last_modified is not None
+            and self.content_length is not None
+            and self.last_modified == other.last_modified
+            and self.content_length == other.content_length
+        )
+
+
+def record_validators(
+    result: ApiResult,
+    response: aiohttp.ClientResponse,
+    validators: HttpValidators | None = None,
+) -> bool:
+    """
+    Store the validators of the response in the result and flag whether the
+    resource is unchanged compared to the given stored validators: the
+    response status is 304 or the validators match.
+
+    :param result:      The result of the request.
+    :param response:    The response of the, possibly conditional, request.
+    :param validators:  The validators stored from the last fetch.
+    :returns:           Whether the resource is unchanged.
+    """
+    current = HttpValidators.from_response(response)
+    if response.status == 304:
+        result.not_modified = True
+        # A 304 response may omit the validators
+        if validators is not None:
+            current.etag = current.etag or validators.etag
+            current.last_modified = (
+                current.last_modified or validators.last_modified
+            )
+            current.content_length = validators.content_length
+    elif validators is not None and 200 <= response.status < 300:
+        result.not_modified = validators.match(current)
+    result.etag = current.etag
+    result.last_modified = current.last_modified
+    result.content_length = current.content_length
+    return result.not_modified
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of the requests to a host.
+
+    The circuit opens after `CIRCUIT_FAILURE_THRESHOLD` consecutive failed
+    requests (transient HTTP errors or connection errors): the requests
+    fail immediately with a `CircuitOpenError`. After
+    `CIRCUIT_RESET_SECONDS`, a single trial request is let through: the
+    circuit closes if it succeeds and re-opens if it fails. A trial ending
+    without a response or a connection error, ex: cancelled, lets the next
+    request through as the new trial.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def check(self) -> bool:
+        """
+        Raise a `CircuitOpenError` if the request must not be performed.
+
+        :returns:   Whether the request is the trial request, see
+                    `end_trial`.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < CIRCUIT_RESET_SECONDS or self.trial:
+                raise CircuitOpenError(
+                    f"Circuit open for host {self.host}, the host failed "
+                    f"{self.failures} consecutive requests."
+                )
+            self.trial = True
+            return True
+
+    def end_trial(self):
+        """
+        Release the trial of a request that ended without recording its
+        success or failure.
+        """
+        with self.lock:
+            self.trial = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+                if self.opened_at is None or self.trial:
+                    logger.warning(f"Opening the circuit of host {self.host}.")
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(url: str) -> CircuitBreaker:
+    """
+    Return the circuit breaker of the host of the given URL, shared by the
+    whole process.
+    """
+    host = urlparse(url).netloc
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker(host)
+        return _circuit_breakers[host]
+
+
+def response_size(response: aiohttp.ClientResponse) -> int | None:
+    """
+    Return the size of the response body announced by its `Content-Length`
+    header.
+    """
+    try:
+        return int(response.headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    """
+    Return the delay in seconds before retrying a request.
+
+    The `Retry-After` header, in seconds or as an HTTP date, is honored
+    when provided. Otherwise the delay grows exponentially with the
+    attempt number, with full jitter.
+
+    :param attempt:     The number of the failed attempt, starting at 0.
+    :param retry_after: The `Retry-After` header of the failed response.
+    """
+    if retry_after is not None:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                date = parsedate_to_datetime(retry_after)
+                delay = (date - datetime.now(UTC)).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), RETRY_MAX_DELAY)
+    return random.uniform(
+        0, min(RETRY_BASE_DELAY * 2**attempt, RETRY_MAX_DELAY)
+    )
+
+
+@asynccontextmanager
+async def http_request(
+    session: aiohttp.ClientSession,
+    method: str,
+    url: str,
+    max_retries: int = RETRY_MAX,
+    **kwargs,
+) -> AsyncIterator[aiohttp.ClientResponse]:
+    """
+    Perform an HTTP request with retries, to be used as a context manager
+    like `session.get`.
+
+    The requests failing with a transient HTTP status (`RETRY_STATUSES`)
+    or a connection error are retried with an exponential backoff, see
+    `retry_delay`. The response of the last attempt is returned whatever
+    its status.
+    The requests go through the circuit breaker of the host, a
+    `CircuitOpenError` is raised when the circuit is open.
+
+    :param session:     The aiohttp ClientSession object.
+    :param method:      The HTTP method, ex: `get`.
+    :param url:         The request URL.
+    :param max_retries: The maximum number of retries.
+    :param kwargs:      The arguments of the session's request method.
+    """
+    breaker = circuit_breaker(url)
+    request = getattr(session, method)
+    for attempt in range(max_retries + 1):
+        trial = breaker.check()
+        retry_after = None
+        yielded = False
+        start = time.monotonic()
+        try:
+            async with request(url, **kwargs) as response:
+                api_metrics.record_request(
+                    url,
+                    response.status,
+                    time.monotonic() - start,
+                    response_size(response),
+                )
+                if response.status in RETRY_STATUSES:
+                    breaker.record_failure()
+                    retry_after = response.headers.get("Retry-After")
+                else:
+                    breaker.record_success()
+                trial = False
+                if (
+                    response.status not in RETRY_STATUSES
+                    or attempt == max_retries
+                ):
+                    yielded = True
+                    yield response
+                    return
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if yielded:
+                raise
+            api_metrics.record_request(url, None, time.monotonic() - start)
+            breaker.record_failure()
+            trial = False
+            if attempt == max_retries:
+                raise
+        finally:
+            # Cancelled or failed with another error
+            if trial:
+                breaker.end_trial()
+        delay = retry_delay(attempt, retry_after)
+        logger.info(f"Retrying request {url} in {delay:.1f}s.")
+        await asyncio.sleep(delay)
 
 
 async def perform_http_func_batch[
@@ -42,14 +363,297 @@ async def perform_http_func_batch[
                         HTTP connections.
     :returns:           The results of the `func` call for every item.
     """
+    async with http_session(max_conns) as session:
+        tasks = [func(session, item) for item in data]
+        results = await asyncio.gather(*tasks)
+
+    return results
+
+
+def http_session(max_conns: int) -> aiohttp.ClientSession:
+    """
+    Return the async client session used to perform the HTTP calls.
+
+    :param max_conns:   The maximum number of simultaneously opened
+                        HTTP connections.
+    """
     headers = {"User-Agent": TSOSI_USER_AGENT}
     timeout = aiohttp.ClientTimeout(sock_connect=5)
     # Limit the number of simultaneously opened connections
     conn = aiohttp.TCPConnector(limit=max_conns)
-    async with aiohttp.ClientSession(
+    return aiohttp.ClientSession(
         connector=conn, timeout=timeout, headers=headers
-    ) as session:
-        tasks = [func(session, item) for item in data]
-        results = await asyncio.gather(*tasks)
+    )
 
-    return results
+
+async def stream_http_func_batch[
+    T, P
+](
+    data: Iterable[T],
+    func: Callable[[aiohttp.ClientSession, T], P],
+    max_conns: int = 30,
+) -> AsyncIterator[P]:
+    """
+    Streaming version of `perform_http_func_batch`: the results are yielded
+    as they complete, not in the order of the data items.
+
+    A semaphore limits the number of calls in flight to `max_conns`, the
+    next data item is only started when a call completes. The memory used
+    is thus bounded whatever the number of data items.
+
+    :param data:        The iterable of items for which `func` must be
+                        applied.
+    :param func:        The function to be applied for every data item.
+                        It must take as arguments an `aiohttp.ClientSession`
+                        and a data item.
+    :param max_conns:   The maximum number of simultaneous calls.
+    """
+    semaphore = asyncio.Semaphore(max_conns)
+    pending: set[asyncio.Task] = set()
+    async with http_session(max_conns) as session:
+        try:
+            for item in data:
+                await semaphore.acquire()
+                for task in [t for t in pending if t.done()]:
+                    pending.discard(task)
+                    yield task.result()
+                task = asyncio.create_task(func(session, item))
+                task.add_done_callback(lambda _: semaphore.release())
+                pending.add(task)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def iter_http_func_batch[
+    T, P
+](
+    data: Iterable[T],
+    func: Callable[[aiohttp.ClientSession, T], P],
+    max_conns: int = 30,
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> Iterator[list[P]]:
+    """
+    Synchronous version of `stream_http_func_batch` yielding the results
+    by micro-batches, so that the caller can process them, ex: persist
+    them, while the next calls are in flight.
+
+    :param data:        The iterable of items for which `func` must be
+                        applied.
+    :param func:        The function to be applied for every data item.
+                        It must take as arguments an `aiohttp.ClientSession`
+                        and a data item.
+    :param max_conns:   The maximum number of simultaneous calls.
+    :param batch_size:  The maximum number of results per micro-batch.
+    """
+    return iter_async_batches(
+        lambda: stream_http_func_batch(data, func, max_conns), batch_size
+    )
+
+
+def iter_async_batches[
+    P
+](
+    stream: Callable[[], AsyncIterator[P]],
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> Iterator[list[P]]:
+    """
+    Iterate synchronously over the results of the given async iterator,
+    by micro-batches.
+
+    The event loop runs in a separate thread and passes the micro-batches
+    through a bounded queue: the calls are paused while the caller lags
+    behind.
+
+    :param stream:      The function returning the async iterator, called
+                        in the event loop.
+    :param batch_size:  The maximum number of results per micro-batch.
+    """
+    batches = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    async def produce():
+        batch = []
+        async for result in stream():
+            batch.append(result)
+            if len(batch) >= batch_size:
+                await asyncio.to_thread(put, batch)
+                batch = []
+            if stop.is_set():
+                return
+        if batch:
+            put(batch)
+
+    def run():
+        try:
+            asyncio.run(produce())
+        except Exception as e:
+            put(e)
+        else:
+            put(end)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+# Bounds of the adaptive chunk size and concurrency
+ADAPTIVE_MAX_CHUNK_SIZE = 200
+ADAPTIVE_MAX_CONCURRENCY = 10
+# Latencies, in seconds, below which the chunks grow and above which
+# they shrink
+ADAPTIVE_FAST_LATENCY = 5
+ADAPTIVE_SLOW_LATENCY = 20
+
+
+@dataclass
+class AdaptiveBatcher:
+    """
+    Chunk size and concurrency of chunked requests adapted to the observed
+    latencies and failures, see `stream_adaptive_batches`.
+
+    The chunks grow by 25% after a fast response and shrink by 25% after a
+    slow one. A transient failure (timeout, connection error, 429 or 5xx)
+    halves the chunk size and lowers the concurrency, which is raised again
+    after as many consecutive fast responses as the current concurrency.
+    """
+
+    chunk_size: int = 40
+    concurrency: int = 5
+    # Number of consecutive fast responses
+    fast_streak: int = 0
+
+    @classmethod
+    def from_params(cls, params: dict, **defaults) -> "AdaptiveBatcher":
+        """
+        Return the batcher with the given persisted parameters, see
+        `params`, falling back to the given defaults.
+        """
+        batcher = cls(**defaults)
+        batcher.chunk_size = int(params.get("chunk_size", batcher.chunk_size))
+        batcher.concurrency = int(
+            params.get("concurrency", batcher.concurrency)
+        )
+        batcher.clip()
+        return batcher
+
+    def params(self) -> dict:
+        """
+        Return the parameters of the batcher to be persisted.
+        """
+        return {"chunk_size": self.chunk_size, "concurrency": self.concurrency}
+
+    def clip(self):
+        self.chunk_size = min(max(self.chunk_size, 1), ADAPTIVE_MAX_CHUNK_SIZE)
+        self.concurrency = min(
+            max(self.concurrency, 1), ADAPTIVE_MAX_CONCURRENCY
+        )
+
+    def record(self, result: ApiResult, size: int, latency: float):
+        """
+        Adapt the parameters to the given result of a chunk request.
+
+        :param result:  The result of the request.
+        :param size:    The number of items of the chunk.
+        :param latency: The duration of the request, in seconds.
+        """
+        if result.skipped:
+            return
+        transient = result.error and (
+            result.http_status is None or result.http_status in RETRY_STATUSES
+        )
+        if transient:
+            self.chunk_size //= 2
+            self.concurrency -= 1
+            self.fast_streak = 0
+        elif latency > ADAPTIVE_SLOW_LATENCY:
+            self.chunk_size = int(self.chunk_size * 0.75)
+            self.fast_streak = 0
+        elif latency < ADAPTIVE_FAST_LATENCY and not result.error:
+            # Only the full chunks denote the current chunk size
+            if size >= self.chunk_size:
+                self.chunk_size += max(self.chunk_size // 4, 1)
+            self.fast_streak += 1
+            if self.fast_streak >= self.concurrency:
+                self.concurrency += 1
+                self.fast_streak = 0
+        self.clip()
+
+
+async def stream_adaptive_batches[
+    T, P: ApiResult
+](
+    data: Sequence[T],
+    func: Callable[[aiohttp.ClientSession, list[T]], P],
+    batcher: AdaptiveBatcher,
+) -> AsyncIterator[P]:
+    """
+    Call the given function on chunks of the data items, with the chunk
+    size and the concurrency of the given adaptive batcher. The results
+    are yielded as they complete.
+
+    A failed chunk of several items is split in half and its halves are
+    requested again, so that the failure is isolated to the problematic
+    items. The results of the split chunks are not yielded.
+
+    :param data:        The sequence of items to be requested by chunks.
+    :param func:        The function to be applied for every chunk.
+                        It must take as arguments an `aiohttp.ClientSession`
+                        and a list of data items and return an `ApiResult`.
+    :param batcher:     The adaptive batcher, updated with the results.
+    """
+    todo = deque(data)
+    retry: deque[list[T]] = deque()
+    pending: dict[asyncio.Task, tuple[list[T], float]] = {}
+    async with http_session(ADAPTIVE_MAX_CONCURRENCY) as session:
+        try:
+            while todo or retry or pending:
+                while (todo or retry) and len(pending) < batcher.concurrency:
+                    if retry:
+                        chunk = retry.popleft()
+                    else:
+                        size = min(batcher.chunk_size, len(todo))
+                        chunk = [todo.popleft() for _ in range(size)]
+                    task = asyncio.create_task(func(session, chunk))
+                    pending[task] = (chunk, time.monotonic())
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    chunk, start = pending.pop(task)
+                    result = task.result()
+                    batcher.record(result, len(chunk), time.monotonic() - start)
+                    if result.error and not result.skipped and len(chunk) > 1:
+                        half = len(chunk) // 2
+                        retry.appendleft(chunk[half:])
+                        retry.appendleft(chunk[:half])
+                        continue
+                    yield result
+        finally:
+            for task in pending:
+                task.cancel()
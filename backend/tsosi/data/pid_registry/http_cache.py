@@ -0,0 +1,84 @@
+"""
+Storage of the HTTP validators of the fetched resources.
+
+The validators (ETag, Last-Modified and content length) of the fetched
+registry records, Wikipedia summaries and logo files are stored per URL in
+the `HttpValidator` table. The next fetches of these resources are
+conditional requests: an unchanged resource is answered with a 304 status,
+without its content, see `record_validators`.
+"""
+
+import logging
+from typing import Iterable
+
+import pandas as pd
+from django.utils import timezone
+from tsosi.data.db_utils import INSERT_CHUNK_SIZE, LOOKUP_CHUNK_SIZE
+from tsosi.models import HttpValidator
+
+from .common import HttpValidators
+
+logger = logging.getLogger(__name__)
+
+VALIDATOR_FIELDS = ["etag", "last_modified", "content_length"]
+
+
+def load_http_validators(urls: Iterable[str]) -> dict[str, HttpValidators]:
+    """
+    Return the stored validators of the given URLs, indexed by URL.
+    The URLs without validators are omitted.
+    """
+    urls = list(set(urls))
+    validators = {}
+    for pos in range(0, len(urls), LOOKUP_CHUNK_SIZE):
+        instances = HttpValidator.objects.filter(
+            url__in=urls[pos : pos + LOOKUP_CHUNK_SIZE]
+        ).values("url", *VALIDATOR_FIELDS)
+        for i in instances:
+            url = i.pop("url")
+            validators[url] = HttpValidators(**i)
+    return validators
+
+
+def save_http_validators(results: pd.DataFrame, url_column: str = "info"):
+    """
+    Store the validators of the given successful request results, in place
+    of the existing ones.
+
+    :param results:     The request results, with the `ApiResult` columns.
+    :param url_column:  The column of the requested URL.
+    """
+    if results.empty or "etag" not in results.columns:
+        return
+    results = results[
+        (results["error"] == False)
+        & (results["etag"].notna() | results["last_modified"].notna())
+    ].drop_duplicates(url_column, keep="last")
+    if results.empty:
+        return
+
+    date_update = timezone.now()
+    instances = [
+        HttpValidator(
+            url=row[url_column],
+            etag=None if pd.isna(row["etag"]) else row["etag"],
+            last_modified=(
+                None if pd.isna(row["last_modified"]) else row["last_modified"]
+            ),
+            content_length=(
+                None
+                if pd.isna(row["content_length"])
+                else int(row["content_length"])
+            ),
+            date_last_updated=date_update,
+        )
+        for _, row in results.iterrows()
+    ]
+    HttpValidator.objects.bulk_create(
+        instances,
+        batch_size=INSERT_CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=["url"],
+        update_fields=[*VALIDATOR_FIELDS, "date_last_updated"],
+    )
+    logger.info(f"Stored the HTTP validators of {len(instances)} URLs.")
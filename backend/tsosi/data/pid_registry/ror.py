@@ -11,16 +11,27 @@ WARNING:
 
 import logging
 import re
-from dataclasses import asdict, dataclass, field
+from dataclasses import asdict, dataclass, field, fields
 from datetime import UTC, datetime
+from functools import partial
 from json import JSONDecodeError
-from typing import Iterable
+from typing import Iterable, Iterator, Mapping
 from urllib.parse import urlencode
 
 import aiohttp
 import pandas as pd
 
-from .common import ApiResult, HTTPStatusError, perform_http_func_batch
+from .common import (
+    STREAM_BATCH_SIZE,
+    ApiResult,
+    CircuitOpenError,
+    HTTPStatusError,
+    HttpValidators,
+    http_request,
+    iter_http_func_batch,
+    perform_http_func_batch,
+    record_validators,
+)
 
 logger = logging.getLogger(__name__)
 logger_console = logging.getLogger("console_only")
@@ -109,11 +120,17 @@ async def match_ror_record(
     request_url = f"{ROR_API_ENDPOINT}?{urlencode(params)}"
     ror_result.info = request_url
     try:
-        async with session.get(request_url) as response:
+        async with http_request(session, "get", request_url) as response:
             ror_result.http_status = response.status
             if response.status < 200 or response.status >= 300:
                 raise HTTPStatusError(f"Wrong status code: {response.status}")
             query_response: dict = await response.json()
+    except CircuitOpenError as e:
+        ror_result.timestamp = datetime.now(UTC)
+        ror_result.error = True
+        ror_result.skipped = True
+        ror_result.error_msg = str(e)
+        return ror_result
     except (HTTPStatusError, aiohttp.ClientError, JSONDecodeError) as e:
         ror_result.timestamp = datetime.now(UTC)
         msg = "\n".join(
@@ -143,11 +160,17 @@ async def match_ror_record(
 
     params = {"query": search_term, "filter": "status:inactive"}
     try:
-        async with session.get(request_url) as response:
+        async with http_request(session, "get", request_url) as response:
             ror_result.http_status = response.status
             if response.status < 200 or response.status >= 300:
                 raise HTTPStatusError(f"Wrong status code: {response.status}")
             query_response: dict = await response.json()
+    except CircuitOpenError as e:
+        ror_result.timestamp = datetime.now(UTC)
+        ror_result.error = True
+        ror_result.skipped = True
+        ror_result.error_msg = str(e)
+        return ror_result
     except (HTTPStatusError, aiohttp.ClientError, JSONDecodeError) as e:
         ror_result.timestamp = datetime.now(UTC)
         msg = "\n".join(
@@ -205,9 +228,17 @@ async def match_ror_records(
         process_ror_matching_result(result, country)
         for result, country in zip(results, countries)
     ]
+    return ror_matching_results_df(processed_results)
+
 
+def ror_matching_results_df(results: list[RorMatchingResult]) -> pd.DataFrame:
+    """
+    Return the dataframe of the given matching results, with the columns
+    prefixed by `ror_` and the matched ROR URL reduced to the ROR ID.
+    """
     processed_results = pd.DataFrame.from_records(
-        [asdict(r) for r in processed_results]
+        [asdict(r) for r in results],
+        columns=[f.name for f in fields(RorMatchingResult)],
     )
     processed_results["matched_id"] = processed_results["matched_id"].apply(
         lambda url: (url[-9:] if not pd.isnull(url) else url)
@@ -305,11 +336,27 @@ def process_ror_matching_result(
     return processed_result
 
 
+def ror_record_url(id: str) -> str:
+    """
+    Return the ROR API URL of the record of the given ID.
+    """
+    return f"{ROR_API_ENDPOINT}/{id}"
+
+
 async def get_ror_record(
-    session: aiohttp.ClientSession, id: str
+    session: aiohttp.ClientSession,
+    id: str,
+    validators: Mapping[str, HttpValidators] | None = None,
 ) -> RorRecordApiResult:
     """
     Fetch the ROR record of the given ID.
+
+    :param session:     The aiohttp ClientSession object.
+    :param id:          The ROR ID.
+    :param validators:  The optional stored HTTP validators indexed by URL.
+                        The request is conditional when the record's URL
+                        has validators, the record is not returned if it's
+                        unchanged.
     """
     result = RorRecordApiResult(id=id)
     if not re.match(ROR_ID_REGEX, id):
@@ -317,16 +364,25 @@ async def get_ror_record(
         result.error = True
         return result
 
-    url = f"{ROR_API_ENDPOINT}/{id}"
+    url = ror_record_url(id)
     result.info = url
+    stored = validators.get(url) if validators else None
+    headers = stored.request_headers() if stored else {}
     try:
-        async with session.get(url) as response:
+        async with http_request(
+            session, "get", url, headers=headers
+        ) as response:
             result.http_status = response.status
-            if response.status < 200 or response.status >= 300:
-                raise HTTPStatusError(
-                    f"Wrong HTTP status code: {response.status}"
-                )
-            result.record = await response.json()
+            if not record_validators(result, response, stored):
+                if response.status < 200 or response.status >= 300:
+                    raise HTTPStatusError(
+                        f"Wrong HTTP status code: {response.status}"
+                    )
+                result.record = await response.json()
+    except CircuitOpenError as e:
+        result.error = True
+        result.skipped = True
+        result.error_msg = str(e)
     except (HTTPStatusError, aiohttp.ClientError, JSONDecodeError) as e:
         result.timestamp = datetime.now(UTC)
         result.error_msg = "\n".join(
@@ -345,6 +401,8 @@ async def get_ror_record(
 async def fetch_ror_records(identifiers: Iterable[str]):
     """
     Fetch records data from the ROR registry.
+    The enrichment tasks only query the API for the records missing from
+    the local ROR dump, see `ror_dump`.
     """
     results = await perform_http_func_batch(
         identifiers, get_ror_record, max_conns=MAX_CONNS
@@ -352,6 +410,24 @@ async def fetch_ror_records(identifiers: Iterable[str]):
     return pd.DataFrame.from_records([asdict(r) for r in results])
 
 
+def iter_ror_records(
+    identifiers: Iterable[str],
+    batch_size: int = STREAM_BATCH_SIZE,
+    validators: Mapping[str, HttpValidators] | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Fetch records data from the ROR registry, yielding the results by
+    micro-batches as they are fetched, see `iter_http_func_batch`.
+    The requests are conditional for the records with stored validators,
+    see `get_ror_record`.
+    """
+    func = partial(get_ror_record, validators=validators)
+    for results in iter_http_func_batch(
+        identifiers, func, max_conns=MAX_CONNS, batch_size=batch_size
+    ):
+        yield pd.DataFrame.from_records([asdict(r) for r in results])
+
+
 def get_ror_id(record: dict) -> str | None:
     """
     Return the ROR ID from the ROR record.
@@ -528,3 +604,34 @@ def ror_record_extractor(
         f"{output_field_prefix}_{name}": func(record)
         for name, func in ROR_EXTRACT_MAPPING.items()
     }
+
+
+def ror_record_projection(record: dict) -> dict:
+    """
+    Return the subset of a ROR record read by `ror_record_extractor`.
+    This is the compact form stored in the identifier versions, it yields
+    the same extracted data as the full record.
+    """
+    projection = {
+        key: record[key]
+        for key in ["id", "names", "links", "external_ids", "types"]
+        if key in record
+    }
+    if record.get("established") is not None:
+        projection["established"] = record["established"]
+    if "locations" in record:
+        projection["locations"] = [
+            {
+                "geonames_details": {
+                    k: l["geonames_details"].get(k)
+                    for k in ["country_code", "lat", "lng"]
+                }
+            }
+            for l in record["locations"]
+        ]
+    if "relationships" in record:
+        projection["relationships"] = [
+            {k: r.get(k) for k in ["type", "id", "label"]}
+            for r in record["relationships"]
+        ]
+    return projection
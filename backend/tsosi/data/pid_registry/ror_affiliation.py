@@ -0,0 +1,346 @@
+"""
+Local matching of organization names to the ROR.
+
+The names, aliases and acronyms of the records of the local ROR dump
+(see `ror_dump`) are indexed to match organization names without
+querying the ROR affiliation API. The API is only queried for the names
+the local index can't resolve, and every matching result is cached in the
+`RorAffiliationMatch` table for `AFFILIATION_MATCH_CACHE_DAYS`.
+"""
+
+import asyncio
+import logging
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from typing import Iterable, Sequence
+
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+from tsosi.app_settings import app_settings
+from tsosi.data.db_utils import INSERT_CHUNK_SIZE, LOOKUP_CHUNK_SIZE
+from tsosi.models import RorAffiliationMatch, RorDumpRecord
+
+from .ror import (
+    RorMatchingResult,
+    get_ror_country,
+    get_ror_name,
+    match_ror_records,
+    ror_matching_results_df,
+)
+from .ror_dump import ROR_DUMP_INFO_PREFIX
+
+logger = logging.getLogger(__name__)
+
+AFFILIATION_SOURCE_LOCAL = "local"
+AFFILIATION_SOURCE_API = "api"
+
+# Match types of the local index, named after the ROR affiliation API ones
+MATCH_TYPE_EXACT = "EXACT"
+MATCH_TYPE_COMMON_TERMS = "COMMON TERMS"
+MATCH_TYPE_ACRONYM = "ACRONYM"
+
+# Words ignored when comparing the tokens of 2 names.
+STOPWORDS = {"the", "of", "and", "for", "de", "du", "des", "la", "le", "et"}
+
+
+def normalize_name(value: str) -> str:
+    """
+    Normalize an organization name for comparison: lower case, without
+    accents nor punctuation and with single spaces.
+    """
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[\W_]+", " ", value.lower()).split())
+
+
+def name_tokens(normalized: str) -> frozenset[str]:
+    """
+    Return the set of tokens of the given normalized name, stopwords
+    excluded.
+    """
+    return frozenset(t for t in normalized.split() if t not in STOPWORDS)
+
+
+@dataclass
+class IndexedRecord:
+    id: str
+    name: str | None
+    country: str | None
+    status: str | None
+    # The raw values of the record's labels
+    labels: list[str] = field(default_factory=list)
+
+
+class AffiliationIndex:
+    """
+    In-memory index of the ROR records names.
+
+    The names and aliases are indexed by their normalized value, for exact
+    matching, and by their normalized set of tokens. The acronyms are
+    indexed separately as they're often shared by several organizations.
+    """
+
+    def __init__(self):
+        self.records: dict[str, IndexedRecord] = {}
+        self.names: dict[str, set[str]] = defaultdict(set)
+        self.tokens: dict[frozenset[str], set[str]] = defaultdict(set)
+        self.acronyms: dict[str, set[str]] = defaultdict(set)
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "AffiliationIndex":
+        index = cls()
+        for record in records:
+            index.add(record)
+        return index
+
+    def add(self, record: dict):
+        """
+        Index the given ROR record.
+        """
+        names: list[dict] = record.get("names", [])
+        self.records[record["id"]] = IndexedRecord(
+            id=record["id"],
+            name=get_ror_name(record),
+            country=get_ror_country(record),
+            status=record.get("status"),
+            labels=[n["value"] for n in names if "label" in n["types"]],
+        )
+        for n in names:
+            normalized = normalize_name(n["value"])
+            if not normalized:
+                continue
+            if "acronym" in n["types"]:
+                self.acronyms[normalized].add(record["id"])
+                continue
+            self.names[normalized].add(record["id"])
+            self.tokens[name_tokens(normalized)].add(record["id"])
+
+    def match(self, name: str, country: str | None) -> RorMatchingResult | None:
+        """
+        Match the given organization name against the index.
+
+        A perfect match is flagged, as in `process_ror_matching_result`,
+        when an active record has a label equal to the given name and the
+        given country.
+
+        :param name:    The organization name.
+        :param country: The organization's country ISO alpha-2 code.
+        :returns:       The matching result, `None` when the index can't
+                        resolve the name: no or several candidate records.
+        """
+        normalized = normalize_name(name)
+        if not normalized:
+            return None
+        lookups = [
+            (MATCH_TYPE_EXACT, self.names.get(normalized)),
+            (MATCH_TYPE_COMMON_TERMS, self.tokens.get(name_tokens(normalized))),
+            (MATCH_TYPE_ACRONYM, self.acronyms.get(normalized)),
+        ]
+        for match_type, ids in lookups:
+            if not ids:
+                continue
+            result = self._resolve(name, country, sorted(ids), match_type)
+            if result is not None:
+                return result
+        return None
+
+    def _resolve(
+        self, name: str, country: str | None, ids: list[str], match_type: str
+    ) -> RorMatchingResult | None:
+        """
+        Select the matched record among the candidate records of a lookup.
+        As with the ROR API, inactive records are only considered when
+        there's no active candidate.
+        """
+        candidates = [self.records[i] for i in ids]
+        active = [r for r in candidates if r.status == "active"]
+        inactive = [r for r in candidates if r.status == "inactive"]
+        candidates = active or inactive
+        if not candidates:
+            return None
+
+        perfect_match = False
+        same_country = [r for r in candidates if r.country == country]
+        if active and match_type == MATCH_TYPE_EXACT and country is not None:
+            perfect = [r for r in same_country if name in r.labels]
+            perfect_match = len(perfect) > 0
+            if perfect_match:
+                same_country = perfect[:1]
+        if len(same_country) == 1:
+            matched = same_country[0]
+        elif len(candidates) == 1 and match_type != MATCH_TYPE_ACRONYM:
+            matched = candidates[0]
+        else:
+            return None
+
+        result = RorMatchingResult(
+            search_value=name,
+            matched_status="active" if active else "inactive",
+            perfect_match=perfect_match,
+            matched_id=matched.id,
+            matched_name=matched.name,
+            matched_country=matched.country,
+            info=f"{ROR_DUMP_INFO_PREFIX}{match_type}",
+            timestamp=datetime.now(UTC),
+        )
+        if active:
+            # The index doesn't score its matches, unlike the ROR API
+            result.match_type = match_type
+            result.match_substring = name
+            result.match_chosen = perfect_match
+        return result
+
+
+def load_affiliation_index() -> AffiliationIndex:
+    """
+    Build the affiliation index from the records of the local ROR dump.
+    """
+    records = RorDumpRecord.objects.values_list("record", flat=True)
+    index = AffiliationIndex.from_records(records.iterator(chunk_size=2000))
+    logger.info(f"Indexed {len(index.records)} ROR records for matching.")
+    return index
+
+
+def cached_matches(
+    keys: Iterable[tuple[str, str]],
+) -> dict[tuple[str, str], dict]:
+    """
+    Return the cached matching results of the given (name, country) keys
+    that are not expired.
+    The country of a key is the empty string when unknown.
+
+    :returns:   The results indexed by key, in the format of the rows of
+                `ror_matching_results_df`.
+    """
+    threshold = timezone.now() - timedelta(
+        days=app_settings.AFFILIATION_MATCH_CACHE_DAYS
+    )
+    keys = set(keys)
+    names = list({name for name, _ in keys})
+    results = {}
+    for pos in range(0, len(names), LOOKUP_CHUNK_SIZE):
+        matches = RorAffiliationMatch.objects.filter(
+            name__in=names[pos : pos + LOOKUP_CHUNK_SIZE],
+            date_last_updated__gte=threshold,
+        ).values("name", "country", "result", "date_last_updated")
+        for m in matches:
+            key = (m["name"], m["country"])
+            if key in keys:
+                results[key] = {
+                    **m["result"],
+                    "ror_timestamp": m["date_last_updated"],
+                }
+    return results
+
+
+@transaction.atomic
+def cache_matches(results: dict[tuple[str, str], dict], source: str):
+    """
+    Store the given matching results in the cache, in place of the
+    existing entries.
+
+    :param results:     The results indexed by (name, country) key, in the
+                        format of the rows of `ror_matching_results_df`.
+    :param source:      The source of the results, local index or API.
+    """
+    date_update = timezone.now()
+    instances = []
+    for (name, country), result in results.items():
+        result = {
+            k: None if not isinstance(v, (list, dict)) and pd.isna(v) else v
+            for k, v in result.items()
+            if k != "ror_timestamp"
+        }
+        instances.append(
+            RorAffiliationMatch(
+                name=name,
+                country=country,
+                result=result,
+                source=source,
+                date_last_updated=date_update,
+            )
+        )
+    RorAffiliationMatch.objects.bulk_create(
+        instances,
+        batch_size=INSERT_CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=["name", "country"],
+        update_fields=["result", "source", "date_last_updated"],
+    )
+
+
+def match_affiliations(
+    names: Sequence[str],
+    countries: Sequence[str | None],
+    index: AffiliationIndex | None = None,
+) -> pd.DataFrame:
+    """
+    Match the given organization names to the ROR, with the same results
+    as `match_ror_records`.
+
+    The names are resolved in order from the cache, the local index and
+    the ROR affiliation API. The results of the index and of the successful
+    API requests are cached.
+
+    :param names:       The organization names.
+    :param countries:   The organizations' country ISO alpha-2 codes.
+    :param index:       The affiliation index, loaded from the local ROR
+                        dump if not provided.
+    :returns:           The dataframe of the results for each input name.
+    """
+    if len(countries) != len(names):
+        raise ValueError(
+            f"The length of the `names` and `countries` iterables don't match."
+        )
+    keys = [
+        (name, "" if pd.isna(country) else country)
+        for name, country in zip(names, countries)
+    ]
+    results = cached_matches(keys)
+    to_match = [k for k in dict.fromkeys(keys) if k not in results]
+
+    # Local index
+    if to_match:
+        if index is None:
+            index = load_affiliation_index()
+        local_results = {}
+        for name, country in to_match:
+            result = index.match(name, country or None)
+            if result is not None:
+                local_results[(name, country)] = result
+        if local_results:
+            rows = ror_matching_results_df(list(local_results.values()))
+            local_results = dict(
+                zip(local_results.keys(), rows.to_dict(orient="records"))
+            )
+            cache_matches(local_results, AFFILIATION_SOURCE_LOCAL)
+            results.update(local_results)
+        to_match = [k for k in to_match if k not in results]
+
+    # ROR affiliation API
+    logger.info(
+        f"Matched {len(set(keys)) - len(to_match)} names locally, "
+        f"querying the ROR API for {len(to_match)} names."
+    )
+    if to_match:
+        rows = asyncio.run(
+            match_ror_records(
+                [name for name, _ in to_match],
+                [country or None for _, country in to_match],
+            )
+        )
+        api_results = dict(zip(to_match, rows.to_dict(orient="records")))
+        results.update(api_results)
+        cache_matches(
+            {k: r for k, r in api_results.items() if not r["ror_error"]},
+            AFFILIATION_SOURCE_API,
+        )
+
+    columns = ror_matching_results_df([]).columns
+    return pd.DataFrame.from_records(
+        [results[k] for k in keys], columns=columns
+    )
@@ -0,0 +1,177 @@
+"""
+Local copy of the ROR data dump.
+
+ROR publishes full data dumps of the registry as a zip archive of JSON
+files, see https://ror.readme.io/docs/data-dump.
+The records of an imported dump are stored as is in the `RorDumpRecord`
+table and are served in place of the ROR API, which is only queried for
+the records missing from the dump. The records served from the dump are
+stored in the identifier versions like the API ones, see
+`version_stored_value`.
+"""
+
+import json
+import logging
+import zipfile
+from dataclasses import asdict, fields
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Iterable
+
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+from tsosi.data.db_utils import (
+    INSERT_CHUNK_SIZE,
+    LOOKUP_CHUNK_SIZE,
+    UPDATE_CHUNK_SIZE,
+)
+from tsosi.data.utils import canonical_json_hash
+from tsosi.models import RorDumpRecord
+
+from .ror import RorRecordApiResult, get_ror_id
+
+logger = logging.getLogger(__name__)
+
+ROR_DUMP_INFO_PREFIX = "ror_dump:"
+
+
+def read_ror_dump(file_path: str | Path) -> tuple[str, list[dict]]:
+    """
+    Read the records of the given ROR data dump.
+
+    The dump is either the zip archive published by ROR or one of its
+    JSON files. The archives published during the v1 to v2 transition
+    contain a file per schema version, the v2 one is used.
+
+    :param file_path:   The path of the dump.
+    :returns:           The dump version, ie. the name of the JSON file,
+                        and the list of records.
+    """
+    file_path = Path(file_path)
+    if file_path.suffix != ".zip":
+        with open(file_path, "r", encoding="utf-8") as f:
+            return file_path.stem, json.load(f)
+
+    with zipfile.ZipFile(file_path) as archive:
+        names = [n for n in archive.namelist() if n.endswith(".json")]
+        v2_names = [n for n in names if n.endswith("_schema_v2.json")]
+        if v2_names:
+            names = v2_names
+        if len(names) != 1:
+            raise ValueError(
+                f"Expected 1 JSON file in the ROR dump {file_path}, "
+                f"found {len(names)}: {names}"
+            )
+        with archive.open(names[0]) as f:
+            records = json.load(f)
+    return Path(names[0]).stem, records
+
+
+@transaction.atomic
+def import_ror_dump(file_path: str | Path) -> tuple[int, int, int]:
+    """
+    Import the given ROR data dump in the `RorDumpRecord` table.
+
+    The records are compared with the stored ones using the hash of their
+    canonical JSON: only the new and modified records are written and the
+    records absent from the dump are deleted.
+
+    :param file_path:   The path of the dump, see `read_ror_dump`.
+    :returns:           The number of created, updated and deleted records.
+    """
+    dump_version, records = read_ror_dump(file_path)
+    if records and "names" not in records[0]:
+        raise ValueError(
+            f"The ROR dump {dump_version} does not follow the v2 schema."
+        )
+    logger.info(f"Importing {len(records)} records of ROR dump {dump_version}")
+
+    date_update = timezone.now()
+    existing = dict(RorDumpRecord.objects.values_list("id", "content_hash"))
+    to_create, to_update = [], []
+    dump_ids = set()
+    for record in records:
+        ror_id = get_ror_id(record)
+        dump_ids.add(ror_id)
+        content_hash = canonical_json_hash(record)
+        if existing.get(ror_id) == content_hash:
+            continue
+        instance = RorDumpRecord(
+            id=ror_id,
+            record=record,
+            content_hash=content_hash,
+            dump_version=dump_version,
+            date_last_updated=date_update,
+        )
+        if ror_id in existing:
+            to_update.append(instance)
+        else:
+            to_create.append(instance)
+
+    RorDumpRecord.objects.bulk_create(to_create, batch_size=INSERT_CHUNK_SIZE)
+    RorDumpRecord.objects.bulk_update(
+        to_update,
+        fields=["record", "content_hash", "dump_version", "date_last_updated"],
+        batch_size=UPDATE_CHUNK_SIZE,
+    )
+    to_delete = [ror_id for ror_id in existing if ror_id not in dump_ids]
+    for pos in range(0, len(to_delete), LOOKUP_CHUNK_SIZE):
+        RorDumpRecord.objects.filter(
+            id__in=to_delete[pos : pos + LOOKUP_CHUNK_SIZE]
+        ).delete()
+
+    logger.info(
+        f"ROR dump {dump_version}: {len(to_create)} records created, "
+        f"{len(to_update)} updated and {len(to_delete)} deleted."
+    )
+    return len(to_create), len(to_update), len(to_delete)
+
+
+def ror_dump_values(identifiers: Iterable[str], *columns: str) -> list[tuple]:
+    """
+    Return the ID and the given columns of the dump records of the given ROR IDs,
+    the IDs missing from the dump are omitted.
+    """
+    identifiers = list(set(identifiers))
+    values = []
+    for pos in range(0, len(identifiers), LOOKUP_CHUNK_SIZE):
+        values.extend(
+            RorDumpRecord.objects.filter(
+                id__in=identifiers[pos : pos + LOOKUP_CHUNK_SIZE]
+            ).values_list("id", *columns)
+        )
+    return values
+
+
+def ror_dump_records(identifiers: Iterable[str]) -> dict[str, dict]:
+    """
+    Return the dump records of the given ROR IDs, indexed by ID.
+    The IDs missing from the dump are omitted.
+    """
+    return dict(ror_dump_values(identifiers, "record"))
+
+
+def ror_dump_results(identifiers: Iterable[str]) -> pd.DataFrame:
+    """
+    Return the dump records of the given ROR IDs in the format of
+    `fetch_ror_records` results.
+    The IDs missing from the dump are omitted, they must be fetched from
+    the ROR API.
+    """
+    timestamp = datetime.now(UTC)
+    results = [
+        RorRecordApiResult(
+            id=ror_id,
+            record=record,
+            info=f"{ROR_DUMP_INFO_PREFIX}{dump_version}",
+            timestamp=timestamp,
+        )
+        for ror_id, record, dump_version in ror_dump_values(
+            identifiers, "record", "dump_version"
+        )
+    ]
+    return pd.DataFrame.from_records(
+        [asdict(r) for r in results],
+        columns=[f.name for f in fields(RorRecordApiResult)],
+    )
@@ -0,0 +1,74 @@
+"""
+Content of the identifier versions, see `IdentifierVersion`.
+"""
+
+import logging
+
+from tsosi.app_settings import app_settings
+from tsosi.data.db_utils import UPDATE_CHUNK_SIZE
+from tsosi.data.utils import canonical_json_hash
+from tsosi.models import IdentifierVersion
+from tsosi.models.static_data import REGISTRY_ROR
+
+from .ror import ror_record_projection
+
+logger = logging.getLogger(__name__)
+
+
+def version_content_hash(registry_id: str, value: dict | str) -> str:
+    """
+    Return the content hash of the version storing the given record: the
+    hash of the canonical JSON of its stored value, see
+    `version_stored_value`.
+    """
+    return canonical_json_hash(version_stored_value(registry_id, value))
+
+
+def version_stored_value(registry_id: str, value: dict | str) -> dict | str:
+    """
+    Return the value to store in an identifier version, according to the
+    `IDENTIFIER_VERSION_STORAGE` setting.
+    Wikidata records are already reduced to the extracted data when queried.
+    """
+    if (
+        app_settings.IDENTIFIER_VERSION_STORAGE == "compact"
+        and registry_id == REGISTRY_ROR
+        and isinstance(value, dict)
+    ):
+        return ror_record_projection(value)
+    return value
+
+
+def compact_identifier_versions() -> int:
+    """
+    Reduce the stored value of the existing ROR identifier versions to
+    the fields that we use, see `ror_record_projection`, and update their
+    content hash.
+    The dropped fields are lost, this is not reversible.
+    Return the number of compacted versions.
+    """
+    queryset = IdentifierVersion.objects.filter(
+        identifier__registry_id=REGISTRY_ROR
+    ).only("id", "value", "content_hash")
+    compacted = 0
+    batch = []
+    for version in queryset.iterator(chunk_size=UPDATE_CHUNK_SIZE):
+        if not isinstance(version.value, dict):
+            continue
+        value = ror_record_projection(version.value)
+        if value == version.value:
+            continue
+        version.value = value
+        version.content_hash = canonical_json_hash(value)
+        batch.append(version)
+        if len(batch) >= UPDATE_CHUNK_SIZE:
+            IdentifierVersion.objects.bulk_update(
+                batch, ["value", "content_hash"]
+            )
+            compacted += len(batch)
+            batch = []
+    if batch:
+        IdentifierVersion.objects.bulk_update(batch, ["value", "content_hash"])
+        compacted += len(batch)
+    logger.info(f"Compacted {compacted} ROR identifier versions.")
+    return compacted
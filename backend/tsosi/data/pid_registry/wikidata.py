@@ -4,28 +4,64 @@ Wikidata, Wikipedia and Wikimedia Commons.
 """
 
 import logging
+import os
 import re
-from collections.abc import Sequence
+import tempfile
+from collections.abc import Iterable, Iterator, Mapping, Sequence
 from dataclasses import asdict, dataclass, field
 from datetime import UTC, datetime
+from functools import partial
 from itertools import chain as it_chain
 from json import JSONDecodeError
-from urllib.parse import quote, urlencode
+from urllib.parse import quote, unquote, urlencode, urlparse
 
 import aiohttp
 import pandas as pd
+from tsosi.app_settings import app_settings
 from tsosi.data.utils import chunk_sequence, clean_null_values
 
-from .common import ApiResult, HTTPStatusError, perform_http_func_batch
+from .common import (
+    STREAM_BATCH_SIZE,
+    AdaptiveBatcher,
+    ApiResult,
+    CircuitOpenError,
+    HTTPStatusError,
+    HttpValidators,
+    InvalidFileError,
+    http_request,
+    iter_async_batches,
+    iter_http_func_batch,
+    perform_http_func_batch,
+    record_validators,
+    response_size,
+    stream_adaptive_batches,
+)
 
 logger = logging.getLogger(__name__)
 
 WIKIDATA_ID_REGEX = r"^Q[0-9]+$"
 WIKIDATA_SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
+# https://www.wikidata.org/w/api.php?action=help&modules=wbgetentities
+WIKIDATA_ACTION_API_ENDPOINT = "https://www.wikidata.org/w/api.php"
+# Maximum size, in bytes, of the downloaded Wikimedia files
+WIKIMEDIA_FILE_MAX_SIZE = 5 * 1024 * 1024
+# Size of the chunks the Wikimedia files are streamed by
+WIKIMEDIA_FILE_CHUNK_SIZE = 64 * 1024
+# Accepted content types of the downloaded Wikimedia files
+WIKIMEDIA_FILE_CONTENT_TYPES = ("image/",)
+# Maximum number of entities per `wbgetentities` request
+WIKIDATA_ENTITIES_BATCH_SIZE = 50
+WIKIMEDIA_FILE_PATH_ENDPOINT = (
+    "http://commons.wikimedia.org/wiki/Special:FilePath"
+)
 # https://en.wikipedia.org/api/rest_v1/#/Page%20content/get_page_summary__title_
 WIKIPEDIA_SUMMARY_API_ENDPOINT = (
     "https://en.wikipedia.org/api/rest_v1/page/summary"
 )
+# https://www.mediawiki.org/wiki/Extension:TextExtracts#API
+WIKIPEDIA_ACTION_API_ENDPOINT = "https://en.wikipedia.org/w/api.php"
+# Maximum number of intro extracts returned by a query of the action API
+WIKIPEDIA_EXTRACTS_BATCH_SIZE = 20
 
 ALLOWED_IMG_FILE_FORMATS = [
     ".jpg",
@@ -54,7 +90,11 @@ class WikipediaSummaryApiResult(ApiResult):
 @dataclass(kw_only=True)
 class WikimediaFileApiResult(ApiResult):
     url: str
-    file_bytes: bytes | None = None
+    # Path of the temporary file the content was downloaded to, it must be
+    # deleted by the caller once processed.
+    file_path: str | None = None
+    file_size: int | None = None
+    content_type: str | None = None
     final_url: str | None = None
 
 
@@ -76,14 +116,18 @@ async def fetch_wikidata_sparql_query(
     params = {"query": query, "format": "json"}
     result.info = query
     try:
-        async with session.post(
-            WIKIDATA_SPARQL_ENDPOINT, params=params
+        async with http_request(
+            session, "post", WIKIDATA_SPARQL_ENDPOINT, params=params
         ) as response:
             result.http_status = response.status
             if response.status < 200 or response.status > 300:
                 raise HTTPStatusError(f"Wrong status code: {response.status}")
             content: dict = await response.json()
             result.records = content.get("results", {}).get("bindings", [])
+    except CircuitOpenError as e:
+        result.error = True
+        result.skipped = True
+        result.error_msg = str(e)
     except (HTTPStatusError, aiohttp.ClientError, JSONDecodeError) as e:
         # Log the error
         msg = (
@@ -151,6 +195,7 @@ def process_wikidata_results(result: WikidataSparqlApiResult) -> pd.DataFrame:
         df["id"] = result.identifiers
         df["error"] = result.error
         df["error_msg"] = result.error_msg
+        df["skipped"] = result.skipped
         df["record"] = None
         df["http_status"] = result.http_status
         df["timestamp"] = result.timestamp
@@ -203,6 +248,7 @@ def process_wikidata_results(result: WikidataSparqlApiResult) -> pd.DataFrame:
         to_append["error_msg"] = "Item not returned by Wikidata SPARQL query."
         df = pd.concat([df, to_append], axis=0)
 
+    df["skipped"] = result.skipped
     df["timestamp"] = result.timestamp
     clean_null_values(df)
     return df
@@ -226,24 +272,314 @@ async def fetch_wikidata_records_data(
     return processed
 
 
+def iter_wikidata_records_data(
+    identifiers: Sequence[str],
+    batch_size: int = STREAM_BATCH_SIZE,
+    batcher: AdaptiveBatcher | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Streaming version of `fetch_wikidata_records_data`, yielding the results
+    by micro-batches of about `batch_size` records.
+
+    The SPARQL queries are performed by chunks of identifiers whose size and
+    concurrency are adapted to the response times of the query service, see
+    `stream_adaptive_batches`.
+
+    :param identifiers: The Wikidata identifiers to fetch.
+    :param batch_size:  The approximate number of records per micro-batch.
+    :param batcher:     The adaptive batcher with the initial chunk size and
+                        concurrency, updated in place.
+    """
+    if batcher is None:
+        batcher = AdaptiveBatcher(chunk_size=40, concurrency=5)
+    identifiers = list(identifiers)
+    for results in iter_async_batches(
+        lambda: stream_adaptive_batches(
+            identifiers, fetch_wikidata_sparql_query, batcher
+        ),
+        batch_size=max(batch_size // batcher.chunk_size, 1),
+    ):
+        yield pd.concat([process_wikidata_results(r) for r in results])
+
+
+@dataclass(kw_only=True)
+class WikidataEntitiesApiResult(ApiResult):
+    identifiers: Sequence[str]
+    entities: dict = field(default_factory=dict)
+    # The ISO alpha-2 code of the entities' countries, by country ID
+    country_codes: dict = field(default_factory=dict)
+
+
+# Cache of the ISO alpha-2 code (P297) of the country items
+_country_codes: dict[str, str | None] = {}
+
+
+def wikidata_claim_value(entity: dict, property_id: str):
+    """
+    Return the value of the best claim of the given property of the
+    Wikidata entity: preferred claims first, deprecated ones excluded.
+    """
+    claims: list[dict] = entity.get("claims", {}).get(property_id, [])
+    ranks = {"preferred": 0, "normal": 1}
+    claims = sorted(
+        (c for c in claims if c.get("rank") in ranks),
+        key=lambda c: ranks[c["rank"]],
+    )
+    for c in claims:
+        snak = c.get("mainsnak", {})
+        if snak.get("snaktype") == "value":
+            return snak["datavalue"]["value"]
+    return None
+
+
+def wikidata_time_value(value: dict | None) -> str | None:
+    """
+    Return the given Wikidata time value in the format of the SPARQL
+    query service, ex: `+1339-00-00T00:00:00Z` -> `1339-01-01T00:00:00Z`.
+    """
+    if value is None or not value["time"].startswith("+"):
+        return None
+    date_part, time_part = value["time"][1:].split("T")
+    year, month, day = date_part.split("-")
+    month = "01" if month == "00" else month
+    day = "01" if day == "00" else day
+    return f"{year}-{month}-{day}T{time_part}"
+
+
+async def fetch_wikidata_entities(
+    session: aiohttp.ClientSession, ids: Sequence[str], props: str
+) -> tuple[int, dict]:
+    """
+    Query the `wbgetentities` action of the Wikidata API for the given
+    entity IDs.
+    Raise an `HTTPStatusError` when the API returns an error.
+
+    :returns:   The HTTP status and the entities indexed by ID.
+    """
+    params = {
+        "action": "wbgetentities",
+        "ids": "|".join(ids),
+        "props": props,
+        "languages": "en|mul",
+        "sitefilter": "enwiki",
+        "format": "json",
+        "formatversion": 2,
+    }
+    url = f"{WIKIDATA_ACTION_API_ENDPOINT}?{urlencode(params)}"
+    async with http_request(session, "get", url) as response:
+        if response.status < 200 or response.status >= 300:
+            raise HTTPStatusError(f"Wrong status code: {response.status}")
+        content: dict = await response.json()
+    if "error" in content:
+        raise HTTPStatusError(f"Wikidata API error: {content['error']}")
+    return response.status, content.get("entities", {})
+
+
+async def fetch_wikidata_entities_data(
+    session: aiohttp.ClientSession, identifiers: Sequence[str]
+) -> WikidataEntitiesApiResult:
+    """
+    Fetch the given Wikidata entities, at most `WIKIDATA_ENTITIES_BATCH_SIZE`,
+    with the `wbgetentities` action of the Wikidata API.
+    The ISO code of the entities' countries, not part of the entities, are
+    fetched with an extra request when not cached.
+    """
+    result = WikidataEntitiesApiResult(identifiers=identifiers)
+    correct_ids = [id for id in identifiers if re.match(WIKIDATA_ID_REGEX, id)]
+    if not correct_ids:
+        result.error = True
+        result.error_msg = "Malformed Wikidata Identifiers."
+        return result
+
+    result.info = f"{WIKIDATA_ACTION_API_ENDPOINT}?ids={'|'.join(correct_ids)}"
+    try:
+        result.http_status, result.entities = await fetch_wikidata_entities(
+            session,
+            correct_ids,
+            props="labels|descriptions|claims|sitelinks/urls",
+        )
+        country_ids = {
+            c["id"]
+            for e in result.entities.values()
+            if (c := wikidata_claim_value(e, "P17")) is not None
+        }
+        missing_ids = sorted(country_ids - _country_codes.keys())
+        if missing_ids:
+            _, countries = await fetch_wikidata_entities(
+                session, missing_ids, props="claims"
+            )
+            for country_id in missing_ids:
+                _country_codes[country_id] = wikidata_claim_value(
+                    countries.get(country_id, {}), "P297"
+                )
+        result.country_codes = {c: _country_codes[c] for c in country_ids}
+    except CircuitOpenError as e:
+        result.error = True
+        result.skipped = True
+        result.error_msg = str(e)
+    except (HTTPStatusError, aiohttp.ClientError, JSONDecodeError) as e:
+        msg = f"Failed to query the Wikidata API ({e}) with {result.info}"
+        logger.warning(msg)
+        result.error = True
+        result.error_msg = msg
+
+    result.timestamp = datetime.now(UTC)
+    return result
+
+
+def wikidata_entity_record(entity: dict, country_codes: dict) -> dict:
+    """
+    Extract the record of the given Wikidata entity, in the same format as
+    the records of the SPARQL query, see `WIKIDATA_EXTRACT_MAPPING`.
+    """
+    labels = entity.get("labels", {})
+    descriptions = entity.get("descriptions", {})
+    label = labels.get("en", labels.get("mul"))
+    description = descriptions.get("en", descriptions.get("mul"))
+    country = wikidata_claim_value(entity, "P17")
+    logo = wikidata_claim_value(entity, "P154")
+    coordinates = wikidata_claim_value(entity, "P625")
+    wikipedia = entity.get("sitelinks", {}).get("enwiki")
+    return {
+        "id": entity["id"],
+        "name": None if label is None else label["value"],
+        "description": None if description is None else description["value"],
+        "website": wikidata_claim_value(entity, "P856"),
+        "country": None if country is None else country_codes[country["id"]],
+        "logo_url": (
+            None
+            if logo is None
+            else f"{WIKIMEDIA_FILE_PATH_ENDPOINT}/{quote(logo, safe='')}"
+        ),
+        "wikipedia_url": None if wikipedia is None else wikipedia["url"],
+        "ror_id": wikidata_claim_value(entity, "P6782"),
+        "coordinates": (
+            None
+            if coordinates is None
+            else f"Point({coordinates['longitude']} {coordinates['latitude']})"
+        ),
+        "date_inception": wikidata_time_value(
+            wikidata_claim_value(entity, "P571")
+        ),
+    }
+
+
+def process_wikidata_entities(
+    result: WikidataEntitiesApiResult,
+) -> pd.DataFrame:
+    """
+    Process the results of `fetch_wikidata_entities_data` into the same
+    dataframe as `process_wikidata_results`.
+    """
+    # The entities of redirected IDs are the redirects' targets
+    entities = {
+        e["redirects"]["from"]: e
+        for e in result.entities.values()
+        if "redirects" in e
+    }
+    entities.update(result.entities)
+    rows = []
+    for id in result.identifiers:
+        row = {
+            "id": id,
+            "record": None,
+            "error": result.error,
+            "error_msg": result.error_msg,
+            "http_status": result.http_status,
+            "info": result.info,
+        }
+        entity = entities.get(id)
+        if not result.error:
+            if entity is None or "missing" in entity:
+                row["error"] = True
+                row["error_msg"] = "Item not returned by Wikidata API."
+            else:
+                record = wikidata_entity_record(entity, result.country_codes)
+                record["id"] = id
+                row["record"] = record
+        rows.append(row)
+    df = pd.DataFrame.from_records(rows)
+    df["skipped"] = result.skipped
+    df["timestamp"] = result.timestamp
+    clean_null_values(df)
+    return df
+
+
+def iter_wikidata_entities_data(
+    identifiers: Sequence[str], batch_size: int = STREAM_BATCH_SIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Alternative to `iter_wikidata_records_data` fetching the records with
+    the `wbgetentities` action of the Wikidata API instead of the SPARQL
+    query service.
+    """
+    identifier_chunks = chunk_sequence(
+        identifiers, WIKIDATA_ENTITIES_BATCH_SIZE
+    )
+    for results in iter_http_func_batch(
+        identifier_chunks,
+        fetch_wikidata_entities_data,
+        max_conns=5,
+        batch_size=max(batch_size // WIKIDATA_ENTITIES_BATCH_SIZE, 1),
+    ):
+        yield pd.concat([process_wikidata_entities(r) for r in results])
+
+
+def iter_wikidata_records(
+    identifiers: Sequence[str],
+    batch_size: int = STREAM_BATCH_SIZE,
+    batcher: AdaptiveBatcher | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Fetch Wikidata records with the backend of the `WIKIDATA_FETCH_BACKEND`
+    setting, yielding the results by micro-batches.
+    The adaptive batcher is only used by the SPARQL backend.
+    """
+    if app_settings.WIKIDATA_FETCH_BACKEND == "wbgetentities":
+        return iter_wikidata_entities_data(identifiers, batch_size)
+    return iter_wikidata_records_data(identifiers, batch_size, batcher)
+
+
+def wikipedia_summary_url(title: str) -> str:
+    """
+    Return the English Wikipedia REST API URL of the summary of the given
+    page title.
+    """
+    query_params = {"redirect": True}
+    return f"{WIKIPEDIA_SUMMARY_API_ENDPOINT}/{title}?{urlencode(query_params)}"
+
+
 async def fetch_wikipedia_page_extract(
-    session: aiohttp.ClientSession, title: str
+    session: aiohttp.ClientSession,
+    title: str,
+    validators: Mapping[str, HttpValidators] | None = None,
 ) -> WikipediaSummaryApiResult:
     """
     Query English Wikipedia REST API for the summary of the given page title.
+    The request is conditional when the URL has stored validators, the
+    extract is not returned if the summary is unchanged.
     """
     result = WikipediaSummaryApiResult(title=title)
-    query_params = {"redirect": True}
-    url = f"{WIKIPEDIA_SUMMARY_API_ENDPOINT}/{title}?{urlencode(query_params)}"
+    url = wikipedia_summary_url(title)
     result.info = url
+    stored = validators.get(url) if validators else None
+    headers = stored.request_headers() if stored else {}
     try:
-        async with session.get(url) as response:
+        async with http_request(
+            session, "get", url, headers=headers
+        ) as response:
             result.http_status = response.status
-            if response.status < 200 or response.status > 300:
-                raise HTTPStatusError(f"Wrong status code: {response.status}")
-            summary: dict = await response.json()
-            result.extract = summary.get("extract", None)
-
+            if not record_validators(result, response, stored):
+                if response.status < 200 or response.status > 300:
+                    raise HTTPStatusError(
+                        f"Wrong status code: {response.status}"
+                    )
+                summary: dict = await response.json()
+                result.extract = summary.get("extract", None)
+    except CircuitOpenError as e:
+        result.error = True
+        result.skipped = True
+        result.error_msg = str(e)
     except (HTTPStatusError, aiohttp.ClientError, JSONDecodeError) as e:
         result.error = True
         result.error_msg = f"Error while querying Wikipedia with url {url}\n"
@@ -254,36 +590,229 @@ async def fetch_wikipedia_page_extract(
     return result
 
 
-async def fetch_wikipedia_page_extracts(titles: Sequence[str]) -> pd.DataFrame:
+async def fetch_wikipedia_page_extracts(
+    titles: Sequence[str],
+    validators: Mapping[str, HttpValidators] | None = None,
+) -> pd.DataFrame:
     """"""
     results = await perform_http_func_batch(
-        titles, fetch_wikipedia_page_extract
+        titles, partial(fetch_wikipedia_page_extract, validators=validators)
     )
     return pd.DataFrame.from_records([asdict(r) for r in results])
 
 
+def first_paragraph(extract: str) -> str:
+    """
+    Return the first paragraph of the given plain text extract.
+    The TextExtracts intro is the whole lead section of the page while the
+    REST API summary is its first paragraph.
+    """
+    return next((p for p in extract.split("\n") if p.strip()), "")
+
+
+async def fetch_wikipedia_extracts_batch(
+    session: aiohttp.ClientSession, titles: Sequence[str]
+) -> list[WikipediaSummaryApiResult]:
+    """
+    Query English Wikipedia action API for the intro extracts of the given
+    page titles, at most `WIKIPEDIA_EXTRACTS_BATCH_SIZE`. The continuation
+    of the query is followed until every extract is returned.
+
+    The titles normalized or redirected by the API are mapped back to the
+    given titles. The extracts are reduced to their first paragraph, the
+    results are the same as `fetch_wikipedia_page_extract` ones, one per
+    given title. A page returned without an extract is an error.
+
+    :param session: The aiohttp ClientSession object.
+    :param titles:  The page titles, as found in the pages' URL.
+    """
+    results = [WikipediaSummaryApiResult(title=t) for t in titles]
+    params = {
+        "action": "query",
+        "prop": "extracts",
+        "exintro": 1,
+        "explaintext": 1,
+        "exlimit": len(titles),
+        "redirects": 1,
+        "titles": "|".join(unquote(t) for t in titles),
+        "format": "json",
+        "formatversion": 2,
+    }
+    url = f"{WIKIPEDIA_ACTION_API_ENDPOINT}?{urlencode(params)}"
+    error, skipped, error_msg, http_status = False, False, None, None
+    # Normalized, converted and redirected titles
+    aliases = {}
+    pages = {}
+    query_url = url
+    try:
+        # Every continued query returns at least an extract
+        for _ in range(len(titles)):
+            async with http_request(session, "get", query_url) as response:
+                http_status = response.status
+                if response.status < 200 or response.status >= 300:
+                    raise HTTPStatusError(
+                        f"Wrong status code: {response.status}"
+                    )
+                content: dict = await response.json()
+            query: dict = content.get("query", {})
+            for key in ["normalized", "converted", "redirects"]:
+                aliases.update({a["from"]: a["to"] for a in query.get(key, [])})
+            # The pages are returned by every continued query, with the
+            # extracts of the current query only.
+            for page in query.get("pages", []):
+                pages.setdefault(page["title"], {}).update(page)
+            if "continue" not in content:
+                break
+            query_url = f"{WIKIPEDIA_ACTION_API_ENDPOINT}?" + urlencode(
+                {**params, **content["continue"]}
+            )
+    except CircuitOpenError as e:
+        error, skipped, error_msg = True, True, str(e)
+    except (HTTPStatusError, aiohttp.ClientError, JSONDecodeError) as e:
+        error = True
+        error_msg = f"Error while querying Wikipedia with url {query_url}\n"
+        error_msg += f" Original exception: {e}"
+        logger.warning(error_msg)
+
+    timestamp = datetime.now(UTC)
+    for result in results:
+        result.info = url
+        result.http_status = http_status
+        result.timestamp = timestamp
+        result.error, result.skipped = error, skipped
+        result.error_msg = error_msg
+        if error:
+            continue
+        page_title = unquote(result.title)
+        visited = set()
+        while page_title in aliases and page_title not in visited:
+            visited.add(page_title)
+            page_title = aliases[page_title]
+        page = pages.get(page_title)
+        if page is None or page.get("missing") or page.get("invalid"):
+            result.error = True
+            result.error_msg = (
+                f"Page {result.title} not found with Wikipedia query {url}"
+            )
+            continue
+        if "extract" not in page:
+            result.error = True
+            result.error_msg = (
+                f"No extract of page {result.title} with Wikipedia query {url}"
+            )
+            continue
+        result.extract = first_paragraph(page["extract"])
+    return results
+
+
+async def fetch_wikipedia_extracts(titles: Sequence[str]) -> pd.DataFrame:
+    """
+    Batched version of `fetch_wikipedia_page_extracts`: the extracts are
+    queried by `WIKIPEDIA_EXTRACTS_BATCH_SIZE` titles.
+    """
+    title_chunks = list(
+        chunk_sequence(list(titles), WIKIPEDIA_EXTRACTS_BATCH_SIZE)
+    )
+    results = await perform_http_func_batch(
+        title_chunks, fetch_wikipedia_extracts_batch, max_conns=5
+    )
+    return pd.DataFrame.from_records(
+        [asdict(r) for r in it_chain.from_iterable(results)]
+    )
+
+
+async def download_file(
+    response: aiohttp.ClientResponse, url: str, directory: str
+) -> tuple[str, int]:
+    """
+    Stream the content of the given response to a temporary file, by
+    chunks. Return the path and the size of the file.
+
+    An `InvalidFileError` is raised, and no file is kept, when the content
+    type is not one of `WIKIMEDIA_FILE_CONTENT_TYPES` or when the content
+    is larger than `WIKIMEDIA_FILE_MAX_SIZE`.
+
+    :param response:    The response of the file request.
+    :param url:         The URL of the file.
+    :param directory:   The directory of the temporary file.
+    """
+    if not response.content_type.startswith(WIKIMEDIA_FILE_CONTENT_TYPES):
+        raise InvalidFileError(
+            f"Unexpected content type {response.content_type} of file {url}"
+        )
+    size = response_size(response)
+    if size is not None and size > WIKIMEDIA_FILE_MAX_SIZE:
+        raise InvalidFileError(f"File {url} is too large: {size} bytes.")
+
+    suffix = os.path.splitext(unquote(urlparse(url).path))[1]
+    file = tempfile.NamedTemporaryFile(
+        prefix="tsosi_", suffix=suffix, dir=directory, delete=False
+    )
+    size = 0
+    try:
+        with file:
+            async for chunk in response.content.iter_chunked(
+                WIKIMEDIA_FILE_CHUNK_SIZE
+            ):
+                size += len(chunk)
+                if size > WIKIMEDIA_FILE_MAX_SIZE:
+                    raise InvalidFileError(
+                        f"File {url} is larger than "
+                        f"{WIKIMEDIA_FILE_MAX_SIZE} bytes."
+                    )
+                file.write(chunk)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+    return file.name, size
+
+
 async def fetch_wikimedia_file(
-    session: aiohttp.ClientSession, url: str
+    session: aiohttp.ClientSession,
+    url: str,
+    directory: str,
+    validators: Mapping[str, HttpValidators] | None = None,
 ) -> WikimediaFileApiResult:
     """
     Perform a single HTTP request for the given URL.
     The URL is expected to reference a Wikimedia file.
+    The request is conditional when the URL has stored validators, the
+    file is not downloaded if it's unchanged.
+
+    The file is streamed to a temporary file in the given directory, see
+    `download_file`.
     """
     result = WikimediaFileApiResult(url=url)
     result.info = url
+    stored = validators.get(url) if validators else None
     headers = {"Referer": url}
+    if stored:
+        headers.update(stored.request_headers())
     try:
-        async with session.get(
-            url, allow_redirects=True, headers=headers
+        async with http_request(
+            session, "get", url, allow_redirects=True, headers=headers
         ) as response:
             result.http_status = response.status
-            if response.status < 200 or response.status >= 300:
-                raise HTTPStatusError(
-                    f"Wrong HTTP status code {response.status}"
-                )
-            result.file_bytes = await response.read()
             result.final_url = str(response.url)
-    except (HTTPStatusError, aiohttp.ClientError, JSONDecodeError) as e:
+            if not record_validators(result, response, stored):
+                if response.status < 200 or response.status >= 300:
+                    raise HTTPStatusError(
+                        f"Wrong HTTP status code {response.status}"
+                    )
+                result.content_type = response.content_type
+                result.file_path, result.file_size = await download_file(
+                    response, url, directory
+                )
+    except CircuitOpenError as e:
+        result.error = True
+        result.skipped = True
+        result.error_msg = str(e)
+    except (
+        HTTPStatusError,
+        InvalidFileError,
+        aiohttp.ClientError,
+        JSONDecodeError,
+    ) as e:
         result.error = True
         result.error_msg = f"Error while querying {url}\n"
         result.error_msg += f"Original exception:\n{e}"
@@ -293,15 +822,38 @@ async def fetch_wikimedia_file(
     return result
 
 
-async def fetch_wikimedia_files(urls: Sequence[str]) -> pd.DataFrame:
+def iter_wikimedia_files(
+    urls: Iterable[str],
+    batch_size: int = STREAM_BATCH_SIZE,
+    validators: Mapping[str, HttpValidators] | None = None,
+) -> Iterator[pd.DataFrame]:
     """
-    Perform HTTP requests for every given URLs.
+    Perform HTTP requests for every given URLs, yielding the results by
+    micro-batches as they are fetched.
     The URLs are expected to be referencing a file in wikimedia.
+    The requests are conditional for the URLs with stored validators, see
+    `fetch_wikimedia_file`.
 
     TODO: Rename and move this code and related methods/objects
     in a generic file fetching method.
     There's no special handling of the fact that it fecthes wikimedia files.
     It just performs HTTP GET on the provided URLs.
+
+    The files are downloaded to a temporary directory removed, along with
+    the remaining files, once the iteration ends or the generator is
+    closed. The caller can delete the files of a micro-batch once
+    processed.
     """
-    results = await perform_http_func_batch(urls, fetch_wikimedia_file, 1)
-    return pd.DataFrame.from_records([asdict(r) for r in results])
+    with tempfile.TemporaryDirectory(prefix="tsosi_") as directory:
+        func = partial(
+            fetch_wikimedia_file, validators=validators, directory=directory
+        )
+        batches = iter_http_func_batch(
+            urls, func, max_conns=1, batch_size=batch_size
+        )
+        try:
+            for results in batches:
+                yield pd.DataFrame.from_records([asdict(r) for r in results])
+        finally:
+            # Stop the downloads before removing the directory
+            batches.close()
@@ -54,6 +54,17 @@ def uga_wikipedia_summary() -> dict:
     return file_content
 
 
+@pytest.fixture
+def uga_wbgetentities() -> dict:
+    fixture_path = (
+        Path(__file__).resolve().parent
+        / "fixtures/wikidata_wbgetentities_Q945876.json"
+    )
+    with open(fixture_path, "r") as f:
+        file_content = json.load(f)
+    return file_content
+
+
 @pytest.fixture
 def uga_logo() -> bytes:
     fixture_path = (
@@ -0,0 +1,266 @@
+from datetime import UTC, date, datetime, timedelta
+
+import pytest
+from tsosi.data.currencies import conversion
+from tsosi.data.currencies.conversion import bump_rates_version
+from tsosi.data.enrichment.analytics import (
+    ANALYTICS_WATERMARK,
+    ANALYTICS_WATERMARK_MARGIN,
+    analytics_affected_recipients,
+    compute_analytics,
+    recipients_with_stale_counts,
+)
+from tsosi.models import (
+    Analytic,
+    AnalyticRollup,
+    Currency,
+    CurrencyRate,
+    Entity,
+    Transfer,
+    Watermark,
+)
+from tsosi.models.analytics import (
+    ANALYTIC_DIMENSION_AGENT,
+    ANALYTIC_DIMENSION_EMITTER,
+    ANALYTIC_DIMENSION_EMITTER_TYPE,
+    ANALYTIC_DIMENSION_MONTH,
+)
+from tsosi.models.date import DATE_PRECISION_DAY
+
+from ..factories import EntityFactory, TransferFactory
+
+
+def analytics_by_key() -> dict:
+    return {
+        (a.country, str(a.recipient_id), a.year): a
+        for a in Analytic.objects.all()
+    }
+
+
+@pytest.mark.django_db
+def test_compute_analytics_incremental(registries, datasources):
+    print("Testing the incremental computation of analytics.")
+    emitter_fr = EntityFactory.create(country="FR")
+    emitter_de = EntityFactory.create(country="DE")
+    emitter_none = EntityFactory.create(country=None)
+    recipient_1 = EntityFactory.create()
+    recipient_2 = EntityFactory.create()
+    date_2023 = {"value": "2023-05-01", "precision": "day"}
+    date_2024 = {"value": "2024-05-01", "precision": "day"}
+
+    t_1 = TransferFactory.create(
+        emitter=emitter_fr,
+        recipient=recipient_1,
+        date_clc=date_2023,
+        amounts_clc={"USD": 100, "EUR": 90},
+    )
+    TransferFactory.create(
+        emitter=emitter_fr,
+        recipient=recipient_1,
+        date_clc=date_2023,
+        amounts_clc={"USD": 50, "EUR": 45},
+    )
+    TransferFactory.create(
+        emitter=emitter_none,
+        recipient=recipient_1,
+        date_clc=date_2024,
+        amounts_clc={"USD": 10, "EUR": 9},
+    )
+    TransferFactory.create(
+        emitter=emitter_de,
+        recipient=recipient_2,
+        date_clc=date_2024,
+        amounts_clc={"USD": 20, "EUR": 18},
+    )
+
+    compute_analytics()
+
+    analytics = analytics_by_key()
+    assert len(analytics) == 3
+    cell = analytics[("FR", str(recipient_1.id), 2023)]
+    assert cell.data == {"USD": 150, "EUR": 135, "count": 2}
+    assert analytics[(None, str(recipient_1.id), 2024)].data["count"] == 1
+    untouched_id = analytics[("DE", str(recipient_2.id), 2024)].id
+
+    # Re-date a transfer: its old cell is updated and a new one is created.
+    Transfer.objects.filter(id=t_1.id).update(
+        date_clc=date_2024, date_last_updated=datetime.now(UTC)
+    )
+    compute_analytics()
+
+    analytics = analytics_by_key()
+    assert len(analytics) == 4
+    assert analytics[("FR", str(recipient_1.id), 2023)].id == cell.id
+    assert analytics[("FR", str(recipient_1.id), 2023)].data == {
+        "USD": 50,
+        "EUR": 45,
+        "count": 1,
+    }
+    assert analytics[("FR", str(recipient_1.id), 2024)].data["USD"] == 100
+    assert analytics[(None, str(recipient_1.id), 2024)].data["count"] == 1
+    assert analytics[("DE", str(recipient_2.id), 2024)].id == untouched_id
+
+    # Emitter country change: the cell moves to the new country.
+    emitter_de.country = "IT"
+    emitter_de.save()
+    compute_analytics()
+
+    analytics = analytics_by_key()
+    assert ("DE", str(recipient_2.id), 2024) not in analytics
+    assert analytics[("IT", str(recipient_2.id), 2024)].data["USD"] == 20
+
+    # A full run yields the same result
+    before = {k: a.data for k, a in analytics_by_key().items()}
+    compute_analytics(full=True)
+    assert {k: a.data for k, a in analytics_by_key().items()} == before
+
+
+@pytest.mark.django_db
+def test_compute_analytic_rollups(registries, datasources):
+    print("Testing the computation of analytic rollups.")
+    emitter_1 = EntityFactory.create(types=["education", "funder"])
+    emitter_2 = EntityFactory.create(types=None)
+    agent = EntityFactory.create()
+    recipient = EntityFactory.create()
+
+    TransferFactory.create(
+        emitter=emitter_1,
+        recipient=recipient,
+        agents=[agent],
+        date_clc={"value": "2023-05-01", "precision": "day"},
+        amounts_clc={"USD": 100, "EUR": 90},
+    )
+    TransferFactory.create(
+        emitter=emitter_1,
+        recipient=recipient,
+        date_clc={"value": "2023-05-01", "precision": "month"},
+        amounts_clc={"USD": 50, "EUR": 45},
+    )
+    TransferFactory.create(
+        emitter=emitter_2,
+        recipient=recipient,
+        agents=[agent],
+        date_clc={"value": "2023-01-01", "precision": "year"},
+        amounts_clc={"USD": 10, "EUR": 9},
+    )
+
+    compute_analytics()
+
+    rollups = {
+        (r.dimension, r.key): r.data
+        for r in AnalyticRollup.objects.filter(recipient=recipient, year=2023)
+    }
+    assert rollups == {
+        (ANALYTIC_DIMENSION_EMITTER, str(emitter_1.id)): {
+            "USD": 150,
+            "EUR": 135,
+            "count": 2,
+        },
+        (ANALYTIC_DIMENSION_EMITTER, str(emitter_2.id)): {
+            "USD": 10,
+            "EUR": 9,
+            "count": 1,
+        },
+        (ANALYTIC_DIMENSION_AGENT, str(agent.id)): {
+            "USD": 110,
+            "EUR": 99,
+            "count": 2,
+        },
+        # The year-precision transfer has no month
+        (ANALYTIC_DIMENSION_MONTH, "5"): {"USD": 150, "EUR": 135, "count": 2},
+        (ANALYTIC_DIMENSION_EMITTER_TYPE, "education"): {
+            "USD": 150,
+            "EUR": 135,
+            "count": 2,
+        },
+        (ANALYTIC_DIMENSION_EMITTER_TYPE, "funder"): {
+            "USD": 150,
+            "EUR": 135,
+            "count": 2,
+        },
+    }
+
+
+@pytest.mark.django_db
+def test_compute_analytics_rates_change(registries, datasources, monkeypatch):
+    print("Testing the recomputation of analytics after a rates change.")
+    monkeypatch.setattr(conversion, "_shared_rate_table", None)
+    Currency.objects.create(id="USD", name="US Dollar")
+    Currency.objects.create(id="EUR", name="Euro")
+    rate = CurrencyRate.objects.create(
+        currency_id="EUR",
+        date=date(2023, 5, 1),
+        precision=DATE_PRECISION_DAY,
+        value=0.5,
+    )
+    recipient = EntityFactory.create()
+    # The amounts are converted on read from the USD amount
+    transfer = TransferFactory.create(
+        recipient=recipient,
+        date_clc={"value": "2023-05-01", "precision": "day"},
+        amount_usd=100,
+    )
+    Transfer.objects.filter(id=transfer.id).update(amounts_clc=None)
+    bump_rates_version()
+    compute_analytics()
+    assert Analytic.objects.get(recipient=recipient).data["EUR"] == 50
+
+    # No transfer was updated but the rates changed: the stored
+    # analytics are recomputed with the new rates.
+    rate.value = 0.8
+    rate.save()
+    bump_rates_version()
+    compute_analytics()
+    assert Analytic.objects.get(recipient=recipient).data["EUR"] == 80
+
+
+@pytest.mark.django_db
+def test_compute_analytics_missed_updates(registries, datasources):
+    print("Testing the analytics of late commits and deleted transfers.")
+    recipient_1 = EntityFactory.create()
+    recipient_2 = EntityFactory.create()
+    date_2023 = {"value": "2023-05-01", "precision": "day"}
+    t_1 = TransferFactory.create(
+        recipient=recipient_1, date_clc=date_2023, amounts_clc={"USD": 100}
+    )
+    TransferFactory.create(
+        recipient=recipient_1, date_clc=date_2023, amounts_clc={"USD": 50}
+    )
+    t_3 = TransferFactory.create(
+        recipient=recipient_2, date_clc=date_2023, amounts_clc={"USD": 10}
+    )
+    compute_analytics()
+    # The watermark is taken before the start of the run
+    watermark = Watermark.get_date_value(ANALYTICS_WATERMARK)
+    assert watermark < datetime.now(UTC) - ANALYTICS_WATERMARK_MARGIN / 2
+
+    # Nothing changed since an older run
+    watermark = datetime.now(UTC) - timedelta(days=1)
+    Watermark.set_date_value(ANALYTICS_WATERMARK, watermark)
+    old_date = watermark - timedelta(days=1)
+    Transfer.objects.update(date_last_updated=old_date)
+    Entity.objects.update(date_last_updated=old_date)
+    assert analytics_affected_recipients(watermark) == set()
+
+    # A transfer committed late, with an update date close to the watermark
+    Transfer.objects.filter(id=t_3.id).update(
+        amounts_clc={"USD": 20},
+        date_last_updated=watermark + timedelta(seconds=1),
+    )
+    # A deleted transfer, the recipient keeps other transfers
+    Transfer.objects.filter(id=t_1.id).delete()
+    assert analytics_affected_recipients(watermark) == {
+        recipient_1.id,
+        recipient_2.id,
+    }
+
+    compute_analytics()
+    analytics = {a.recipient_id: a.data["USD"] for a in Analytic.objects.all()}
+    assert analytics == {recipient_1.id: 50, recipient_2.id: 20}
+
+    # A recipient without any transfer left
+    Transfer.objects.filter(recipient=recipient_2).delete()
+    assert recipients_with_stale_counts() == {recipient_2.id}
+    compute_analytics()
+    assert not Analytic.objects.filter(recipient=recipient_2).exists()
+    assert recipients_with_stale_counts() == set()
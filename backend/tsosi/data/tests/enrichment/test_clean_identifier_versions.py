@@ -157,3 +157,58 @@ def test_clean_identifier_versions(registries):
 
     id_2 = Identifier.objects.get(id=id_2.id)
     assert id_2.current_version == id_2_v_2
+
+
+@pytest.mark.django_db
+def test_clean_identifier_versions_incremental(registries):
+    print("Testing the incremental cleaning of identifier versions.")
+    id_1 = IdentifierFactory.create()
+    id_2 = IdentifierFactory.create()
+    record_v_1 = {"names": [{"value": "UJF", "types": ["ror_display"]}]}
+    record_v_2 = {"names": [{"value": "UGA", "types": ["ror_display"]}]}
+    id_1_v_1 = IdentifierVersionFactory.create(
+        identifier=id_1,
+        value=record_v_1,
+        date_start=datetime(year=2020, month=1, day=1, tzinfo=UTC),
+        date_end=datetime(year=2021, month=1, day=1, tzinfo=UTC),
+    )
+    id_1_v_2 = IdentifierVersionFactory.create(
+        identifier=id_1,
+        value=record_v_2,
+        date_start=datetime(year=2021, month=1, day=1, tzinfo=UTC),
+    )
+    id_2_v_1 = IdentifierVersionFactory.create(
+        identifier=id_2,
+        value=record_v_1,
+        date_start=datetime(year=2020, month=1, day=1, tzinfo=UTC),
+    )
+    # First run processes everything and sets the watermark
+    clean_identifier_versions()
+    assert IdentifierVersion.objects.count() == 3
+
+    # Only id_2 received a new version, with the same stored value
+    id_2_v_1.date_end = datetime(year=2022, month=1, day=1, tzinfo=UTC)
+    id_2_v_1.save()
+    id_2_v_2 = IdentifierVersionFactory.create(
+        identifier=id_2,
+        value={"names": [{"types": ["ror_display"], "value": "UJF"}]},
+        date_start=datetime(year=2022, month=1, day=1, tzinfo=UTC),
+    )
+    id_2.current_version = id_2_v_2
+    id_2.save()
+    assert id_2_v_2.content_hash == id_2_v_1.content_hash
+
+    versions = identifier_versions_for_cleaning(since_version_id=id_2_v_1.id)
+    assert set(versions["id"]) == {id_2_v_1.id, id_2_v_2.id}
+
+    clean_identifier_versions()
+
+    assert set(IdentifierVersion.objects.values_list("id", flat=True)) == {
+        id_1_v_1.id,
+        id_1_v_2.id,
+        id_2_v_1.id,
+    }
+    id_2_v_1.refresh_from_db()
+    assert id_2_v_1.date_end is None
+    id_2.refresh_from_db()
+    assert id_2.current_version == id_2_v_1
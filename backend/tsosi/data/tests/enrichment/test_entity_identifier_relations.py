@@ -3,6 +3,7 @@ from datetime import UTC, datetime
 import pandas as pd
 import pytest
 from tsosi.data.enrichment.database_related import (
+    existing_identifier_relations,
     ingest_entity_identifier_relations,
 )
 from tsosi.models import Identifier, IdentifierEntityMatching
@@ -151,3 +152,30 @@ def test_rels_ingestion(registries):
     i_m_4 = IdentifierEntityMatching.objects.get(identifier=i_4)
     assert i_m_4.date_end is None
     assert i_m_4.entity == e_4
+
+
+@pytest.mark.django_db
+def test_existing_identifier_relations(registries):
+    print("Testing the targeted loading of existing identifier relations.")
+    e_0 = EntityFactory.create()
+    e_1 = EntityFactory.create()
+    e_2 = EntityFactory.create()
+    i_0 = IdentifierFactory.create(
+        value="i0", entity=e_0, registry_id=REGISTRY_ROR
+    )
+    i_1 = IdentifierFactory.create(
+        value="i1", entity=e_1, registry_id=REGISTRY_ROR
+    )
+    IdentifierFactory.create(value="i2", entity=e_2, registry_id=REGISTRY_ROR)
+    i_3 = IdentifierFactory.create(
+        value="i3", entity=None, registry_id=REGISTRY_ROR
+    )
+
+    relations = existing_identifier_relations(
+        REGISTRY_ROR, ["i0", "i3", "unknown"], [str(e_0.id), str(e_1.id)]
+    )
+
+    assert set(relations.index) == {i_0.id, i_1.id, i_3.id}
+    assert relations.loc[i_0.id, "entity_id"] == str(e_0.id)
+    assert relations.loc[i_1.id, "identifier_value"] == "i1"
+    assert pd.isna(relations.loc[i_3.id, "entity_id"])
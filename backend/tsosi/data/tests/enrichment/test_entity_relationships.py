@@ -0,0 +1,63 @@
+import pytest
+from tsosi.data.enrichment.database_related import (
+    update_entities_relationships,
+)
+from tsosi.models import Entity
+from tsosi.models.static_data import REGISTRY_ROR
+
+from ..factories import EntityFactory, IdentifierFactory
+
+
+@pytest.mark.django_db
+def test_update_entities_relationships(registries):
+    print("Testing the bulk update of entity parent relationships.")
+    child_1 = EntityFactory.create()
+    child_2 = EntityFactory.create()
+    parent_1 = EntityFactory.create()
+    parent_2 = EntityFactory.create()
+    parent_3 = EntityFactory.create()
+    IdentifierFactory.create(
+        registry_id=REGISTRY_ROR, value="000000001", entity=parent_1
+    )
+    IdentifierFactory.create(
+        registry_id=REGISTRY_ROR, value="000000002", entity=parent_2
+    )
+    IdentifierFactory.create(
+        registry_id=REGISTRY_ROR, value="000000003", entity=parent_3
+    )
+    child_1.parents.add(parent_1, parent_3)
+    child_2.parents.add(parent_3)
+    child_3 = EntityFactory.create()
+    child_3.parents.add(parent_1)
+    dates = dict(Entity.objects.values_list("id", "date_last_updated"))
+
+    update_entities_relationships(
+        {
+            # Keep parent_1, drop parent_3, add parent_2, ignore unknown PID
+            child_1.id: ["000000001", "000000002", "000000009"],
+            # Drop every parent
+            child_2.id: None,
+            # Unchanged
+            child_3.id: ["000000001"],
+        }
+    )
+
+    assert set(child_1.parents.values_list("id", flat=True)) == {
+        parent_1.id,
+        parent_2.id,
+    }
+    assert not child_2.parents.exists()
+    assert set(parent_3.children.all()) == set()
+    # Only the children whose parents changed are flagged as updated
+    new_dates = dict(Entity.objects.values_list("id", "date_last_updated"))
+    assert {i for i in dates if new_dates[i] != dates[i]} == {
+        child_1.id,
+        child_2.id,
+    }
+
+    # Running it again with the same input is a no-op
+    update_entities_relationships(
+        {child_1.id: ["000000001", "000000002"], child_2.id: []}
+    )
+    assert child_1.parents.count() == 2
+    assert child_2.parents.count() == 0
@@ -5,7 +5,18 @@ from tsosi.data.enrichment.api_related import (
     identifiers_for_refresh,
     refresh_identifier_records,
 )
-from tsosi.models import IdentifierRequest, IdentifierVersion
+from tsosi.data.pid_registry.ror import (
+    iter_ror_records,
+    ror_record_extractor,
+    ror_record_projection,
+    ror_record_url,
+)
+from tsosi.data.pid_registry.versions import (
+    compact_identifier_versions,
+    version_content_hash,
+)
+from tsosi.data.utils import canonical_json_hash
+from tsosi.models import HttpValidator, IdentifierRequest, IdentifierVersion
 from tsosi.models.static_data import REGISTRY_ROR
 
 from ..factories import (
@@ -41,6 +52,9 @@ def test_identifiers_for_refresh(registries):
     ids = identifiers_for_refresh(identifier.registry_id, query_threshold=2)
     assert len(ids) == 1
     assert ids["id"][0] == identifier.id
+    # Only the content hash of the current version is loaded
+    assert "record" not in ids.columns
+    assert ids["content_hash"][0] == id_version.content_hash
 
     # Already attempted fetch
     r_1 = IdentifierRequestFactory.create(identifier=identifier, timestamp=now)
@@ -53,6 +67,11 @@ def test_identifiers_for_refresh(registries):
     assert ids["id"][0] == identifier.id
 
 
+@pytest.fixture
+def compact_storage(settings):
+    settings.TSOSI_IDENTIFIER_VERSION_STORAGE = "compact"
+
+
 @pytest.mark.django_db
 def test_refresh_identifier_records(registries, mocker, uga_ror_record):
     print("Testing correct refresh of identifier records.")
@@ -89,6 +108,10 @@ def test_refresh_identifier_records(registries, mocker, uga_ror_record):
     assert id_v_2.identifier == id_1
     assert id_v_2.date_end is None
     assert id_v_2 == id_1.current_version
+    assert id_v_2.value == uga_ror_record
+    assert id_v_2.content_hash == version_content_hash(
+        REGISTRY_ROR, uga_ror_record
+    )
 
     # Try again when the record should not have changed.
     # Only the date_last_fetched should be updated
@@ -112,6 +135,63 @@ def test_refresh_identifier_records(registries, mocker, uga_ror_record):
     assert all(r.identifier == id_1 for r in reqs)
 
 
+@pytest.mark.django_db
+def test_refresh_not_modified_record(
+    registries, mocker, uga_ror_record, compact_storage
+):
+    print("Testing refresh of identifier records with conditional requests.")
+    id_1 = IdentifierFactory.create(registry_id=REGISTRY_ROR, value="02rx3b187")
+    a_while_ago = datetime.now(UTC) - timedelta(days=30)
+    id_v_1 = IdentifierVersionFactory.create(
+        identifier=id_1,
+        value={"NOT_FROM_ROR": True},
+        date_start=a_while_ago,
+        date_last_fetched=a_while_ago,
+    )
+    id_1.current_version = id_v_1
+    id_1.save()
+
+    # The validators of the fetched record are stored
+    resp = MockAiohttpResponse(
+        json=uga_ror_record,
+        headers={
+            "ETag": '"v1"',
+            "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT",
+        },
+    )
+    get_mock = mocker.patch("aiohttp.ClientSession.get", return_value=resp)
+    refresh_identifier_records(REGISTRY_ROR, use_tokens=False)
+    assert get_mock.call_args.kwargs["headers"] == {}
+    validator = HttpValidator.objects.get(url=ror_record_url("02rx3b187"))
+    assert validator.etag == '"v1"'
+
+    # Not modified record: only the date_last_fetched is updated
+    id_1.refresh_from_db()
+    id_v_2 = id_1.current_version
+    id_v_2.date_last_fetched = a_while_ago
+    id_v_2.save()
+    c_date = datetime.now(UTC)
+    get_mock.return_value = MockAiohttpResponse(status=304)
+    result = refresh_identifier_records(REGISTRY_ROR, use_tokens=False)
+    assert not result.partial
+    assert not result.data_modified
+    assert get_mock.call_args.kwargs["headers"] == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT",
+    }
+
+    id_v_2.refresh_from_db()
+    assert IdentifierVersion.objects.count() == 2
+    assert id_v_2.date_last_fetched > c_date
+    assert id_v_2.date_end is None
+    assert id_v_2.value == ror_record_projection(uga_ror_record)
+    request = IdentifierRequest.objects.latest("timestamp")
+    assert request.http_status == 304
+    assert not request.error
+    # The validators are kept
+    assert HttpValidator.objects.get(url=validator.url).etag == '"v1"'
+
+
 @pytest.fixture
 def identifier_fetch_setting(settings):
     settings.TSOSI_IDENTIFIER_FETCH_RETRY = 2
@@ -176,3 +256,96 @@ def test_refresh_corrupted_ror_record(
 
     requests = IdentifierRequest.objects.all()
     assert len(requests) == 2
+
+
+@pytest.mark.django_db
+def test_refresh_identifier_records_compact_storage(
+    registries, mocker, uga_ror_record, compact_storage
+):
+    print("Testing the refresh of identifier records with compact storage.")
+    id_1 = IdentifierFactory.create(registry_id=REGISTRY_ROR, value="02rx3b187")
+    a_while_ago = datetime.now(UTC) - timedelta(days=30)
+    id_v_1 = IdentifierVersionFactory.create(
+        identifier=id_1,
+        value={"NOT_FROM_ROR": True},
+        date_start=a_while_ago,
+        date_last_fetched=a_while_ago,
+    )
+    id_1.current_version = id_v_1
+    id_1.save()
+
+    resp = MockAiohttpResponse(json=uga_ror_record)
+    mocker.patch("aiohttp.ClientSession.get", return_value=resp)
+
+    refresh_identifier_records(REGISTRY_ROR, use_tokens=False)
+
+    id_1.refresh_from_db()
+    id_v_2 = id_1.current_version
+    # Only the fields used by the extractor are stored
+    assert id_v_2.value == ror_record_projection(uga_ror_record)
+    assert "admin" not in id_v_2.value
+    assert ror_record_extractor(id_v_2.value) == ror_record_extractor(
+        uga_ror_record
+    )
+    assert id_v_2.content_hash == canonical_json_hash(id_v_2.value)
+
+
+@pytest.mark.django_db
+def test_refresh_identifier_records_batches(registries, mocker, uga_ror_record):
+    print("Testing the persistence of the refreshed records by batches.")
+    a_while_ago = datetime.now(UTC) - timedelta(days=30)
+    identifiers = []
+    for value in ["02rx3b187", "05sbt2524"]:
+        identifier = IdentifierFactory.create(
+            registry_id=REGISTRY_ROR, value=value
+        )
+        identifier.current_version = IdentifierVersionFactory.create(
+            identifier=identifier,
+            value={"NOT_FROM_ROR": True},
+            date_start=a_while_ago,
+            date_last_fetched=a_while_ago,
+        )
+        identifier.save()
+        identifiers.append(identifier)
+
+    resp = MockAiohttpResponse(json=uga_ror_record)
+    mocker.patch("aiohttp.ClientSession.get", return_value=resp)
+
+    # The fetching fails after the first batch
+    fetched = []
+
+    def interrupted_batches(values):
+        fetched.append(list(values)[0])
+        yield from iter_ror_records(fetched)
+        raise RuntimeError("Connection lost")
+
+    mocker.patch(
+        "tsosi.data.enrichment.api_related.iter_conditional_ror_records",
+        interrupted_batches,
+    )
+    with pytest.raises(RuntimeError):
+        refresh_identifier_records(REGISTRY_ROR, use_tokens=False)
+
+    # The first batch is persisted
+    for identifier in identifiers:
+        identifier.refresh_from_db()
+        if identifier.value in fetched:
+            assert identifier.current_version.value == uga_ror_record
+        else:
+            assert identifier.current_version.value == {"NOT_FROM_ROR": True}
+    assert IdentifierRequest.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_compact_identifier_versions(registries, uga_ror_record):
+    print("Testing the explicit compaction of the identifier versions.")
+    id_1 = IdentifierFactory.create(registry_id=REGISTRY_ROR, value="02rx3b187")
+    id_v_1 = IdentifierVersionFactory.create(
+        identifier=id_1, value=uga_ror_record
+    )
+    assert compact_identifier_versions() == 1
+    id_v_1.refresh_from_db()
+    assert id_v_1.value == ror_record_projection(uga_ror_record)
+    assert id_v_1.content_hash == canonical_json_hash(id_v_1.value)
+    # Already compacted versions are left as is
+    assert compact_identifier_versions() == 0
@@ -81,6 +81,46 @@ def test_merging(datasources):
     assert list(t_a.agents.all()) == [e_1]
 
 
+@pytest.mark.django_db
+def test_merging_many_entities(datasources):
+    print("Testing merging of several entities into the same one.")
+    e_1 = EntityFactory.create()
+    e_merged_1 = EntityFactory.create()
+    e_merged_2 = EntityFactory.create()
+    e_other = EntityFactory.create()
+    t_e = TransferFactory.create(emitter=e_merged_1, recipient=e_merged_2)
+    # The agents would be duplicated after merging
+    t_a_1 = TransferFactory.create(agents=[e_merged_1, e_1])
+    t_a_2 = TransferFactory.create(agents=[e_merged_1, e_merged_2, e_other])
+    t_untouched = TransferFactory.create(agents=[e_other])
+
+    merge_data = pd.DataFrame(
+        [
+            {
+                "entity_id": e.id,
+                "merged_with_id": e_1.id,
+                "merged_criteria": "Test merge",
+                "match_criteria": MATCH_CRITERIA_MERGED,
+                "match_source": MATCH_SOURCE_AUTOMATIC,
+            }
+            for e in [e_merged_1, e_merged_2]
+        ]
+    )
+    date_update = datetime.now(UTC)
+    merge_entities(merge_data, date_update)
+
+    for t in [t_e, t_a_1, t_a_2, t_untouched]:
+        t.refresh_from_db()
+    assert t_e.emitter == e_1
+    assert t_e.recipient == e_1
+    assert t_e.date_last_updated >= date_update
+    assert list(t_a_1.agents.all()) == [e_1]
+    assert set(t_a_2.agents.all()) == {e_1, e_other}
+    assert t_a_2.date_last_updated >= date_update
+    assert list(t_untouched.agents.all()) == [e_other]
+    assert t_untouched.date_last_updated < date_update
+
+
 @pytest.mark.django_db
 def test_self_merging():
     """Self merging inputs should be discarded so nothing happens."""
@@ -1,10 +1,13 @@
+import os
 from datetime import UTC, datetime, timedelta
+from pathlib import Path
 
 import pytest
 from tsosi.data.enrichment.api_related import (
     entities_for_logo_update,
     update_logos,
 )
+from tsosi.data.pid_registry import wikidata
 from tsosi.models.entity import (
     ENTITY_REQUEST_WIKIMEDIA_LOGO,
     ENTITY_REQUEST_WIKIPEDIA_EXTRACT,
@@ -85,7 +88,9 @@ def test_update_logo(storage, mocker, uga_logo):
     assert len(e_requests) == 0
 
     # Patch the API call
-    resp = MockAiohttpResponse(content=uga_logo, url=logo_url)
+    resp = MockAiohttpResponse(
+        content=uga_logo, url=logo_url, content_type="image/jpeg"
+    )
     mocker.patch("aiohttp.ClientSession.get", return_value=resp)
 
     res = update_logos(use_tokens=False)
@@ -99,6 +104,53 @@ def test_update_logo(storage, mocker, uga_logo):
     assert e_requests[0].entity.id == entity.id
 
 
+@pytest.mark.django_db
+def test_update_logo_not_modified(storage, mocker, uga_logo):
+    print("Testing logo update with conditional requests.")
+    logo_url = "http://commons.wikimedia.org/wiki/Special:FilePath/UGA_logo.jpg"
+    entity = EntityFactory.create(logo_url=logo_url)
+    resp = MockAiohttpResponse(
+        content=uga_logo,
+        url=logo_url,
+        headers={"ETag": '"logo-v1"'},
+        content_type="image/jpeg",
+    )
+    get_mock = mocker.patch("aiohttp.ClientSession.get", return_value=resp)
+    update_logos(use_tokens=False)
+    entity.refresh_from_db()
+    logo_name = entity.logo.name
+
+    # Not modified file: the stored file is kept
+    a_while_ago = datetime.now(UTC) - timedelta(days=30)
+    entity.date_logo_fetched = a_while_ago
+    entity.save()
+    get_mock.return_value = MockAiohttpResponse(status=304, url=logo_url)
+    res = update_logos(use_tokens=False)
+    assert not res.partial
+    assert not res.data_modified
+    assert get_mock.call_args.kwargs["headers"]["If-None-Match"] == '"logo-v1"'
+
+    entity.refresh_from_db()
+    assert entity.logo.name == logo_name
+    assert entity.date_logo_fetched > a_while_ago
+    assert EntityRequest.objects.count() == 2
+
+    # Server ignoring the conditional request with the same ETag: the file
+    # is not downloaded.
+    entity.date_logo_fetched = a_while_ago
+    entity.save()
+    get_mock.return_value = MockAiohttpResponse(
+        content=b"unread",
+        url=logo_url,
+        headers={"ETag": '"logo-v1"'},
+        content_type="image/jpeg",
+    )
+    update_logos(use_tokens=False)
+    entity.refresh_from_db()
+    assert entity.logo.name == logo_name
+    assert entity.date_logo_fetched > a_while_ago
+
+
 @pytest.fixture
 def wiki_logo_retry(settings):
     settings.TSOSI_WIKI_FETCH_RETRY = 2
@@ -147,3 +199,75 @@ def test_update_corrupted_logo(storage, wiki_logo_retry, mocker):
     assert not entity.logo
     assert entity.date_logo_fetched is None
     assert len(e_requests) == 2
+
+
+@pytest.mark.django_db
+def test_update_logo_rejected_file(storage, uga_logo, mocker, monkeypatch):
+    print("Testing the rejection of too large or non-image logo files.")
+    logo_url = "http://commons.wikimedia.org/wiki/Special:FilePath/Logo%20Universit%C3%A9%20Grenoble-Alpes%20%282020%29.jpg"
+    entity = EntityFactory.create(logo_url=logo_url)
+    unlink = mocker.spy(os, "unlink")
+
+    # Unexpected content type
+    resp = MockAiohttpResponse(
+        content=b"<html></html>", url=logo_url, content_type="text/html"
+    )
+    mocker.patch("aiohttp.ClientSession.get", return_value=resp)
+    res = update_logos(use_tokens=False)
+    entity.refresh_from_db()
+    assert res.partial
+    assert not entity.logo
+    e_request = EntityRequest.objects.get()
+    assert e_request.error
+    assert "content type" in e_request.error_msg
+
+    # File larger than the maximum size, the partial download is deleted
+    monkeypatch.setattr(wikidata, "WIKIMEDIA_FILE_MAX_SIZE", 1000)
+    monkeypatch.setattr(wikidata, "WIKIMEDIA_FILE_CHUNK_SIZE", 100)
+    resp = MockAiohttpResponse(
+        content=uga_logo, url=logo_url, content_type="image/jpeg"
+    )
+    mocker.patch("aiohttp.ClientSession.get", return_value=resp)
+    res = update_logos(use_tokens=False)
+    entity.refresh_from_db()
+    assert res.partial
+    assert not entity.logo
+    assert unlink.call_count == 1
+    assert not Path(unlink.call_args.args[0]).exists()
+    assert "larger than" in EntityRequest.objects.latest("timestamp").error_msg
+
+    # The temporary file of a stored logo is deleted
+    monkeypatch.setattr(wikidata, "WIKIMEDIA_FILE_MAX_SIZE", len(uga_logo))
+    unlink = mocker.spy(Path, "unlink")
+    res = update_logos(use_tokens=False)
+    entity.refresh_from_db()
+    assert not res.partial
+    assert entity.logo.size == len(uga_logo)
+    assert unlink.call_count == 1
+
+
+@pytest.mark.django_db
+def test_update_logo_interrupted(storage, uga_logo, mocker, tmp_path):
+    print("Testing the deletion of the downloaded logos on failure.")
+    mocker.patch("tempfile.tempdir", str(tmp_path))
+    logo_urls = [
+        f"http://commons.wikimedia.org/wiki/Special:FilePath/Logo_{i}.jpg"
+        for i in range(30)
+    ]
+    for url in logo_urls:
+        EntityFactory.create(logo_url=url)
+    mocker.patch(
+        "aiohttp.ClientSession.get",
+        side_effect=lambda url, **kwargs: MockAiohttpResponse(
+            content=uga_logo, url=url, content_type="image/jpeg"
+        ),
+    )
+    mocker.patch(
+        "tsosi.data.enrichment.api_related.store_logo_results",
+        side_effect=RuntimeError("Storage failure"),
+    )
+
+    with pytest.raises(RuntimeError):
+        update_logos(use_tokens=False)
+    # The files of the batches downloaded but not processed are deleted
+    assert list(tmp_path.iterdir()) == []
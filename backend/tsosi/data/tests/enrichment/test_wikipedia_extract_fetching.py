@@ -144,3 +144,147 @@ def test_update_corrupted_wikipedia_extract(wiki_fetch_setting, mocker):
     assert entity.date_wikipedia_fetched is None
     assert len(e_requests) == 2
     assert all(r.entity.id == entity.id for r in e_requests)
+
+
+@pytest.fixture
+def query_backend(settings):
+    settings.TSOSI_WIKIPEDIA_EXTRACT_BACKEND = "query"
+
+
+@pytest.mark.django_db
+def test_update_wikipedia_extract_batch(mocker, query_backend):
+    print("Testing the batched update of wikipedia extracts.")
+    uga = EntityFactory.create(
+        wikipedia_url="https://en.wikipedia.org/wiki/Grenoble_Alpes_University"
+    )
+    redirected = EntityFactory.create(
+        wikipedia_url="https://en.wikipedia.org/wiki/Universit%C3%A9_Grenoble_Alpes"
+    )
+    missing = EntityFactory.create(
+        wikipedia_url="https://en.wikipedia.org/wiki/Something_Here_is_Wrong_test"
+    )
+    resp = MockAiohttpResponse(
+        json={
+            "batchcomplete": True,
+            "query": {
+                "normalized": [
+                    {
+                        "from": "Grenoble_Alpes_University",
+                        "to": "Grenoble Alpes University",
+                    },
+                    {
+                        "from": "Université_Grenoble_Alpes",
+                        "to": "Université Grenoble Alpes",
+                    },
+                    {
+                        "from": "Something_Here_is_Wrong_test",
+                        "to": "Something Here is Wrong test",
+                    },
+                ],
+                "redirects": [
+                    {
+                        "from": "Université Grenoble Alpes",
+                        "to": "Grenoble Alpes University",
+                    }
+                ],
+                "pages": [
+                    {
+                        "pageid": 4865950,
+                        "ns": 0,
+                        "title": "Grenoble Alpes University",
+                        "extract": (
+                            "The Grenoble Alpes University is a public "
+                            "research university.\nIt was founded in 2016."
+                        ),
+                    },
+                    {
+                        "ns": 0,
+                        "title": "Something Here is Wrong test",
+                        "missing": True,
+                    },
+                ],
+            },
+        }
+    )
+    get_mock = mocker.patch("aiohttp.ClientSession.get", return_value=resp)
+
+    res = update_wikipedia_extract(use_tokens=False)
+    # A single request for the 3 titles
+    assert get_mock.call_count == 1
+    assert res.partial
+
+    for entity in [uga, redirected, missing]:
+        entity.refresh_from_db()
+    # Only the first paragraph of the intro is kept
+    assert uga.wikipedia_extract == (
+        "The Grenoble Alpes University is a public research university."
+    )
+    assert redirected.wikipedia_extract == uga.wikipedia_extract
+    assert uga.date_wikipedia_fetched is not None
+    assert missing.wikipedia_extract is None
+    assert missing.date_wikipedia_fetched is None
+
+    e_requests = EntityRequest.objects.all()
+    assert len(e_requests) == 3
+    assert e_requests.get(entity=missing).error
+    assert not e_requests.get(entity=redirected).error
+
+
+@pytest.mark.django_db
+def test_update_wikipedia_extract_batch_continue(mocker, query_backend):
+    print("Testing the continuation of the batched wikipedia extracts.")
+    first = EntityFactory.create(
+        wikipedia_url="https://en.wikipedia.org/wiki/First"
+    )
+    second = EntityFactory.create(
+        wikipedia_url="https://en.wikipedia.org/wiki/Second"
+    )
+    no_extract = EntityFactory.create(
+        wikipedia_url="https://en.wikipedia.org/wiki/Third"
+    )
+    pages = [
+        {"pageid": 1, "ns": 0, "title": "First"},
+        {"pageid": 2, "ns": 0, "title": "Second"},
+        {"pageid": 3, "ns": 0, "title": "Third"},
+    ]
+    responses = [
+        MockAiohttpResponse(
+            json={
+                "continue": {"excontinue": 1, "continue": "||"},
+                "query": {
+                    "pages": [
+                        {**pages[0], "extract": "First extract."},
+                        pages[1],
+                        pages[2],
+                    ]
+                },
+            }
+        ),
+        MockAiohttpResponse(
+            json={
+                "batchcomplete": True,
+                "query": {
+                    "pages": [
+                        pages[0],
+                        {**pages[1], "extract": "Second extract."},
+                        pages[2],
+                    ]
+                },
+            }
+        ),
+    ]
+    get_mock = mocker.patch("aiohttp.ClientSession.get", side_effect=responses)
+
+    res = update_wikipedia_extract(use_tokens=False)
+    assert get_mock.call_count == 2
+    assert "excontinue=1" in get_mock.call_args.args[0]
+    # The page without extract is not a success
+    assert res.partial
+
+    for entity in [first, second, no_extract]:
+        entity.refresh_from_db()
+    assert first.wikipedia_extract == "First extract."
+    assert second.wikipedia_extract == "Second extract."
+    assert no_extract.wikipedia_extract is None
+    assert no_extract.date_wikipedia_fetched is None
+    assert EntityRequest.objects.get(entity=no_extract).error
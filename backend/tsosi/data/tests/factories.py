@@ -1,9 +1,16 @@
 from typing import Generic, TypeVar
 
-from factory import Dict, Faker, SubFactory, post_generation
+from factory import (
+    Dict,
+    Faker,
+    LazyAttribute,
+    SubFactory,
+    post_generation,
+)
 from factory.django import DjangoModelFactory
 from factory.fuzzy import FuzzyChoice
 from tsosi.data.preparation.raw_data_config import DATA_SOURCES
+from tsosi.data.utils import canonical_json_hash
 from tsosi.models import (
     Currency,
     DataLoadSource,
@@ -99,6 +106,7 @@ class IdentifierVersionFactory(BaseTypingFactory[IdentifierVersion]):
 
     identifier = SubFactory(IdentifierFactory)
     value = Faker("json")
+    content_hash = LazyAttribute(lambda o: canonical_json_hash(o.value))
 
 
 class DataLoadSourceFactory(BaseTypingFactory[DataLoadSource]):
@@ -0,0 +1,88 @@
+import asyncio
+import base64
+from collections import Counter, defaultdict
+
+import pytest
+from tsosi.data import api_metrics
+from tsosi.data.pid_registry import common
+from tsosi.data.pid_registry.common import perform_http_func_batch
+from tsosi.data.pid_registry.ror import get_ror_record
+
+from .utils import MockAiohttpResponse
+
+
+@pytest.fixture
+def pending_metrics(monkeypatch) -> defaultdict:
+    pending = defaultdict(Counter)
+    monkeypatch.setattr(api_metrics, "_pending", pending)
+    return pending
+
+
+def pending_counters(pending: defaultdict) -> Counter:
+    counters = Counter()
+    for c in pending.values():
+        counters.update(c)
+    return counters
+
+
+def test_api_metrics_summary(pending_metrics):
+    print("Testing the summary of the API metrics")
+    api_metrics.record_tokens("ror", 8, 2)
+    api_metrics.record_tokens("ror", 5, 0)
+    for latency in [0.04, 0.08, 0.3, 0.4]:
+        api_metrics.record_request("https://api.ror.org/v2/x", 200, latency, 10)
+    api_metrics.record_request("https://api.ror.org/v2/y", None, 70)
+
+    summary = api_metrics.summarize(pending_counters(pending_metrics))
+    assert summary["token_buckets"]["ror"]["consumed"] == 13
+    assert summary["token_buckets"]["ror"]["denied"] == 2
+
+    host = summary["hosts"]["api.ror.org"]
+    assert host["requests"] == 5
+    assert host["bytes"] == 40
+    assert host["statuses"] == {"200": 4, "error": 1}
+    latency = host["latency"]
+    assert latency["count"] == 5
+    assert latency["mean_ms"] == (40 + 80 + 300 + 400 + 70000) // 5
+    assert latency["buckets"]["le_100"] == 2
+    assert latency["p50_ms"] == 500
+    # The largest latency is beyond the last histogram bound
+    assert latency["p99_ms"] is None
+
+
+def test_http_request_metrics(pending_metrics, mocker, monkeypatch):
+    print("Testing the recording of the HTTP request metrics")
+    monkeypatch.setattr(common, "RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(common, "_circuit_breakers", {})
+    mocker.patch(
+        "aiohttp.ClientSession.get",
+        side_effect=[
+            MockAiohttpResponse(status=503),
+            MockAiohttpResponse(
+                json={"id": "02rx3b187"}, headers={"Content-Length": "23"}
+            ),
+        ],
+    )
+    asyncio.run(perform_http_func_batch(["02rx3b187"], get_ror_record))
+    counters = pending_counters(pending_metrics)
+    assert counters["requests|api.ror.org"] == 2
+    assert counters["status|api.ror.org|503"] == 1
+    assert counters["status|api.ror.org|200"] == 1
+    assert counters["bytes|api.ror.org"] == 23
+    assert counters["latency|api.ror.org|count"] == 2
+
+
+@pytest.mark.django_db
+def test_api_metrics_endpoint(client, admin_user, mocker):
+    print("Testing the admin-only API metrics endpoint")
+    mocker.patch(
+        "tsosi.api.viewsets.metrics_summary",
+        side_effect=lambda hours: {"hours": hours},
+    )
+    assert client.get("/api/api-metrics/").status_code == 403
+    credentials = base64.b64encode(b"admin:password").decode()
+    auth = {"HTTP_AUTHORIZATION": f"Basic {credentials}"}
+    response = client.get("/api/api-metrics/?hours=6", **auth)
+    assert response.status_code == 200
+    assert response.json() == {"hours": 6}
+    assert client.get("/api/api-metrics/?hours=100", **auth).status_code == 400
@@ -0,0 +1,418 @@
+from datetime import date
+
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+from tsosi.data.currencies import conversion
+from tsosi.data.currencies.conversion import (
+    RateTable,
+    bump_rates_version,
+    shared_rate_table,
+    transfer_amounts,
+)
+from tsosi.data.currencies.currency_rates import (
+    compute_average_rates,
+    compute_transfer_amounts,
+    currency_rates_for_dates,
+    rate_dates,
+    update_currencies_rates,
+)
+from tsosi.data.db_utils import DateExtremas
+from tsosi.models import Currency, CurrencyRate, Transfer
+from tsosi.models.date import (
+    DATE_PRECISION_DAY,
+    DATE_PRECISION_MONTH,
+    DATE_PRECISION_YEAR,
+)
+
+from .factories import TransferFactory
+
+
+def create_day_rate(currency_id: str, date_value: str, value: float):
+    CurrencyRate.objects.create(
+        currency_id=currency_id,
+        date=date.fromisoformat(date_value),
+        precision=DATE_PRECISION_DAY,
+        value=value,
+    )
+
+
+@pytest.mark.django_db
+def test_compute_transfer_amounts_incremental(registries, datasources):
+    print("Testing the incremental computation of transfer amounts.")
+    Currency.objects.create(id="USD", name="US Dollar")
+    Currency.objects.create(id="EUR", name="Euro")
+    create_day_rate("USD", "2023-05-01", 1)
+    create_day_rate("EUR", "2023-05-01", 0.5)
+    compute_average_rates()
+
+    date_clc = {"value": "2023-05-01", "precision": DATE_PRECISION_DAY}
+    t_1 = TransferFactory.create(
+        amount=100, currency_id="EUR", date_clc=date_clc
+    )
+    t_2 = TransferFactory.create(
+        amount=50, currency_id="USD", date_clc=date_clc
+    )
+    Transfer.objects.update(amounts_clc=None)
+
+    # First run converts every transfer
+    compute_transfer_amounts()
+    t_1.refresh_from_db()
+    t_2.refresh_from_db()
+    assert t_1.amounts_clc == {"USD": 200, "EUR": 100}
+    assert t_2.amounts_clc == {"USD": 50, "EUR": 25}
+    t_1_date = t_1.date_amounts_clc
+    t_2_date = t_2.date_amounts_clc
+    assert t_1_date is not None
+    assert t_1.date_last_updated == t_1_date
+
+    # Nothing changed
+    compute_transfer_amounts()
+    t_1.refresh_from_db()
+    assert t_1.date_amounts_clc == t_1_date
+
+    # Only the modified transfer is converted
+    t_1.amount = 300
+    t_1.save()
+    compute_transfer_amounts()
+    t_1.refresh_from_db()
+    t_2.refresh_from_db()
+    assert t_1.amounts_clc == {"USD": 600, "EUR": 300}
+    assert t_1.date_amounts_clc > t_1_date
+    assert t_2.date_amounts_clc == t_2_date
+
+    # New rates only affect the transfers dated from their year
+    create_day_rate("USD", "2024-01-02", 1)
+    create_day_rate("EUR", "2024-01-02", 0.8)
+    compute_average_rates()
+    compute_transfer_amounts()
+    t_2.refresh_from_db()
+    assert t_2.date_amounts_clc == t_2_date
+
+    create_day_rate("USD", "2023-01-02", 1)
+    create_day_rate("EUR", "2023-01-02", 0.8)
+    compute_transfer_amounts()
+    t_2.refresh_from_db()
+    assert t_2.date_amounts_clc > t_2_date
+    assert t_2.amounts_clc == {"USD": 50, "EUR": 25}
+
+
+@pytest.mark.django_db
+def test_currency_rates_for_dates():
+    print("Testing the lookup of the rates applicable to dates.")
+    Currency.objects.create(id="USD", name="US Dollar")
+    Currency.objects.create(id="EUR", name="Euro")
+    create_day_rate("USD", "2023-05-01", 1)
+    create_day_rate("EUR", "2023-05-01", 0.5)
+    create_day_rate("EUR", "2023-05-02", 0.7)
+    compute_average_rates()
+
+    dates = pd.Series(
+        pd.to_datetime(["2023-05-02", "2023-05-20", "2023-08-01"])
+    )
+    precisions = pd.Series(
+        [DATE_PRECISION_DAY, DATE_PRECISION_MONTH, DATE_PRECISION_YEAR]
+    )
+    keys = pd.DataFrame(
+        {"precision": precisions, "date": rate_dates(dates, precisions)}
+    )
+    assert keys["date"].to_list() == [
+        date(2023, 5, 2),
+        date(2023, 5, 1),
+        date(2023, 1, 1),
+    ]
+
+    rates = currency_rates_for_dates(keys)
+    rates = {
+        (r["precision"], r["currency_id"]): r["value"]
+        for r in rates.to_dict(orient="records")
+    }
+    assert rates == {
+        (DATE_PRECISION_DAY, "EUR"): 0.7,
+        (DATE_PRECISION_MONTH, "USD"): 1,
+        (DATE_PRECISION_MONTH, "EUR"): 0.6,
+        (DATE_PRECISION_YEAR, "USD"): 1,
+        (DATE_PRECISION_YEAR, "EUR"): 0.6,
+    }
+
+    # Restrict the rates to the given currencies
+    keys["currency_id"] = "EUR"
+    rates = currency_rates_for_dates(keys)
+    assert set(rates["currency_id"]) == {"EUR"}
+    assert len(rates) == 3
+
+
+def test_rate_table_conversion():
+    print("Testing the conversion of amounts with the rate table.")
+    rates = pd.DataFrame.from_records(
+        [
+            ("USD", DATE_PRECISION_DAY, date(2023, 5, 1), 1.0),
+            ("EUR", DATE_PRECISION_DAY, date(2023, 5, 1), 0.5),
+            ("USD", DATE_PRECISION_MONTH, date(2023, 5, 1), 1.0),
+            ("EUR", DATE_PRECISION_MONTH, date(2023, 5, 1), 0.75),
+            ("USD", DATE_PRECISION_YEAR, date(2023, 1, 1), 1.0),
+            ("EUR", DATE_PRECISION_YEAR, date(2023, 1, 1), 0.8),
+        ],
+        columns=["currency_id", "precision", "date", "value"],
+    )
+    table = RateTable.from_df(rates)
+    transfers = pd.DataFrame.from_records(
+        [
+            (100, "EUR", "2023-05-01", DATE_PRECISION_DAY),
+            (100, "EUR", "2023-05-01", DATE_PRECISION_MONTH),
+            (100, "EUR", "2023-01-01", DATE_PRECISION_YEAR),
+            # Future transfer converted with the last month average
+            (300, "USD", "2024-02-01", DATE_PRECISION_DAY),
+            # No rate for this date
+            (100, "EUR", "2022-01-01", DATE_PRECISION_DAY),
+            # Unknown currency
+            (100, "GBP", "2023-05-01", DATE_PRECISION_DAY),
+        ],
+        columns=["amount", "currency_id", "date_value", "date_precision"],
+    )
+    amounts = table.convert(
+        transfers["amount"],
+        transfers["currency_id"],
+        pd.to_datetime(transfers["date_value"]),
+        transfers["date_precision"],
+    )
+    assert amounts.index.to_list() == [0, 1, 2, 3, 5]
+    assert amounts.loc[:3].to_dict(orient="index") == {
+        0: {"EUR": 100, "USD": 200},
+        1: {"EUR": 100, "USD": 133},
+        2: {"EUR": 100, "USD": 125},
+        3: {"EUR": 225, "USD": 300},
+    }
+    assert amounts.loc[5].isna().all()
+
+
+def test_rate_table_reference_amounts():
+    print("Testing the rate table results against reference amounts.")
+    # The expected amounts were computed with the pandas conversion that
+    # preceded the rate table, with its rounding half to even.
+    rates = pd.DataFrame.from_records(
+        [
+            ("USD", DATE_PRECISION_DAY, date(2023, 5, 1), 1.0),
+            ("EUR", DATE_PRECISION_DAY, date(2023, 5, 1), 0.9137),
+            ("JPY", DATE_PRECISION_DAY, date(2023, 5, 1), 137.41),
+            ("ZAR", DATE_PRECISION_DAY, date(2023, 5, 1), 18.4567),
+            ("USD", DATE_PRECISION_DAY, date(2023, 5, 2), 1.0),
+            ("EUR", DATE_PRECISION_DAY, date(2023, 5, 2), 0.9071),
+            ("JPY", DATE_PRECISION_DAY, date(2023, 5, 2), 136.94),
+            ("ZAR", DATE_PRECISION_DAY, date(2023, 5, 2), 18.3021),
+            ("USD", DATE_PRECISION_MONTH, date(2023, 5, 1), 1.0),
+            ("EUR", DATE_PRECISION_MONTH, date(2023, 5, 1), 0.91043),
+            ("JPY", DATE_PRECISION_MONTH, date(2023, 5, 1), 137.0625),
+            ("ZAR", DATE_PRECISION_MONTH, date(2023, 5, 1), 18.8312),
+            ("USD", DATE_PRECISION_YEAR, date(2023, 1, 1), 1.0),
+            ("EUR", DATE_PRECISION_YEAR, date(2023, 1, 1), 0.92421),
+            ("JPY", DATE_PRECISION_YEAR, date(2023, 1, 1), 140.4918),
+            ("ZAR", DATE_PRECISION_YEAR, date(2023, 1, 1), 18.4503),
+        ],
+        columns=["currency_id", "precision", "date", "value"],
+    )
+    transfers = pd.DataFrame.from_records(
+        [
+            (1000.0, "EUR", "2023-05-01", DATE_PRECISION_DAY),
+            (12345.67, "JPY", "2023-05-02", DATE_PRECISION_DAY),
+            (250.5, "ZAR", "2023-05-01", DATE_PRECISION_MONTH),
+            (99999.99, "EUR", "2023-03-15", DATE_PRECISION_YEAR),
+            (0.5, "USD", "2023-05-02", DATE_PRECISION_DAY),
+            (1827.35, "ZAR", "2023-05-02", DATE_PRECISION_DAY),
+            (4567.89, "JPY", "2023-05-01", DATE_PRECISION_MONTH),
+            (73.25, "EUR", "2024-02-01", DATE_PRECISION_DAY),
+            (1500000.0, "USD", "2023-01-01", DATE_PRECISION_YEAR),
+        ],
+        columns=["amount", "currency_id", "date_value", "date_precision"],
+    )
+    expected = [
+        {"EUR": 1000, "JPY": 150389, "USD": 1094, "ZAR": 20200},
+        {"EUR": 82, "JPY": 12346, "USD": 90, "ZAR": 1650},
+        {"EUR": 12, "JPY": 1823, "USD": 13, "ZAR": 250},
+        {"EUR": 100000, "JPY": 15201284, "USD": 108201, "ZAR": 1996332},
+        {"EUR": 0, "JPY": 68, "USD": 0, "ZAR": 9},
+        {"EUR": 91, "JPY": 13673, "USD": 100, "ZAR": 1827},
+        {"EUR": 30, "JPY": 4568, "USD": 33, "ZAR": 628},
+        {"EUR": 73, "JPY": 11028, "USD": 80, "ZAR": 1515},
+        {"EUR": 1386315, "JPY": 210737700, "USD": 1500000, "ZAR": 27675450},
+    ]
+
+    amounts = RateTable.from_df(rates).convert(
+        transfers["amount"],
+        transfers["currency_id"],
+        pd.to_datetime(transfers["date_value"]),
+        transfers["date_precision"],
+    )
+    assert amounts.sort_index().to_dict(orient="records") == expected
+
+
+def mock_bis_response(
+    url: str, missing: dict[str, str] | None = None, **kwargs
+):
+    """
+    Return a mocked response of the BIS API with a rate of 1 for every day
+    and requested currency, except the `missing` {currency: startPeriod}.
+    """
+    parsed = urlparse(url)
+    params = parse_qs(parsed.query)
+    start = params["startPeriod"][0]
+    currencies = parsed.path.split(".")[-1].split("+")
+    days = pd.date_range(start, params["endPeriod"][0], freq="D")
+    lines = ["CURRENCY,TIME_PERIOD,OBS_VALUE"]
+    for c in currencies:
+        if (missing or {}).get(c) == start:
+            continue
+        lines.extend(f"{c},{d:%Y-%m-%d},1.0" for d in days)
+    response = mock.Mock(text="\n".join(lines))
+    response.raise_for_status.return_value = None
+    return response
+
+
+@pytest.mark.django_db
+def test_update_currencies_rates(settings, tmp_path, mocker):
+    print("Testing the batched fetching of currency rates.")
+    settings.TSOSI_CURRENCY_RATES_CACHE_DIR = str(tmp_path)
+    Currency.objects.create(id="EUR", name="Euro")
+    Currency.objects.create(id="GBP", name="Pound")
+    Currency.objects.create(id="JPY", name="Yen")
+    interval = DateExtremas(min=date(2020, 1, 1), max=date(2021, 1, 11))
+    get = mocker.patch(
+        "requests.get",
+        side_effect=lambda url, **kwargs: mock_bis_response(
+            url, missing={"GBP": "2020-01-01"}
+        ),
+    )
+
+    intervals = {
+        "EUR": [interval],
+        "GBP": [interval],
+        "JPY": [DateExtremas(min=date(2020, 1, 1), max=date(2020, 1, 11))],
+    }
+    update_currencies_rates(intervals)
+    # 1 request per window and group of currencies
+    urls = [c.args[0] for c in get.call_args_list]
+    assert len(urls) == 3
+    assert sum("EUR+GBP?" in u for u in urls) == 2
+    assert CurrencyRate.objects.filter(currency_id="EUR").count() == 376
+    assert CurrencyRate.objects.filter(currency_id="JPY").count() == 10
+    # The GBP rates of the 1st window are missing, the rates of the
+    # subsequent window are discarded.
+    assert not CurrencyRate.objects.filter(currency_id="GBP").exists()
+
+    # The responses are replayed from the disk cache
+    assert len(list(tmp_path.iterdir())) == 3
+    CurrencyRate.objects.all().delete()
+    update_currencies_rates(intervals)
+    assert get.call_count == 3
+    assert CurrencyRate.objects.filter(currency_id="EUR").count() == 376
+
+
+@pytest.mark.django_db
+def test_compute_average_rates_incremental():
+    print("Testing the incremental computation of the average rates.")
+    Currency.objects.create(id="EUR", name="Euro")
+    Currency.objects.create(id="GBP", name="Pound")
+    create_day_rate("EUR", "2023-05-01", 0.5)
+    create_day_rate("GBP", "2023-05-01", 0.9)
+    compute_average_rates()
+
+    def averages() -> dict:
+        return {
+            (r.currency_id, r.precision, r.date): (r.id, r.value)
+            for r in CurrencyRate.objects.exclude(precision=DATE_PRECISION_DAY)
+        }
+
+    initial = averages()
+    assert len(initial) == 4
+    eur_month = ("EUR", DATE_PRECISION_MONTH, date(2023, 5, 1))
+    gbp_month = ("GBP", DATE_PRECISION_MONTH, date(2023, 5, 1))
+    assert initial[eur_month][1] == 0.5
+
+    # Only the buckets of the new daily rates are recomputed, the existing
+    # average rates are updated in place.
+    create_day_rate("EUR", "2023-05-02", 0.7)
+    create_day_rate("EUR", "2024-02-01", 0.8)
+    compute_average_rates()
+    result = averages()
+    assert len(result) == 6
+    assert result[eur_month] == (initial[eur_month][0], 0.6)
+    assert result[gbp_month] == initial[gbp_month]
+    assert result[("EUR", DATE_PRECISION_YEAR, date(2024, 1, 1))][1] == 0.8
+
+    # The full computation removes the averages without daily rates
+    CurrencyRate.objects.filter(
+        precision=DATE_PRECISION_DAY, date__year=2024
+    ).delete()
+    compute_average_rates()
+    assert len(averages()) == 6
+    compute_average_rates(full=True)
+    result = averages()
+    assert len(result) == 4
+    assert result[eur_month] == (initial[eur_month][0], 0.6)
+
+
+@pytest.mark.django_db
+def test_compute_transfer_amounts_usd_only(
+    registries, datasources, settings, monkeypatch
+):
+    print("Testing the conversion on read of the USD amounts.")
+    monkeypatch.setattr(conversion, "_shared_rate_table", None)
+    Currency.objects.create(id="USD", name="US Dollar")
+    Currency.objects.create(id="EUR", name="Euro")
+    create_day_rate("USD", "2023-05-01", 1)
+    create_day_rate("EUR", "2023-05-01", 0.3)
+    create_day_rate("EUR", "2023-05-02", 0.7)
+    compute_average_rates()
+    dates = [
+        {"value": "2023-05-01", "precision": DATE_PRECISION_DAY},
+        {"value": "2023-05-01", "precision": DATE_PRECISION_MONTH},
+        {"value": "2024-03-01", "precision": DATE_PRECISION_DAY},
+    ]
+    transfers = [
+        TransferFactory.create(amount=1001, currency_id="EUR", date_clc=d)
+        for d in dates
+    ]
+
+    compute_transfer_amounts()
+    stored = {}
+    # Daily rate, month average and last month average for the future date
+    for t, rate in zip(transfers, [0.3, 0.5, 0.5]):
+        t.refresh_from_db()
+        stored[t.id] = t.amounts_clc
+        assert t.amount_usd == 1001 / rate
+
+    settings.TSOSI_TRANSFER_AMOUNTS_CLC = False
+    compute_transfer_amounts(full=True)
+    for t in transfers:
+        t.refresh_from_db()
+        assert t.amounts_clc is None
+        assert t.amount_usd is not None
+        # The amounts converted on read match the stored ones
+        assert transfer_amounts(t) == stored[t.id]
+
+
+@pytest.mark.django_db
+def test_shared_rate_table(monkeypatch):
+    print("Testing the reload of the shared rate table.")
+    monkeypatch.setattr(conversion, "_shared_rate_table", None)
+    Currency.objects.create(id="USD", name="US Dollar")
+    create_day_rate("USD", "2023-05-01", 1)
+
+    table = shared_rate_table()
+    assert table.currencies == ["USD"]
+    assert shared_rate_table() is table
+
+    # The table is reloaded once the version is bumped and checked
+    Currency.objects.create(id="EUR", name="Euro")
+    create_day_rate("EUR", "2023-05-01", 0.5)
+    bump_rates_version()
+    assert shared_rate_table() is table
+    monkeypatch.setattr(conversion, "RATE_TABLE_CHECK_SECONDS", 0)
+    table = shared_rate_table()
+    assert table.currencies == ["EUR", "USD"]
+    assert table.amounts(10, {"value": "2023-05-01", "precision": "day"}) == {
+        "EUR": 5,
+        "USD": 10,
+    }
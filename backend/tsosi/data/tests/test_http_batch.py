@@ -0,0 +1,293 @@
+import asyncio
+import json
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+
+import aiohttp
+import pytest
+from tsosi.data.pid_registry import common
+from tsosi.data.pid_registry.common import (
+    ADAPTIVE_MAX_CHUNK_SIZE,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX,
+    RETRY_MAX_DELAY,
+    AdaptiveBatcher,
+    ApiResult,
+    iter_async_batches,
+    iter_http_func_batch,
+    perform_http_func_batch,
+    retry_delay,
+    stream_adaptive_batches,
+)
+from tsosi.data.pid_registry.ror import ROR_API_ENDPOINT, get_ror_record
+from tsosi.models import Registry
+from tsosi.models.static_data import REGISTRY_WIKIDATA
+
+from .utils import MockAiohttpResponse
+
+
+class InFlightCounter:
+    def __init__(self):
+        self.current = 0
+        self.max = 0
+
+    async def __call__(self, session, item: int) -> int:
+        self.current += 1
+        self.max = max(self.max, self.current)
+        await asyncio.sleep(0.001 * (item % 3))
+        self.current -= 1
+        if item < 0:
+            raise ValueError(f"Invalid item {item}")
+        return item
+
+
+def test_iter_http_func_batch():
+    print("Testing streaming of HTTP function calls")
+    func = InFlightCounter()
+    batches = list(
+        iter_http_func_batch(range(50), func, max_conns=4, batch_size=8)
+    )
+
+    assert sorted(r for b in batches for r in b) == list(range(50))
+    assert all(len(b) <= 8 for b in batches)
+    assert len(batches) == 7
+    assert func.max == 4
+
+
+def test_iter_http_func_batch_early_stop():
+    print("Testing early stop of the streaming of HTTP function calls")
+    func = InFlightCounter()
+    batches = iter_http_func_batch(
+        (i for i in range(10**6)), func, max_conns=4, batch_size=8
+    )
+    first = next(batches)
+    batches.close()
+    assert len(first) == 8
+
+
+def test_iter_http_func_batch_error():
+    print("Testing error propagation of the streaming of HTTP function calls")
+    with pytest.raises(ValueError):
+        list(iter_http_func_batch([1, 2, -1, 3], InFlightCounter()))
+
+
+def test_retry_delay():
+    print("Testing the delay between request retries")
+    assert retry_delay(0, "12") == 12
+    assert retry_delay(0, "100000") == RETRY_MAX_DELAY
+    assert 0 <= retry_delay(3) <= RETRY_BASE_DELAY * 2**3
+    assert 0 <= retry_delay(3, "invalid") <= RETRY_BASE_DELAY * 2**3
+    date = datetime.now(UTC) + timedelta(seconds=30)
+    assert 20 <= retry_delay(0, format_datetime(date, usegmt=True)) <= 30
+
+
+def test_http_request_retry(mocker, monkeypatch):
+    print("Testing retries of transient HTTP errors")
+    monkeypatch.setattr(common, "RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(common, "_circuit_breakers", {})
+    get_mock = mocker.patch(
+        "aiohttp.ClientSession.get",
+        side_effect=[
+            MockAiohttpResponse(status=429, headers={"Retry-After": "0"}),
+            MockAiohttpResponse(status=503),
+            MockAiohttpResponse(json={"id": "02rx3b187"}),
+        ],
+    )
+    result = asyncio.run(
+        perform_http_func_batch(["02rx3b187"], get_ror_record)
+    )[0]
+    assert get_mock.call_count == 3
+    assert not result.error
+    assert result.http_status == 200
+    assert result.record == {"id": "02rx3b187"}
+
+    # The last response is returned when the retries are exhausted
+    get_mock = mocker.patch(
+        "aiohttp.ClientSession.get",
+        return_value=MockAiohttpResponse(status=500),
+    )
+    result = asyncio.run(
+        perform_http_func_batch(["02rx3b187"], get_ror_record)
+    )[0]
+    assert get_mock.call_count == RETRY_MAX + 1
+    assert result.error
+    assert not result.skipped
+    assert result.http_status == 500
+
+
+async def fetch_sequentially(ids: list[str]):
+    async with common.http_session(1) as session:
+        return [await get_ror_record(session, i) for i in ids]
+
+
+def test_circuit_breaker(mocker, monkeypatch):
+    print("Testing the per-host circuit breaker")
+    monkeypatch.setattr(common, "RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(common, "_circuit_breakers", {})
+    get_mock = mocker.patch(
+        "aiohttp.ClientSession.get",
+        return_value=MockAiohttpResponse(status=503),
+    )
+    ids = [f"0{i:02}rx3b18" for i in range(5)]
+    results = asyncio.run(fetch_sequentially(ids))
+    # The circuit opens once the threshold of consecutive failures is hit,
+    # during the retries of the 3rd request. The remaining requests are
+    # skipped.
+    assert get_mock.call_count == CIRCUIT_FAILURE_THRESHOLD
+    assert all(r.error for r in results)
+    assert [r.skipped for r in results] == [False, False, True, True, True]
+    assert results[-1].http_status is None
+
+    # A single trial request is let through after the reset period
+    breaker = common.circuit_breaker(ROR_API_ENDPOINT)
+    breaker.opened_at -= CIRCUIT_RESET_SECONDS
+    get_mock.return_value = MockAiohttpResponse(json={"id": "02rx3b187"})
+    result = asyncio.run(
+        perform_http_func_batch(["02rx3b187"], get_ror_record)
+    )[0]
+    assert not result.error
+    assert breaker.opened_at is None
+
+
+class HangingResponse:
+    async def __aenter__(self):
+        await asyncio.sleep(3600)
+
+    async def __aexit__(self, *args):
+        pass
+
+
+async def cancel_request(id: str):
+    async with common.http_session(1) as session:
+        task = asyncio.create_task(get_ror_record(session, id))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+def test_circuit_breaker_trial_end(mocker, monkeypatch):
+    print("Testing the trial requests ending without response")
+    monkeypatch.setattr(common, "_circuit_breakers", {})
+    breaker = common.circuit_breaker(ROR_API_ENDPOINT)
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        breaker.record_failure()
+    breaker.opened_at -= CIRCUIT_RESET_SECONDS
+
+    # A cancelled trial lets the next request through
+    mocker.patch("aiohttp.ClientSession.get", return_value=HangingResponse())
+    asyncio.run(cancel_request("02rx3b187"))
+    assert not breaker.trial
+    assert breaker.opened_at is not None
+
+    # Same for the client errors other than connection errors
+    get_mock = mocker.patch(
+        "aiohttp.ClientSession.get",
+        side_effect=aiohttp.InvalidURL(ROR_API_ENDPOINT),
+    )
+    result = asyncio.run(
+        perform_http_func_batch(["02rx3b187"], get_ror_record)
+    )[0]
+    assert result.error
+    assert not result.skipped
+    assert not breaker.trial
+
+    get_mock = mocker.patch(
+        "aiohttp.ClientSession.get",
+        return_value=MockAiohttpResponse(json={"id": "02rx3b187"}),
+    )
+    result = asyncio.run(
+        perform_http_func_batch(["02rx3b187"], get_ror_record)
+    )[0]
+    assert not result.error
+    assert get_mock.call_count == 1
+    assert breaker.opened_at is None
+
+
+class ChunkRecorder:
+    """
+    Chunk request failing with a server error for the chunks containing a
+    negative item.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    async def __call__(self, session, chunk: list[int]) -> ApiResult:
+        self.chunks.append(chunk)
+        if any(i < 0 for i in chunk):
+            return ApiResult(info=str(chunk), http_status=500, error=True)
+        return ApiResult(info=str(chunk), http_status=200)
+
+
+def test_stream_adaptive_batches():
+    print("Testing the adaptive chunked requests")
+    func = ChunkRecorder()
+    batcher = AdaptiveBatcher(chunk_size=8, concurrency=1)
+    items = list(range(40))
+    results = [
+        r
+        for b in iter_async_batches(
+            lambda: stream_adaptive_batches(items, func, batcher), 100
+        )
+        for r in b
+    ]
+    assert not any(r.error for r in results)
+    # The fast responses grow the chunks and the concurrency: the 2 chunks
+    # after the first one are requested concurrently
+    assert [len(c) for c in func.chunks[:4]] == [8, 10, 10, 12]
+    assert batcher.chunk_size > 8
+    assert batcher.concurrency > 1
+    assert sorted(i for c in func.chunks for i in c) == items
+
+
+def test_stream_adaptive_batches_split():
+    print("Testing the isolation of failing items by chunk splitting")
+    func = ChunkRecorder()
+    batcher = AdaptiveBatcher(chunk_size=8, concurrency=1)
+    items = [0, 1, 2, -3, 4, 5, 6, 7]
+    results = [
+        r
+        for b in iter_async_batches(
+            lambda: stream_adaptive_batches(items, func, batcher), 100
+        )
+        for r in b
+    ]
+    errors = [r for r in results if r.error]
+    assert len(errors) == 1
+    assert errors[0].info == "[-3]"
+    # Every item is part of exactly one yielded result
+    assert sorted(len(json.loads(r.info)) for r in results) == [1, 1, 2, 4]
+    # The failure shrank the chunks
+    assert batcher.chunk_size < 8
+
+
+def test_adaptive_batcher():
+    print("Testing the adaptation of the chunk size and concurrency")
+    batcher = AdaptiveBatcher(chunk_size=40, concurrency=2)
+    batcher.record(ApiResult(http_status=200), 40, 30)
+    assert batcher.chunk_size == 30
+    batcher.record(ApiResult(error=True, http_status=404), 30, 1)
+    assert (batcher.chunk_size, batcher.concurrency) == (30, 2)
+    batcher.record(ApiResult(error=True), 30, 60)
+    assert (batcher.chunk_size, batcher.concurrency) == (15, 1)
+    batcher.record(ApiResult(error=True, skipped=True), 15, 0)
+    assert (batcher.chunk_size, batcher.concurrency) == (15, 1)
+
+    batcher = AdaptiveBatcher.from_params({"chunk_size": 10**6})
+    assert batcher.chunk_size == ADAPTIVE_MAX_CHUNK_SIZE
+    assert batcher.params() == {
+        "chunk_size": ADAPTIVE_MAX_CHUNK_SIZE,
+        "concurrency": 5,
+    }
+
+
+@pytest.mark.django_db
+def test_registry_fetch_params(registries):
+    print("Testing the persistence of the registry fetch parameters")
+    assert Registry.get_fetch_params(REGISTRY_WIKIDATA) == {}
+    params = {"chunk_size": 25, "concurrency": 3}
+    Registry.set_fetch_params(REGISTRY_WIKIDATA, params)
+    assert Registry.get_fetch_params(REGISTRY_WIKIDATA) == params
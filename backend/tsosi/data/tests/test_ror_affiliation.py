@@ -0,0 +1,99 @@
+import pandas as pd
+import pytest
+from tsosi.data.pid_registry.ror_affiliation import (
+    AFFILIATION_SOURCE_API,
+    AFFILIATION_SOURCE_LOCAL,
+    MATCH_TYPE_ACRONYM,
+    MATCH_TYPE_COMMON_TERMS,
+    MATCH_TYPE_EXACT,
+    AffiliationIndex,
+    match_affiliations,
+)
+from tsosi.data.pid_registry.ror_dump import import_ror_dump
+from tsosi.models import RorAffiliationMatch
+
+from .utils import MockAiohttpResponse, child_ror_record, write_ror_dump
+
+
+def test_affiliation_index(uga_ror_record):
+    print("Testing affiliation matching with the local index")
+    inactive = child_ror_record(uga_ror_record)
+    inactive["status"] = "inactive"
+    index = AffiliationIndex.from_records([uga_ror_record, inactive])
+
+    # Perfect match: exact label and same country
+    result = index.match("Université Grenoble Alpes", "FR")
+    assert result.matched_id == uga_ror_record["id"]
+    assert result.matched_status == "active"
+    assert result.match_type == MATCH_TYPE_EXACT
+    assert result.perfect_match
+    # The local matches are not scored
+    assert result.match_score is None
+
+    # Exact but not perfect matches
+    for name, country in [
+        ("universite grenoble-alpes", "FR"),
+        ("Université Grenoble Alpes", "IT"),
+        ("Université Grenoble Alpes", None),
+    ]:
+        result = index.match(name, country)
+        assert result.matched_id == uga_ror_record["id"]
+        assert result.match_type == MATCH_TYPE_EXACT
+        assert not result.perfect_match
+
+    result = index.match("University of Grenoble Alpes", None)
+    assert result.matched_id == uga_ror_record["id"]
+    assert result.match_type == MATCH_TYPE_COMMON_TERMS
+    assert not result.perfect_match
+
+    # Acronyms require the country
+    result = index.match("UGA", "FR")
+    assert result.matched_id == uga_ror_record["id"]
+    assert result.match_type == MATCH_TYPE_ACRONYM
+    assert index.match("UGA", None) is None
+
+    # Inactive records
+    result = index.match("Institut polytechnique de Grenoble", "FR")
+    assert result.matched_id == inactive["id"]
+    assert result.matched_status == "inactive"
+    assert not result.perfect_match
+
+    assert index.match("Unknown organization", "FR") is None
+
+
+@pytest.mark.django_db
+def test_match_affiliations(tmp_path, mocker, settings, uga_ror_record):
+    print("Testing affiliation matching with cache and API fallback")
+    import_ror_dump(write_ror_dump(tmp_path / "dump.zip", [uga_ror_record]))
+    get_mock = mocker.patch(
+        "aiohttp.ClientSession.get",
+        return_value=MockAiohttpResponse(json={"number_of_results": 0}),
+    )
+    names = ["Université Grenoble Alpes", "Unknown organization"]
+    countries = ["FR", None]
+
+    result = match_affiliations(names, countries)
+    assert result["ror_matched_id"][0] == "02rx3b187"
+    assert pd.isna(result["ror_matched_id"][1])
+    assert result["ror_perfect_match"].to_list() == [True, False]
+    # Active and inactive queries for the unknown name only
+    assert get_mock.call_count == 2
+    sources = dict(RorAffiliationMatch.objects.values_list("name", "source"))
+    assert sources == {
+        names[0]: AFFILIATION_SOURCE_LOCAL,
+        names[1]: AFFILIATION_SOURCE_API,
+    }
+
+    # Cached results
+    cached = match_affiliations(names, countries)
+    assert get_mock.call_count == 2
+    assert cached["ror_matched_id"][0] == "02rx3b187"
+    assert pd.isna(cached["ror_matched_id"][1])
+    assert cached["ror_perfect_match"].to_list() == [True, False]
+
+    # Expired cache
+    settings.TSOSI_AFFILIATION_MATCH_CACHE_DAYS = 0
+    match_affiliations(names, countries)
+    assert get_mock.call_count == 4
+    # The cached results are replaced
+    assert RorAffiliationMatch.objects.count() == 2
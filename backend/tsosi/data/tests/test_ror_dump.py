@@ -0,0 +1,95 @@
+import pytest
+from tsosi.data.enrichment.api_related import fetch_empty_identifier_records
+from tsosi.data.pid_registry.ror import ror_record_extractor
+from tsosi.data.pid_registry.ror_dump import (
+    ROR_DUMP_INFO_PREFIX,
+    import_ror_dump,
+    ror_dump_records,
+)
+from tsosi.data.pid_registry.versions import version_content_hash
+from tsosi.models import IdentifierRequest, IdentifierVersion, RorDumpRecord
+from tsosi.models.static_data import REGISTRY_ROR
+
+from .factories import IdentifierFactory
+from .utils import MockAiohttpResponse, child_ror_record, write_ror_dump
+
+
+@pytest.mark.django_db
+def test_import_ror_dump(tmp_path, uga_ror_record):
+    print("Testing import of a ROR data dump")
+    child = child_ror_record(uga_ror_record)
+    dump = write_ror_dump(tmp_path / "dump.zip", [uga_ror_record, child])
+
+    assert import_ror_dump(dump) == (2, 0, 0)
+    assert RorDumpRecord.objects.count() == 2
+    assert (
+        RorDumpRecord.objects.get(id="02rx3b187").dump_version
+        == "v2.0-2025-01-01-ror-data"
+    )
+
+    # The dump records are stored as is
+    records = ror_dump_records(["02rx3b187", "05sbt2524", "000000000"])
+    assert records.keys() == {"02rx3b187", "05sbt2524"}
+    assert records["02rx3b187"] == uga_ror_record
+    assert ror_record_extractor(records["05sbt2524"])["ror_parents"] == [
+        "02rx3b187"
+    ]
+
+    # Importing the same dump is a no-op
+    assert import_ror_dump(dump) == (0, 0, 0)
+
+    # Modified and deleted records
+    uga_ror_record["established"] = 1970
+    dump = write_ror_dump(tmp_path / "dump_2.zip", [uga_ror_record])
+    assert import_ror_dump(dump) == (0, 1, 1)
+    assert list(RorDumpRecord.objects.values_list("id", flat=True)) == [
+        "02rx3b187"
+    ]
+    assert ror_dump_records(["02rx3b187"])["02rx3b187"]["established"] == 1970
+
+    # The status is not extracted but is stored for the affiliation matching
+    uga_ror_record["status"] = "inactive"
+    dump = write_ror_dump(tmp_path / "dump_3.zip", [uga_ror_record])
+    assert import_ror_dump(dump) == (0, 1, 0)
+    assert ror_dump_records(["02rx3b187"])["02rx3b187"]["status"] == "inactive"
+
+
+@pytest.mark.django_db
+def test_fetch_ror_records_from_dump(
+    registries, tmp_path, mocker, uga_ror_record
+):
+    print("Testing fetching of ROR records from the ROR dump")
+    import_ror_dump(write_ror_dump(tmp_path / "dump.zip", [uga_ror_record]))
+    id_dump = IdentifierFactory.create(
+        registry_id=REGISTRY_ROR, value="02rx3b187"
+    )
+    id_api = IdentifierFactory.create(
+        registry_id=REGISTRY_ROR, value="05sbt2524"
+    )
+
+    # Only the record missing from the dump is fetched from the API
+    child = child_ror_record(uga_ror_record)
+    get_mock = mocker.patch(
+        "aiohttp.ClientSession.get",
+        return_value=MockAiohttpResponse(json=child),
+    )
+    result = fetch_empty_identifier_records(REGISTRY_ROR, use_tokens=False)
+    assert not result.partial
+    assert get_mock.call_count == 1
+    assert get_mock.call_args.args[0].endswith("/05sbt2524")
+
+    versions = IdentifierVersion.objects.all()
+    assert len(versions) == 2
+    # The versions served from the dump are stored like the API ones
+    dump_version = versions.get(identifier=id_dump)
+    assert dump_version.value == uga_ror_record
+    assert dump_version.content_hash == version_content_hash(
+        REGISTRY_ROR, uga_ror_record
+    )
+    assert versions.get(identifier=id_api).value["id"] == child["id"]
+
+    request = IdentifierRequest.objects.get(identifier=id_dump)
+    assert request.info.startswith(ROR_DUMP_INFO_PREFIX)
+    assert not request.error
+    request = IdentifierRequest.objects.get(identifier=id_api)
+    assert request.http_status == 200
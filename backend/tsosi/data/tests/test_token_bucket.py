@@ -0,0 +1,51 @@
+import fakeredis
+import pandas as pd
+import pytest
+from tsosi.data.token_bucket import TokenBucket
+
+
+@pytest.fixture
+def bucket() -> TokenBucket:
+    # fakeredis runs the Lua script, see the `lua` extra
+    return TokenBucket(fakeredis.FakeStrictRedis(), "test", 10, 20)
+
+
+def rewind(bucket: TokenBucket, seconds: float):
+    """
+    Move the last update of the bucket back in time.
+    """
+    timestamp = float(bucket.redis.hget(bucket.state_key, "timestamp"))
+    bucket.redis.hset(bucket.state_key, "timestamp", timestamp - seconds)
+
+
+def test_token_bucket_consume(bucket):
+    print("Testing the token consumption by the Lua script")
+    # The bucket starts full
+    assert bucket.consume(3) == 3
+    assert bucket.consume(10) == 7
+    assert bucket.consume(1) == 0
+    assert float(bucket.redis.hget(bucket.state_key, "tokens")) < 1
+    # The state expires once the bucket would be full again
+    assert bucket.redis.ttl(bucket.state_key) == 21
+
+    # The bucket is refilled at the rate of 10 tokens per 20 seconds
+    rewind(bucket, 10)
+    assert bucket.consume(10) == 5
+    # It holds at most 10 tokens
+    rewind(bucket, 1000)
+    assert bucket.consume(20) == 10
+
+
+def test_token_bucket_consume_for_df(bucket):
+    print("Testing the token consumption for the rows of a dataframe")
+    df, partial = bucket.consume_for_df(pd.DataFrame({"a": range(8)}), 2)
+    assert not partial
+    assert len(df) == 8
+
+    df, partial = bucket.consume_for_df(pd.DataFrame({"a": range(20)}), 2)
+    assert partial
+    assert len(df) == 12
+
+    df, partial = bucket.consume_for_df(pd.DataFrame({"a": range(4)}))
+    assert partial
+    assert df.empty
@@ -1,6 +1,14 @@
 import asyncio
 
-from tsosi.data.pid_registry.wikidata import fetch_wikidata_records_data
+import pandas as pd
+from tsosi.data.pid_registry import wikidata
+from tsosi.data.pid_registry.wikidata import (
+    WIKIDATA_EXTRACT_MAPPING,
+    fetch_wikidata_records_data,
+    iter_wikidata_records,
+)
+
+from .utils import MockAiohttpResponse
 
 
 def test_fetch_wikidata_records():
@@ -26,3 +34,62 @@ def test_fetch_wikidata_records():
             "timestamp",
         ]
     )
+
+
+def test_fetch_wikidata_entities(
+    settings, mocker, monkeypatch, uga_wbgetentities
+):
+    print("Testing fetching of wikidata records with wbgetentities")
+    settings.TSOSI_WIKIDATA_FETCH_BACKEND = "wbgetentities"
+    monkeypatch.setattr(wikidata, "_country_codes", {})
+    france = {
+        "entities": {
+            "Q142": {
+                "id": "Q142",
+                "claims": {
+                    "P297": [
+                        {
+                            "mainsnak": {
+                                "snaktype": "value",
+                                "datavalue": {"value": "FR", "type": "string"},
+                            },
+                            "rank": "normal",
+                        }
+                    ]
+                },
+            }
+        }
+    }
+    get_mock = mocker.patch(
+        "aiohttp.ClientSession.get",
+        side_effect=[
+            MockAiohttpResponse(json=uga_wbgetentities),
+            MockAiohttpResponse(json=france),
+        ],
+    )
+    identifiers = ["Q215432154632121", "Q945876", "QINCORRECT_VALUE"]
+
+    res = pd.concat(list(iter_wikidata_records(identifiers)))
+    # The country code is fetched with a second request
+    assert get_mock.call_count == 2
+    assert res["error"].tolist() == [True, False, True]
+    record = res["record"].tolist()[1]
+    assert set(record.keys()) == set(WIKIDATA_EXTRACT_MAPPING.values())
+    assert record == {
+        "id": "Q945876",
+        "name": "Grenoble Alpes University",
+        "description": "university in Grenoble, France",
+        "website": "https://www.univ-grenoble-alpes.fr/",
+        "country": "FR",
+        "logo_url": "http://commons.wikimedia.org/wiki/Special:FilePath/Logo%20Universit%C3%A9%20Grenoble-Alpes%20%282020%29.jpg",
+        "wikipedia_url": "https://en.wikipedia.org/wiki/Grenoble_Alpes_University",
+        "ror_id": "02rx3b187",
+        "coordinates": "Point(5.7675 45.1925)",
+        "date_inception": "2016-01-01T00:00:00Z",
+    }
+
+    # The country codes are cached
+    get_mock.side_effect = [MockAiohttpResponse(json=uga_wbgetentities)]
+    res = pd.concat(list(iter_wikidata_records(["Q945876"])))
+    assert get_mock.call_count == 3
+    assert res["record"].tolist()[0]["country"] == "FR"
@@ -1,3 +1,6 @@
+import copy
+import json
+import zipfile
 from dataclasses import dataclass, field
 from typing import Any, Callable, Iterable, Type
 from urllib.parse import unquote_plus
@@ -34,6 +37,15 @@ def base_test_function(func: Callable, test_data: Iterable[BaseTestData]):
             ), f"Expected {test.result}, got {result}"
 
 
+class MockStreamReader:
+    def __init__(self, content: bytes | None):
+        self._content = content or b""
+
+    async def iter_chunked(self, n: int):
+        for pos in range(0, len(self._content), n):
+            yield self._content[pos : pos + n]
+
+
 class MockAiohttpResponse:
     def __init__(
         self,
@@ -42,11 +54,16 @@ class MockAiohttpResponse:
         json: dict | list | None = None,
         content: bytes | None = None,
         url: str | None = None,
+        headers: dict | None = None,
+        content_type: str = "application/json",
     ):
         self.status = status
+        self.headers = headers or {}
+        self.content_type = content_type
         self._text = text
         self._json = json
         self._content = content
+        self.content = MockStreamReader(content)
         self.url = unquote_plus(url) if url else "http://localhost/api/test/"
 
     async def text(self):
@@ -63,3 +80,36 @@ class MockAiohttpResponse:
 
     async def __aenter__(self):
         return self
+
+
+def child_ror_record(parent: dict) -> dict:
+    """
+    Return a ROR record of a child of the given record.
+    """
+    record = copy.deepcopy(parent)
+    record["id"] = "https://ror.org/05sbt2524"
+    record["names"] = [
+        {
+            "value": "Institut polytechnique de Grenoble",
+            "types": ["ror_display", "label"],
+            "lang": "fr",
+        }
+    ]
+    record["relationships"] = [
+        {
+            "label": "Université Grenoble Alpes",
+            "type": "parent",
+            "id": parent["id"],
+        }
+    ]
+    return record
+
+
+def write_ror_dump(path, records: list[dict]):
+    """
+    Write the given records as a ROR data dump zip archive.
+    """
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("v2.0-2025-01-01-ror-data.json", json.dumps(records))
+        archive.writestr("v2.0-2025-01-01-ror-data.csv", "id\n")
+    return path
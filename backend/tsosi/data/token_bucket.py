@@ -1,10 +1,11 @@
 import logging
-import time
+import math
 
 import pandas as pd
 import redis
 import redis.exceptions
 from tsosi.app_settings import app_settings
+from tsosi.data import api_metrics
 
 logger = logging.getLogger(__name__)
 console_logger = logging.getLogger("console_only")
@@ -20,52 +21,48 @@ REDIS_CLIENT = redis.StrictRedis(
 class TokenBucket:
     """
     Implement the token bucket algorithm to handle rate limited tasks.
-    The bucket is automatically refilled if necessary before every token
-    consumption request.
-    This should be set as a periodic task instead if the number of
-    consumption request grows significantly.
+    The bucket holds at most `max_tokens` tokens and is continuously
+    refilled at the rate of `max_tokens` tokens per `refill_period`.
+
+    The refill and the consumption are performed atomically by a single
+    Lua script, in a single round trip to Redis. The script relies on the
+    Redis server clock so that the workers' clocks don't matter.
     """
 
-    # KEYS[1] - token bucket name
-    # KEYS[2] - last refill time name
-    # KEYS[3] - first consumption time name
-    # ARGV[1] - desired number of tokens
-    # ARGV[2] - current time
-    # Consume/decrease the token bucket with
-    # the minimum of (available tokens, desired tokens), then
-    # update the bucket's first consumption time
-    LUA_CONSUME_TOKEN_SCRIPT = """
-        local current_tokens = tonumber(redis.call('GET', KEYS[1]))
-        if not current_tokens then return 0 end
-        local tokens_to_consume = math.min(current_tokens, tonumber(ARGV[1]))
-        if tokens_to_consume > 0 then
-            redis.call('DECRBY', KEYS[1], tokens_to_consume)
+    # KEYS[1] - bucket state name, a hash of the token count and the time
+    #           of its last update
+    # ARGV[1] - maximum number of tokens
+    # ARGV[2] - refill period, in seconds
+    # ARGV[3] - desired number of tokens
+    # Refill the bucket with the tokens accumulated since its last update,
+    # then consume the minimum of (available tokens, desired tokens).
+    # Return the number of consumed tokens.
+    LUA_TAKE_TOKEN_SCRIPT = """
+        local max_tokens = tonumber(ARGV[1])
+        local refill_period = tonumber(ARGV[2])
+        local desired = tonumber(ARGV[3])
+        local rate = max_tokens / refill_period
+
+        local redis_time = redis.call('TIME')
+        local current_time = tonumber(redis_time[1]) + tonumber(redis_time[2]) / 1000000
+
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+        local tokens = tonumber(state[1])
+        local timestamp = tonumber(state[2])
+        if not tokens or not timestamp then
+            tokens = max_tokens
+            timestamp = current_time
         end
+        local elapsed = math.max(current_time - timestamp, 0)
+        tokens = math.min(max_tokens, tokens + elapsed * rate)
 
-        local last_refill_time = tonumber(redis.call('GET', KEYS[2]))
-        local first_consumption_time = tonumber(redis.call('GET', KEYS[3]))
-        local current_time = tonumber(ARGV[2])
+        local consumed = math.max(math.min(desired, math.floor(tokens)), 0)
+        tokens = tokens - consumed
 
-        if not last_refill_time then
-            return tokens_to_consume
-        end
-        if not first_consumption_time or first_consumption_time < last_refill_time then
-            redis.call('SET', KEYS[3], math.max(last_refill_time, current_time))
-        end
-
-        return tokens_to_consume
-    """
-    # KEYS[1] - token bucket name
-    # KEYS[2] - last refill time name
-    # KEYS[3] - first consumption time name
-    # ARGV[1] - token number
-    # ARGV[2] - refill time
-    # Refill the bucket and refresh associated variables.
-    LUA_REFILL_TOKEN_SCRIPT = """
-        redis.call('SET', KEYS[1], ARGV[1])
-        redis.call('SET', KEYS[2], ARGV[2])
-        redis.call('DEL', KEYS[3])
-        return 1
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'timestamp', tostring(current_time))
+        -- The bucket is full again after a refill period without consumption
+        redis.call('EXPIRE', KEYS[1], math.ceil(refill_period) + 1)
+        return consumed
     """
 
     def __init__(
@@ -79,8 +76,8 @@ class TokenBucket:
         :params redis:          The redis.Redis client.
         :params bucket_name:    The name of the bucket to be used in Redis.
         :params max_tokens:     The maximum number of tokens the bucket can hold.
-        :params refill_period:  The number of seconds before the bucket should
-                                be replenished.
+        :params refill_period:  The number of seconds for the bucket to be
+                                entirely replenished.
         """
         cls = self.__class__
         self.redis = redis
@@ -88,95 +85,42 @@ class TokenBucket:
         self.max_tokens = max_tokens
         self.refill_period = refill_period
         # Redis keys
-        self.token_count_key = f"{bucket_name}:token_count"
-        self.last_refill_time_key = f"{bucket_name}:last_refill_time"
-        self.first_consumption_time_key = (
-            f"{bucket_name}:first_consumption_time"
-        )
+        self.state_key = f"{bucket_name}:state"
         # Lua scripts
-        self.lua_token_consume = self.redis.register_script(
-            cls.LUA_CONSUME_TOKEN_SCRIPT
-        )
-        self.lua_refill_token = self.redis.register_script(
-            cls.LUA_REFILL_TOKEN_SCRIPT
-        )
-
-    def _refill(self):
-        """
-        Refill the token bucket if it's time.
-        """
-        last_refill_time: bytes | None = self.redis.get(
-            self.last_refill_time_key
-        )
-        first_consumption_time: bytes | None = self.redis.get(
-            self.first_consumption_time_key
-        )
-        last_refill_time = (
-            None
-            if last_refill_time is None
-            else float(last_refill_time.decode("utf-8"))
+        self.lua_token_take = self.redis.register_script(
+            cls.LUA_TAKE_TOKEN_SCRIPT
         )
-        first_consumption_time = (
-            None
-            if first_consumption_time is None
-            else float(first_consumption_time.decode("utf-8"))
-        )
-        c_time = time.time()
-        # Bucket initialization or enough time since first tokens were consumed
-        # or since last refill
-        if (
-            last_refill_time is None
-            or (
-                first_consumption_time is None
-                and c_time - last_refill_time > self.refill_period
-            )
-            or (
-                first_consumption_time is not None
-                and first_consumption_time
-                and c_time - first_consumption_time > self.refill_period
-            )
-        ):
-            logger.info(
-                f"Refilled {self.max_tokens} tokens in bucket {self.bucket_name}"
-            )
-            self.lua_refill_token(
-                keys=[
-                    self.token_count_key,
-                    self.last_refill_time_key,
-                    self.first_consumption_time_key,
-                ],
-                args=[self.max_tokens, c_time],
-                client=self.redis,
-            )
 
-    def consume(self, token_number: int, retry=0) -> int:
+    def consume(self, token_number: int) -> int:
         """
         Consume the minimum of the given number of token and the number of
         available tokens.
         """
-        self._refill()
         tokens_consumed = int(
-            self.lua_token_consume(
-                keys=[
-                    self.token_count_key,
-                    self.last_refill_time_key,
-                    self.first_consumption_time_key,
-                ],
-                args=[token_number, time.time()],
+            self.lua_token_take(
+                keys=[self.state_key],
+                args=[self.max_tokens, self.refill_period, token_number],
                 client=self.redis,
             )
         )
+        api_metrics.record_tokens(
+            self.bucket_name, tokens_consumed, token_number - tokens_consumed
+        )
         logger.info(
             f"Consumed {tokens_consumed} tokens from bucket {self.bucket_name}."
         )
         return tokens_consumed
 
-    def consume_for_df(self, df: pd.DataFrame) -> tuple[pd.DataFrame, bool]:
+    def consume_for_df(
+        self, df: pd.DataFrame, rows_per_token: int = 1
+    ) -> tuple[pd.DataFrame, bool]:
         """
-        Try to consume 1 token of the bucket per row of the given dataframe.
+        Try to consume 1 token of the bucket per row of the given dataframe,
+        or per group of `rows_per_token` rows when the rows are queried
+        by batches.
         Return the truncated dataframe for wich a token was consumed.
         """
-        tokens_number = len(df)
+        tokens_number = math.ceil(len(df) / rows_per_token)
         if tokens_number == 0:
             return df, False
 
@@ -186,7 +130,7 @@ class TokenBucket:
         elif tokens_consumed == 0:
             return pd.DataFrame(), True
         else:
-            return df.iloc[0:tokens_consumed].copy(), True
+            return df.iloc[0 : tokens_consumed * rows_per_token].copy(), True
 
 
 # https://ror.readme.io/v2/docs/rest-api 2000 requests / 5 minutes
@@ -195,6 +139,8 @@ ROR_TOKEN_BUCKET = TokenBucket(REDIS_CLIENT, "ror", 2000, 5 * 60)
 # We translate this to 2000 records per minute as a raw approximation.
 WIKIDATA_TOKEN_BUCKET = TokenBucket(REDIS_CLIENT, "wikidata", 2000, 60)
 # https://en.wikipedia.org/api/rest_v1/#/ The rate limit is 200 requests/s
+# A token is consumed per request, ie. per page summary or per batch of
+# extracts of the action API.
 WIKIPEDIA_TOKEN_BUCKET = TokenBucket(REDIS_CLIENT, "wikipedia", 200, 5)
 # Since begginning of 2026, Wikimedia Commons API set undocumented new rate limits.
 # So we set a very conservative limit here, and don't allow parralel requests.
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import re
 from typing import Any, Iterable, Sequence
 
@@ -13,6 +15,21 @@ def clean_null_values(df: pd.DataFrame):
     df.replace(to_replace=[np.nan, pd.NA, pd.NaT], value=None, inplace=True)
 
 
+def canonical_json_hash(value: Any) -> str:
+    """
+    Return the SHA-256 hex digest of the canonical JSON serialization of
+    the given value (sorted keys, no whitespace).
+    """
+    serialized = json.dumps(
+        value,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
 def chunk_df(df: pd.DataFrame, size: int):
     """
     Yield slices of the given dataframe of the specified size.
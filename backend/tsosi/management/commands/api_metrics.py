@@ -0,0 +1,22 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandParser
+from tsosi.data.api_metrics import metrics_summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarize the usage of the rate limiters and of the external APIs "
+        "over the last hours."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=24,
+            help="Number of hours to summarize, 24 by default.",
+        )
+
+    def handle(self, *args, **options):
+        print(json.dumps(metrics_summary(options["hours"]), indent=2))
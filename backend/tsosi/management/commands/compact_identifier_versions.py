@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandParser
+from tsosi.app_settings import app_settings
+from tsosi.data.pid_registry.versions import compact_identifier_versions
+
+
+class Command(BaseCommand):
+    help = (
+        "Reduce the stored ROR identifier versions to the fields that we use. "
+        "The dropped fields are permanently lost."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--no-input",
+            action="store_true",
+            help="If passed, do not ask for confirmation.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["no_input"]:
+            answer = input(
+                "The raw ROR records stored in the identifier versions will "
+                "be permanently reduced. Continue? [y/N] "
+            )
+            if answer.lower() != "y":
+                self.stdout.write("Aborted.")
+                return
+        compacted = compact_identifier_versions()
+        self.stdout.write(
+            self.style.SUCCESS(f"{compacted} identifier versions compacted.")
+        )
+        if app_settings.IDENTIFIER_VERSION_STORAGE != "compact":
+            self.stdout.write(
+                self.style.WARNING(
+                    "The new versions are still stored in full, set "
+                    'TSOSI_IDENTIFIER_VERSION_STORAGE = "compact" to store '
+                    "them compacted."
+                )
+            )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandParser
+from tsosi.data.pid_registry.ror_dump import import_ror_dump
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the given ROR data dump (zip archive or JSON file) in the "
+        "local copy of the ROR registry."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "file_path",
+            type=str,
+            help="ROR data dump full path",
+        )
+
+    def handle(self, *args, **options):
+        created, updated, deleted = import_ror_dump(options["file_path"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"ROR dump imported: {created} records created, "
+                f"{updated} updated and {deleted} deleted."
+            )
+        )
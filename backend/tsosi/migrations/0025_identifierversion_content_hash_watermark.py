@@ -0,0 +1,78 @@
+# Generated by Django 6.0.3 on 2026-10-18 09:12
+
+import hashlib
+import json
+
+import django.utils.timezone
+from django.db import migrations, models
+
+HASH_BATCH_SIZE = 500
+
+
+def _content_hash(value: dict | str) -> str:
+    """
+    Hash of the canonical JSON of the stored value, see `canonical_json_hash`.
+    """
+    serialized = json.dumps(
+        value,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def compute_content_hashes(apps, schema_editor):
+    """
+    Populate the content hash of the existing identifier versions.
+    """
+    IdentifierVersion = apps.get_model("tsosi", "IdentifierVersion")
+    queryset = IdentifierVersion.objects.only("id", "value")
+    batch = []
+    for version in queryset.iterator(chunk_size=HASH_BATCH_SIZE):
+        version.content_hash = _content_hash(version.value)
+        batch.append(version)
+        if len(batch) >= HASH_BATCH_SIZE:
+            IdentifierVersion.objects.bulk_update(batch, ["content_hash"])
+            batch = []
+    if batch:
+        IdentifierVersion.objects.bulk_update(batch, ["content_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tsosi", "0024_supporttype_transfer_support_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="identifierversion",
+            name="content_hash",
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name="Watermark",
+            fields=[
+                (
+                    "date_created",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("date_last_updated", models.DateTimeField(auto_now=True)),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=64, primary_key=True, serialize=False
+                    ),
+                ),
+                ("value", models.BigIntegerField()),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.RunPython(
+            compute_content_hashes, reverse_code=migrations.RunPython.noop
+        ),
+    ]
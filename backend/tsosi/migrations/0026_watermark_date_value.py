@@ -0,0 +1,23 @@
+# Generated by Django 6.0.3 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tsosi", "0025_identifierversion_content_hash_watermark"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="watermark",
+            name="date_value",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name="watermark",
+            name="value",
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 6.0.3 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tsosi", "0026_watermark_date_value"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnalyticRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.IntegerField()),
+                (
+                    "dimension",
+                    models.CharField(
+                        choices=[
+                            ("emitter", "The emitter ID."),
+                            ("agent", "The agent ID."),
+                            (
+                                "month",
+                                "The month number, for dates precise enough.",
+                            ),
+                            ("emitter_type", "The emitter type."),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ("key", models.CharField(max_length=64)),
+                ("data", models.JSONField()),
+                (
+                    "recipient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="tsosi.entity",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("recipient", "year", "dimension", "key"),
+                        name="unique_analytic_rollup_bucket",
+                    ),
+                    models.CheckConstraint(
+                        condition=models.Q(
+                            (
+                                "dimension__in",
+                                ["emitter", "agent", "month", "emitter_type"],
+                            )
+                        ),
+                        name="analytic_rollup_valid_dimension_choices",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.3 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tsosi", "0027_analyticrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transfer",
+            name="date_amounts_clc",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
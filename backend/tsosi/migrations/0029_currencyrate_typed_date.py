@@ -0,0 +1,108 @@
+# Generated by Django 6.0.3 on 2026-10-18 13:20
+
+import tsosi.models.date
+from django.db import migrations, models
+from django.db.models import Count, Max
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast
+
+
+def populate_typed_dates(apps, schema_editor):
+    """
+    Populate the typed date & precision columns from the JSON date and
+    drop the duplicated rates, keeping the most recent one.
+    """
+    CurrencyRate = apps.get_model("tsosi", "CurrencyRate")
+    CurrencyRate.objects.update(
+        date=Cast(KT("date_json__value"), output_field=models.DateField()),
+        precision=KT("date_json__precision"),
+    )
+    duplicates = (
+        CurrencyRate.objects.values("currency_id", "precision", "date")
+        .annotate(count=Count("id"), max_id=Max("id"))
+        .filter(count__gt=1)
+    )
+    for d in duplicates:
+        CurrencyRate.objects.filter(
+            currency_id=d["currency_id"],
+            precision=d["precision"],
+            date=d["date"],
+            id__lt=d["max_id"],
+        ).delete()
+
+
+def populate_json_dates(apps, schema_editor):
+    CurrencyRate = apps.get_model("tsosi", "CurrencyRate")
+    batch = []
+    for rate in CurrencyRate.objects.iterator(chunk_size=1000):
+        rate.date_json = {
+            "value": rate.date.strftime("%Y-%m-%d"),
+            "precision": rate.precision,
+        }
+        batch.append(rate)
+        if len(batch) >= 1000:
+            CurrencyRate.objects.bulk_update(batch, ["date_json"])
+            batch = []
+    if batch:
+        CurrencyRate.objects.bulk_update(batch, ["date_json"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tsosi", "0028_transfer_date_amounts_clc"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="currencyrate",
+            old_name="date",
+            new_name="date_json",
+        ),
+        migrations.AlterField(
+            model_name="currencyrate",
+            name="date_json",
+            field=tsosi.models.date.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="currencyrate",
+            name="date",
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="currencyrate",
+            name="precision",
+            field=models.CharField(
+                choices=[("year", "Year"), ("month", "Month"), ("day", "Day")],
+                max_length=8,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(
+            populate_typed_dates, reverse_code=populate_json_dates
+        ),
+        migrations.RemoveField(
+            model_name="currencyrate",
+            name="date_json",
+        ),
+        migrations.AlterField(
+            model_name="currencyrate",
+            name="date",
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name="currencyrate",
+            name="precision",
+            field=models.CharField(
+                choices=[("year", "Year"), ("month", "Month"), ("day", "Day")],
+                max_length=8,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="currencyrate",
+            constraint=models.UniqueConstraint(
+                fields=("precision", "date", "currency"),
+                name="unique_currency_rate_per_precision_and_date",
+            ),
+        ),
+    ]
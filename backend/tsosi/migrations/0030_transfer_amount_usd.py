@@ -0,0 +1,30 @@
+# Generated by Django 6.0.3 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+def reset_amounts_computation(apps, schema_editor):
+    """
+    Flag the converted amounts as never computed so that the next
+    computation populates the USD amount of every transfer.
+    """
+    Transfer = apps.get_model("tsosi", "Transfer")
+    Transfer.objects.filter(amount__isnull=False).update(date_amounts_clc=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tsosi", "0029_currencyrate_typed_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transfer",
+            name="amount_usd",
+            field=models.FloatField(null=True),
+        ),
+        migrations.RunPython(
+            reset_amounts_computation, reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.3 on 2026-10-18 15:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tsosi", "0030_transfer_amount_usd"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RorDumpRecord",
+            fields=[
+                (
+                    "date_created",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("date_last_updated", models.DateTimeField(auto_now=True)),
+                (
+                    "id",
+                    models.CharField(
+                        max_length=16, primary_key=True, serialize=False
+                    ),
+                ),
+                ("record", models.JSONField()),
+                ("content_hash", models.CharField(max_length=64)),
+                ("dump_version", models.CharField(max_length=128)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
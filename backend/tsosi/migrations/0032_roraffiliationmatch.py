@@ -0,0 +1,48 @@
+# Generated by Django 6.0.3 on 2026-10-18 16:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tsosi", "0031_rordumprecord"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RorAffiliationMatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("date_last_updated", models.DateTimeField(auto_now=True)),
+                ("name", models.CharField(max_length=512)),
+                (
+                    "country",
+                    models.CharField(blank=True, default="", max_length=2),
+                ),
+                ("result", models.JSONField()),
+                ("source", models.CharField(max_length=16)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("name", "country"),
+                        name="unique_ror_affiliation_match_per_name_and_country",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.3 on 2026-10-18 16:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tsosi", "0032_roraffiliationmatch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HttpValidator",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("date_last_updated", models.DateTimeField(auto_now=True)),
+                ("url", models.CharField(max_length=1024, unique=True)),
+                ("etag", models.CharField(max_length=512, null=True)),
+                ("last_modified", models.CharField(max_length=64, null=True)),
+                ("content_length", models.BigIntegerField(null=True)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
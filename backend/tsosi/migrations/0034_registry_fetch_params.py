@@ -0,0 +1,18 @@
+# Generated by Django 6.0.3 on 2026-10-18 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tsosi", "0033_httpvalidator"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="registry",
+            name="fetch_params",
+            field=models.JSONField(default=dict),
+        ),
+    ]
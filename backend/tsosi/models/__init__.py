@@ -1,4 +1,5 @@
-from .analytics import Analytic
+from .analytics import Analytic, AnalyticRollup
+from .api_request import HttpValidator
 from .currency import Currency, CurrencyRate
 from .entity import (
     Entity,
@@ -14,8 +15,10 @@ from .identifier import (
     IdentifierVersion,
     Registry,
 )
+from .registry import RorAffiliationMatch, RorDumpRecord
 from .source import DataLoadSource, DataSource
 from .transfer import Transfer
+from .watermark import Watermark
 
 
 def empty_db(full=False):
@@ -29,12 +32,17 @@ def empty_db(full=False):
     Transfer.objects.all().delete()
     DataLoadSource.objects.all().delete()
     Analytic.objects.all().delete()
+    AnalyticRollup.objects.all().delete()
     if full:
         DataSource.objects.all().delete()
         Identifier.objects.all().delete()
         Entity.objects.all().delete()
         Registry.objects.all().delete()
+        RorDumpRecord.objects.all().delete()
+        RorAffiliationMatch.objects.all().delete()
+        HttpValidator.objects.all().delete()
         Currency.objects.all().delete()
+        Watermark.objects.all().delete()
     else:
         Entity.objects.all().update(is_active=False)
     print("Database emptied.")
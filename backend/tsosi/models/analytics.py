@@ -18,3 +18,45 @@ class Analytic(models.Model):
     )
     year = models.IntegerField()
     data = models.JSONField()
+
+
+ANALYTIC_DIMENSION_EMITTER = "emitter"
+ANALYTIC_DIMENSION_AGENT = "agent"
+ANALYTIC_DIMENSION_MONTH = "month"
+ANALYTIC_DIMENSION_EMITTER_TYPE = "emitter_type"
+ANALYTIC_DIMENSION_CHOICES = {
+    ANALYTIC_DIMENSION_EMITTER: "The emitter ID.",
+    ANALYTIC_DIMENSION_AGENT: "The agent ID.",
+    ANALYTIC_DIMENSION_MONTH: "The month number, for dates precise enough.",
+    ANALYTIC_DIMENSION_EMITTER_TYPE: "The emitter type.",
+}
+
+
+class AnalyticRollup(models.Model):
+    """
+    Stores regularly computed aggregated data per recipient, year and value
+    of an additional dimension (emitter, agent, month or emitter type).
+    """
+
+    recipient = models.ForeignKey(Entity, on_delete=models.CASCADE)
+    year = models.IntegerField()
+    dimension = models.CharField(
+        choices=ANALYTIC_DIMENSION_CHOICES, max_length=32
+    )
+    # The value of the dimension for this bucket
+    key = models.CharField(max_length=64)
+    data = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipient", "year", "dimension", "key"],
+                name="unique_analytic_rollup_bucket",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(
+                    dimension__in=list(ANALYTIC_DIMENSION_CHOICES.keys())
+                ),
+                name="analytic_rollup_valid_dimension_choices",
+            ),
+        ]
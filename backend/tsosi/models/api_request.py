@@ -1,5 +1,7 @@
 from django.db import models
 
+from .utils import TimestampedModel
+
 
 class ApiRequest(models.Model):
     """
@@ -26,3 +28,15 @@ class ApiRequest(models.Model):
                 name="%(app_label)s_%(class)s_request_error_msg_when_failed",
             )
         ]
+
+
+class HttpValidator(TimestampedModel):
+    """
+    Validators of the last fetched version of an HTTP resource, used to
+    perform conditional requests, see `tsosi.data.pid_registry.http_cache`.
+    """
+
+    url = models.CharField(max_length=1024, unique=True)
+    etag = models.CharField(max_length=512, null=True)
+    last_modified = models.CharField(max_length=64, null=True)
+    content_length = models.BigIntegerField(null=True)
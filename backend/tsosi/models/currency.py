@@ -1,7 +1,7 @@
 from django.core.validators import MaxLengthValidator, MinLengthValidator
 from django.db import models
 
-from .date import DateField
+from .date import DATE_PRECISION_CHOICES
 from .utils import TimestampedModel
 
 
@@ -15,9 +15,22 @@ class Currency(TimestampedModel):
 
 
 class CurrencyRate(models.Model):
-    """ """
+    """
+    The rate of a currency against USD.
+    Rates with the `month` and `year` precisions are averages of the daily
+    rates, dated from the first day of the period.
+    """
 
     id = models.BigAutoField(primary_key=True)
     currency = models.ForeignKey(Currency, on_delete=models.CASCADE)
     value = models.FloatField()
-    date = DateField()
+    date = models.DateField()
+    precision = models.CharField(choices=DATE_PRECISION_CHOICES, max_length=8)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["precision", "date", "currency"],
+                name="unique_currency_rate_per_precision_and_date",
+            )
+        ]
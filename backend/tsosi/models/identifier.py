@@ -1,5 +1,6 @@
 from django.db import models
 from django.utils import timezone
+from tsosi.data.utils import canonical_json_hash
 
 from .api_request import ApiRequest
 from .entity import Entity
@@ -27,6 +28,8 @@ class IdentifierVersion(TimestampedModel):
     id = models.BigAutoField(primary_key=True)
     identifier = models.ForeignKey("Identifier", on_delete=models.CASCADE)
     value = models.JSONField()
+    # Hash of the canonical JSON of the value, see `version_content_hash`
+    content_hash = models.CharField(max_length=64, null=True)
     date_start = models.DateTimeField(default=timezone.now)
     # null date_end corresponds to current version
     date_end = models.DateTimeField(null=True)
@@ -78,6 +81,8 @@ class Identifier(TimestampedModel):
         """
         Create a new version of the identifier with the given value if the value is different from the current version.
         The current version is ended and the new version becomes the current one.
+
+        :param value:   The value of the version, as stored.
         """
         now = timezone.now()
         if self.current_version:
@@ -86,7 +91,11 @@ class Identifier(TimestampedModel):
             self.current_version.date_end = now
             self.current_version.save()
         new_version = IdentifierVersion.objects.create(
-            identifier=self, value=value, date_last_fetched=now, date_start=now
+            identifier=self,
+            value=value,
+            content_hash=canonical_json_hash(value),
+            date_last_fetched=now,
+            date_start=now,
         )
         self.current_version = new_version
         self.save()
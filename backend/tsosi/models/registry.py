@@ -14,3 +14,60 @@ class Registry(TimestampedModel):
     website = models.URLField(max_length=256)
     link_template = models.CharField(max_length=256)
     record_regex = models.CharField(max_length=128, null=True)
+    # Parameters of the adaptive chunked fetching of the registry records,
+    # see `tsosi.data.pid_registry.common.AdaptiveBatcher`
+    fetch_params = models.JSONField(default=dict)
+
+    @classmethod
+    def get_fetch_params(cls, registry_id: str) -> dict:
+        """
+        Return the persisted fetch parameters of the given registry.
+        """
+        params = (
+            cls.objects.filter(id=registry_id)
+            .values_list("fetch_params", flat=True)
+            .first()
+        )
+        return params or {}
+
+    @classmethod
+    def set_fetch_params(cls, registry_id: str, params: dict):
+        cls.objects.filter(id=registry_id).update(fetch_params=params)
+
+
+class RorDumpRecord(TimestampedModel):
+    """
+    Record of the local copy of the ROR data dump, see
+    `tsosi.data.pid_registry.ror_dump`.
+    """
+
+    id = models.CharField(primary_key=True, max_length=16)
+    # The record as found in the dump
+    record = models.JSONField()
+    # Hash of the stored record, see `import_ror_dump`
+    content_hash = models.CharField(max_length=64)
+    # Name of the dump the record content was imported from
+    dump_version = models.CharField(max_length=128)
+
+
+class RorAffiliationMatch(TimestampedModel):
+    """
+    Cached result of the matching of an organization name to the ROR,
+    see `tsosi.data.pid_registry.ror_affiliation`.
+    """
+
+    name = models.CharField(max_length=512)
+    # The country ISO alpha-2 code, empty when unknown
+    country = models.CharField(max_length=2, default="", blank=True)
+    # The fields of the `RorMatchingResult`
+    result = models.JSONField()
+    # Whether the result comes from the local index or the ROR API
+    source = models.CharField(max_length=16)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name", "country"],
+                name="unique_ror_affiliation_match_per_name_and_country",
+            )
+        ]
@@ -115,7 +115,15 @@ class Transfer(TimestampedModel):
         SupportType, on_delete=models.SET_NULL, null=True
     )
     original_id = models.CharField(max_length=256)
+    # The amount in every currency, only stored when the
+    # `TRANSFER_AMOUNTS_CLC` setting is enabled.
     amounts_clc = models.JSONField(null=True)
+    # The unrounded USD amount, from which the amounts in other currencies
+    # are converted on read.
+    amount_usd = models.FloatField(null=True)
+    # Date of the last computation of the converted amounts, null when the
+    # amounts were never computed.
+    date_amounts_clc = models.DateTimeField(null=True)
     hide_amount = models.BooleanField(default=False)
     original_amount_field = models.CharField(max_length=128)
     scoss = models.BooleanField(default=False)
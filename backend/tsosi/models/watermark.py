@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from django.db import models
+
+from .utils import TimestampedModel
+
+
+class Watermark(TimestampedModel):
+    """
+    Progress marker of an incremental task, ex: the ID of the last
+    record processed by the task or the date of its last run.
+    """
+
+    name = models.CharField(primary_key=True, max_length=64)
+    value = models.BigIntegerField(null=True)
+    date_value = models.DateTimeField(null=True)
+
+    @classmethod
+    def get_value(cls, name: str) -> int | None:
+        """
+        Return the value of the given watermark, `None` if it was never set.
+        """
+        return (
+            cls.objects.filter(name=name)
+            .values_list("value", flat=True)
+            .first()
+        )
+
+    @classmethod
+    def set_value(cls, name: str, value: int):
+        cls.objects.update_or_create(name=name, defaults={"value": value})
+
+    @classmethod
+    def get_date_value(cls, name: str) -> datetime | None:
+        """
+        Return the date of the given watermark, `None` if it was never set.
+        """
+        return (
+            cls.objects.filter(name=name)
+            .values_list("date_value", flat=True)
+            .first()
+        )
+
+    @classmethod
+    def set_date_value(cls, name: str, date_value: datetime):
+        cls.objects.update_or_create(
+            name=name, defaults={"date_value": date_value}
+        )
@@ -1,4 +1,5 @@
 import logging
+from functools import partial
 from pathlib import Path
 from typing import Callable
 
@@ -10,7 +11,7 @@ from celery.utils.log import get_task_logger
 from redis.lock import Lock
 
 from .app_settings import app_settings
-from .data import data_updates, enrichment, ingestion
+from .data import api_metrics, data_updates, enrichment, ingestion
 from .data.currencies import currency_rates
 from .data.task_result import TaskResult
 from .models.static_data import REGISTRY_ROR, REGISTRY_WIKIDATA
@@ -50,6 +51,10 @@ class TsosiTask(DjangoTask):
                 kwargs=kwargs,
             )
 
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        super().after_return(status, retval, task_id, args, kwargs, einfo)
+        api_metrics.flush()
+
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         """
         Manually add a log entry to the tsosi data logger when a task fails.
@@ -221,6 +226,8 @@ def update_clc_fields_daily():
     """
     tasks: list[Callable] = [
         enrichment.update_transfer_status_clc,
+        # Safety net for the incremental hourly computation
+        partial(enrichment.compute_analytics, full=True),
     ]
     _ = [t() for t in tasks]
 
@@ -2,6 +2,7 @@ from django.urls import include, path
 from tsosi.api.router import OptionalSlashRouter
 from tsosi.api.viewsets import (
     AnalyticViewSet,
+    ApiMetricsViewSet,
     CurrencyViewSet,
     EntityViewSet,
     TransferViewSet,
@@ -27,8 +28,12 @@ router.register(r"transfers", TransferViewSet, basename="transfer")
 router.register(r"currencies", CurrencyViewSet, basename="currency")
 ### Produced routes:
 # analytics/                   analytics-list
+# analytics/rollups/          analytics-rollups
 # analytics/(?P<pk>[^/.]+)/    analytics-detail useless
 router.register(r"analytics", AnalyticViewSet, basename="analytic")
+### Produced routes:
+# api-metrics/                 api-metrics-list, restricted to admin users
+router.register(r"api-metrics", ApiMetricsViewSet, basename="api-metrics")
 
 # print("\n\n")
 # print(router.urls)